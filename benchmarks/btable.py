@@ -0,0 +1,119 @@
+"""Compare reading and loading b-tables (.bval/.bvec) with the list-based reader and per-row dicts they replaced.
+
+    python benchmarks/btable.py [--n-files N] [--n-volumes V]
+
+Writes n_files pairs of .bval/.bvec files to a temporary directory, then times
+reading them and loading them into a fresh sqlite database, either as bvalbvec
+rows or packed into diffusion.btable.
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from collections import abc
+from pathlib import Path
+
+import polars as pl
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+from bidsql import mapping, models, utils
+
+
+def read_bvalbvec_reference(dwi: Path) -> pl.DataFrame | None:
+    """utils.read_bvalbvec as it was"""
+    stem = utils.remove_niigz(dwi)
+    bval_path = stem.with_suffix(".bval")
+    bvec_path = stem.with_suffix(".bvec")
+    if not (bval_path.exists() and bvec_path.exists()):
+        return None
+
+    bvals = [float(bval) for bval in bval_path.read_text().split()]
+    bvecs = [[float(v) for v in line.split()] for line in bvec_path.read_text().splitlines()]
+    return pl.DataFrame({"b": bvals, "x": bvecs[0], "y": bvecs[1], "z": bvecs[2]}).with_row_index(name="tr")
+
+
+def make_files(root: Path, n_files: int, n_volumes: int) -> list[Path]:
+    rng = random.Random(0)
+    dwis = []
+    for i in range(n_files):
+        dwi = root / f"sub-{10000 + i}_ses-V1_dwi.nii.gz"
+        bvals = [0 if v % 10 == 0 else rng.choice((1000, 2000, 3000)) for v in range(n_volumes)]
+        bvecs = [[0.0 if b == 0 else rng.uniform(-1, 1) for b in bvals] for _ in range(3)]
+        dwi.with_name(dwi.name.replace(".nii.gz", ".bval")).write_text(" ".join(map(str, bvals)) + "\n")
+        dwi.with_name(dwi.name.replace(".nii.gz", ".bvec")).write_text(
+            "\n".join(" ".join(f"{v:.6f}" for v in row) for row in bvecs) + "\n"
+        )
+        dwis.append(dwi)
+    return dwis
+
+
+def load_rows_reference(session: orm.Session, btables: dict[str, pl.DataFrame]) -> None:
+    for path, btable in btables.items():
+        rows = [{"diffusion_path": path, **row} for row in btable.iter_rows(named=True)]
+        session.execute(sa.insert(models.B.__table__), rows)
+
+
+def load_rows(session: orm.Session, btables: dict[str, pl.DataFrame]) -> None:
+    loader = mapping.Loader(session, ingest="bulk")
+    for path, btable in btables.items():
+        loader.add_frame(models.B, models.B.frame_from_btable(path, btable))
+    loader.flush()
+
+
+def load_packed(session: orm.Session, btables: dict[str, pl.DataFrame]) -> None:
+    table = models.Diffusion.__table__
+    session.execute(
+        sa.insert(table), [{"file_path": path, "btable": utils.pack_btable(btable)} for path, btable in btables.items()]
+    )
+
+
+def time_load(
+    load: abc.Callable[[orm.Session, dict[str, pl.DataFrame]], None], btables: dict[str, pl.DataFrame]
+) -> tuple[float, int]:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Path(tmp) / "btable.sqlite"
+        engine = sa.create_engine(f"sqlite:///{db}")
+        # no foreign keys are enforced, so only the two tables are needed
+        models.Base.metadata.create_all(engine, tables=[models.Diffusion.__table__, models.B.__table__])
+        start = time.perf_counter()
+        with orm.Session(engine) as session:
+            load(session, btables)
+            session.commit()
+        elapsed = time.perf_counter() - start
+        engine.dispose()
+        return elapsed, db.stat().st_size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-files", type=int, default=2_000)
+    parser.add_argument("--n-volumes", type=int, default=150)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dwis = make_files(Path(tmp), args.n_files, args.n_volumes)
+        for name, read in (("reference", read_bvalbvec_reference), ("read_bvalbvec", utils.read_bvalbvec)):
+            start = time.perf_counter()
+            for dwi in dwis:
+                read(dwi)
+            elapsed = time.perf_counter() - start
+            print(f"read  {name:<16}{elapsed:>8.2f} s{len(dwis) / elapsed:>10,.0f} files/s")
+
+        btables = {str(dwi): utils.read_bvalbvec(dwi) for dwi in dwis}
+        for dwi in dwis:
+            if not utils.read_bvalbvec(dwi).equals(read_bvalbvec_reference(dwi)):  # type: ignore[union-attr]
+                msg = f"read_bvalbvec disagrees with the reference on {dwi}"
+                raise AssertionError(msg)
+            if not utils.unpack_btable(utils.pack_btable(btables[str(dwi)])).equals(btables[str(dwi)]):
+                msg = f"unpack_btable does not undo pack_btable on {dwi}"
+                raise AssertionError(msg)
+
+    for name, load in (("reference", load_rows_reference), ("add_frame", load_rows), ("packed", load_packed)):
+        elapsed, size = time_load(load, btables)  # type: ignore[arg-type]
+        print(f"load  {name:<16}{elapsed:>8.2f} s{len(btables) / elapsed:>10,.0f} files/s{size / 2**20:>8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Compare mapping.Dispatcher with trying each pattern in turn (mapping.find_parser).
+
+    python benchmarks/dispatch.py [--n-files N] [--repeat R]
+
+Paths are synthetic, but shaped like those in the a2cps bids and derivative trees.
+"""
+
+import argparse
+import itertools
+import timeit
+from pathlib import Path
+
+from bidsql import mapping
+from bidsql.cli import bids, eddyqc, fmriprep, freesurfer, mriqc, qsiprep, synthstrip
+
+NAMES = (
+    "dataset_description.json",
+    "participants.tsv",
+    "sub-{sub}_sessions.tsv",
+    "ses-V1/sub-{sub}_ses-V1_scans.tsv",
+    "ses-V1/func/sub-{sub}_ses-V1_task-rest_run-1_bold.nii.gz",
+    "ses-V1/func/sub-{sub}_ses-V1_task-rest_run-1_bold.json",
+    "ses-V1/func/sub-{sub}_ses-V1_task-rest_run-1_events.tsv",
+    "ses-V1/dwi/sub-{sub}_ses-V1_dwi.nii.gz",
+    "ses-V1/dwi/sub-{sub}_ses-V1_dwi.bval",
+    "ses-V1/dwi/sub-{sub}_ses-V1_desc-ImageQC_dwi.csv",
+    "ses-V1/anat/sub-{sub}_ses-V1_T1w.nii.gz",
+    "ses-V1/anat/sub-{sub}_ses-V1_from-T1w_to-MNI_mode-image_xfm.h5",
+    "ses-V1/fmap/sub-{sub}_ses-V1_dir-PA_epi.nii.gz",
+    "ses-V1/fmap/sub-{sub}_ses-V1_dir-PA_epi.json",
+    "stats/aseg.stats",
+    "qc.json",
+    "logs/job.err",
+)
+
+MAPS = {
+    "bids": bids.maps,
+    "eddyqc": eddyqc.maps,
+    "fmriprep": fmriprep.maps,
+    "freesurfer": freesurfer.maps,
+    "mriqc": mriqc.maps,
+    "qsiprep": qsiprep.maps,
+    "synthstrip": synthstrip.maps,
+}
+
+
+def make_paths(n_files: int) -> list[str]:
+    root = Path("/corral-secure/projects/A2CPS/products/mris/all_sites/bids/UI10001V1")
+    names = itertools.cycle(NAMES)
+    return [str(root / f"sub-{10000 + i // len(NAMES)}" / next(names).format(sub=10000 + i)) for i in range(n_files)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-files", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    paths = make_paths(args.n_files)
+    print(f"{'maps':<12}{'patterns':>9}{'loop (us/file)':>16}{'dispatcher (us/file)':>22}{'speedup':>9}")
+    for name, maps in MAPS.items():
+        dispatcher = mapping.Dispatcher(maps)
+        for path in paths:
+            if dispatcher(path) is not mapping.find_parser(Path(path), maps):
+                msg = f"{name}: dispatcher and find_parser disagree on {path}"
+                raise AssertionError(msg)
+
+        # both are given the same path strings; the Mapper would otherwise also pay for the Path
+        loop = min(
+            timeit.repeat(
+                lambda maps=maps: [mapping.find_parser(path, maps) for path in paths],  # type: ignore[arg-type]
+                number=1,
+                repeat=args.repeat,
+            )
+        )
+        combined = min(
+            timeit.repeat(
+                lambda dispatcher=dispatcher: [dispatcher(path) for path in paths],
+                number=1,
+                repeat=args.repeat,
+            )
+        )
+        print(
+            f"{name:<12}{len(maps):>9}{1e6 * loop / len(paths):>16.2f}"
+            f"{1e6 * combined / len(paths):>22.2f}{loop / combined:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Compare utils.parse_entities with the parser it replaced, on synthetic A2CPS file names.
+
+    python benchmarks/entities.py [--n-files N]
+
+The paths mimic a bids tree: a few dozen file names per session directory, with
+sub-/ses-/task-/run-/acq-/dir- entities and a mix of compound extensions.
+"""
+
+import argparse
+import itertools
+import time
+from pathlib import Path
+
+from bidsql import utils
+
+NAMES = (
+    ("anat", "sub-{sub}_ses-{ses}_T1w.nii.gz"),
+    ("anat", "sub-{sub}_ses-{ses}_T1w.json"),
+    ("anat", "sub-{sub}_ses-{ses}_from-T1w_to-MNI152NLin2009cAsym_mode-image_xfm.h5"),
+    ("func", "sub-{sub}_ses-{ses}_task-rest_run-{run}_bold.nii.gz"),
+    ("func", "sub-{sub}_ses-{ses}_task-rest_run-{run}_bold.json"),
+    ("func", "sub-{sub}_ses-{ses}_task-cuff_run-{run}_events.tsv"),
+    ("func", "sub-{sub}_ses-{ses}_task-rest_run-{run}_space-fsLR_den-91k_bold.dtseries.nii"),
+    ("dwi", "sub-{sub}_ses-{ses}_dwi.nii.gz"),
+    ("dwi", "sub-{sub}_ses-{ses}_dwi.bval"),
+    ("dwi", "sub-{sub}_ses-{ses}_dwi.bvec"),
+    ("fmap", "sub-{sub}_ses-{ses}_acq-dwi_dir-PA_epi.nii.gz"),
+    ("fmap", "sub-{sub}_ses-{ses}_acq-fmri_dir-AP_epi.json"),
+    ("figures", "sub-{sub}_ses-{ses}_desc-carpetplot_bold.svg"),
+    ("surf", "sub-{sub}_ses-{ses}_hemi-L_midthickness.surf.gii"),
+    ("", "sub-{sub}_ses-{ses}_scans.tsv"),
+    ("", "README"),
+)
+
+
+def parse_entities_reference(src: Path) -> dict[str, str]:
+    """parse_entities as it was, built from parse_extension and parse_modality"""
+    if src.name.endswith(".nii.gz"):
+        extension = ".nii.gz"
+    elif src.name.endswith(".surf.gii"):
+        extension = ".surf.gii"
+    elif src.name.endswith(".dtseries.nii"):
+        extension = ".dtseries.nii"
+    else:
+        extension = src.suffix
+
+    if "xfm" in str(src):
+        modality = "xfm"
+    elif "/anat/" in str(src):
+        modality = "anat"
+    elif "/dwi/" in str(src):
+        modality = "dwi"
+    elif "/fmap/" in str(src):
+        modality = "fmap"
+    elif "/func/" in str(src):
+        modality = "func"
+    elif "/figures/" in str(src):
+        modality = "figures"
+    else:
+        modality = "file"
+
+    parts = src.name.split("_")
+    suffix = parts[-1].removesuffix(extension)
+    entities = {"suffix": suffix, "extension": extension, "modality": modality}
+    for part in parts[:-1]:
+        split = part.split("-")
+        if len(split) == 2:
+            entities.update({split[0]: split[1]})
+
+    return entities
+
+
+def make_paths(n_files: int) -> list[Path]:
+    root = Path("/corral-secure/projects/A2CPS/products/mris/all_sites/bids")
+    paths = []
+    for i in itertools.count():
+        sub, ses, run = 10000 + i // 4, "V1" if i % 2 else "V3", i % 4 + 1
+        for directory, name in NAMES:
+            paths.append(
+                root
+                / f"UI{sub}{ses}"
+                / f"sub-{sub}"
+                / f"ses-{ses}"
+                / directory
+                / name.format(sub=sub, ses=ses, run=run)
+            )
+            if len(paths) == n_files:
+                return paths
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-files", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    paths = make_paths(args.n_files)
+    for name, parse in (("reference", parse_entities_reference), ("parse_entities", utils.parse_entities)):
+        start = time.perf_counter()
+        for path in paths:
+            parse(path)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<16}{elapsed:>8.2f} s{len(paths) / elapsed:>12,.0f} files/s")
+
+    for path in paths:
+        if utils.parse_entities(path) != parse_entities_reference(path):
+            msg = f"parse_entities disagrees with the reference on {path}"
+            raise AssertionError(msg)
+
+
+if __name__ == "__main__":
+    main()
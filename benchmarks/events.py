@@ -0,0 +1,98 @@
+"""Compare loading events.tsv frames through mapping.Loader.add_frame with the per-row dicts it replaced.
+
+    python benchmarks/events.py [--n-files N] [--n-events M] [--repeat R]
+
+Each run loads n_files frames of n_events rows into a fresh sqlite database
+(a temporary file, so that the size of the table and its index can be reported).
+"""
+
+import argparse
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import polars as pl
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+from bidsql import mapping, models
+
+# the event table as it was, with a uuid for each row
+reference_metadata = sa.MetaData()
+reference_event = sa.Table(
+    "event",
+    reference_metadata,
+    sa.Column("onset", sa.Float, nullable=False),
+    sa.Column("duration", sa.Float, nullable=False),
+    sa.Column("extra", sa.JSON),
+    sa.Column("func_path", sa.String, primary_key=True),
+    sa.Column("id", sa.Uuid, primary_key=True),
+)
+
+
+def make_frames(n_files: int, n_events: int) -> dict[str, pl.DataFrame]:
+    frames = {}
+    for i in range(n_files):
+        path = f"/bids/sub-{10000 + i}/ses-V1/func/sub-{10000 + i}_ses-V1_task-cuff_run-1_bold.nii.gz"
+        frames[path] = pl.DataFrame(
+            {
+                "onset": [2.0 * j for j in range(n_events)],
+                "duration": [1.5] * n_events,
+                "trial_type": ["cuff" if j % 2 else "rest" for j in range(n_events)],
+                "response_time": [0.25 * (j % 7) for j in range(n_events)],
+            }
+        ).with_columns(pl.struct("trial_type", "response_time").alias("extra"))
+    return frames
+
+
+def load_reference(engine: sa.Engine, frames: dict[str, pl.DataFrame]) -> None:
+    reference_metadata.create_all(engine)
+    with orm.Session(engine) as session:
+        for path, events in frames.items():
+            rows = [{"func_path": path, "id": uuid.uuid4(), **event} for event in events.iter_rows(named=True)]
+            session.execute(sa.insert(reference_event), rows)
+        session.commit()
+
+
+def load_frames(engine: sa.Engine, frames: dict[str, pl.DataFrame]) -> None:
+    models.Event.__table__.create(engine)
+    with orm.Session(engine) as session:
+        loader = mapping.Loader(session, ingest="bulk")
+        for path, events in frames.items():
+            loader.add_frame(models.Event, models.Event.frame_from_events(path, events))
+        loader.flush()
+        session.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-files", type=int, default=1_000)
+    parser.add_argument("--n-events", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    frames = make_frames(args.n_files, args.n_events)
+    n_rows = args.n_files * args.n_events
+    print(f"{'loader':<12}{'s':>8}{'rows/s':>12}{'MiB':>8}")
+    for name, load in (("reference", load_reference), ("add_frame", load_frames)):
+        elapsed, size = [], 0
+        for _ in range(args.repeat):
+            with tempfile.TemporaryDirectory() as tmp:
+                db = Path(tmp) / "events.sqlite"
+                engine = sa.create_engine(f"sqlite:///{db}")
+                start = time.perf_counter()
+                load(engine, frames)
+                elapsed.append(time.perf_counter() - start)
+                with engine.connect() as connection:
+                    if connection.scalar(sa.text("SELECT count(*) FROM event")) != n_rows:
+                        msg = f"{name} did not load {n_rows} events"
+                        raise AssertionError(msg)
+                engine.dispose()
+                size = db.stat().st_size
+        best = min(elapsed)
+        print(f"{name:<12}{best:>8.2f}{n_rows / best:>12,.0f}{size / 2**20:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
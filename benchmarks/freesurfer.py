@@ -0,0 +1,149 @@
+"""Compare the FreeSurfer .stats parsers in a2cps.freesufer with the pandas-based ones they replaced.
+
+    python benchmarks/freesurfer.py [--n-subjects N]
+
+Writes a synthetic subjects/ tree (aseg, wmparc and the 12 aparc stats files of
+each subject, shaped like those of FreeSurfer 7) to a temporary directory.
+"""
+
+import argparse
+import random
+import re
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+from tree import N_ROWS, write_aparc, write_aseg
+
+from bidsql.a2cps import freesufer
+
+
+def make_subjects(root: Path, n_subjects: int) -> None:
+    rng = random.Random(0)
+    for i in range(n_subjects):
+        stats = root / f"sub-{10000 + i}_ses-V1" / "stats"
+        stats.mkdir(parents=True)
+        write_aseg(rng, stats / "aseg.stats", N_ROWS["aseg"], header=True)
+        write_aseg(rng, stats / "wmparc.stats", N_ROWS["wmparc"], header=False)
+        for hemi in ("lh", "rh"):
+            for parc in freesufer.APARC_PARCS:
+                write_aparc(rng, stats / f"{hemi}.{parc}.stats", N_ROWS[parc])
+
+
+# the parsers as they were (with sep=r"\s+", since pandas 3 no longer has delim_whitespace)
+def _get_int(line: str) -> int:
+    return int(re.findall(r"\d+", line)[0])
+
+
+def _get_float(line: str) -> float:
+    return float(re.findall(r"\d+.\d+", line)[0])
+
+
+ASEG_CHAIN = (
+    ("Measure BrainSeg, BrainSegVol", "BrainSegVol", _get_float),
+    ("Measure BrainSegNotVent, BrainSegVolNotVent", "BrainSegVolNotVent", _get_float),
+    ("Measure BrainSegNotVentSurf, BrainSegVolNotVentSurf", "BrainSegVolNotVentSurf", _get_float),
+    ("Measure Cortex, CortexVol", "CortexVol", _get_float),
+    ("Measure SupraTentorial, SupraTentorialVol", "SupraTentorialVol", _get_float),
+    ("Measure SupraTentorialNotVent, SupraTentorialVolNotVent", "SupraTentorialVolNotVent", _get_float),
+    ("Measure EstimatedTotalIntraCranialVol, eTIV", "eTIV", _get_float),
+    ("Measure VentricleChoroidVol, VentricleChoroidVol", "VentricleChoroidVol", _get_float),
+    ("Measure lhCortex, lhCortexVol", "lhCortexVol", _get_float),
+    ("Measure rhCortex, rhCortexVol", "rhCortexVol", _get_float),
+    ("Measure lhCerebralWhiteMatter, lhCerebralWhiteMatterVol", "lhCerebralWhiteMatterVol", _get_float),
+    ("Measure rhCerebralWhiteMatter, rhCerebralWhiteMatterVol", "rhCerebralWhiteMatterVol", _get_float),
+    ("Measure CerebralWhiteMatter, CerebralWhiteMatterVol", "CerebralWhiteMatterVol", _get_float),
+    ("Measure SubCortGray, SubCortGrayVol", "SubCortGrayVol", _get_float),
+    ("Measure TotalGray, TotalGrayVol", "TotalGrayVol", _get_float),
+    ("Measure SupraTentorialNotVentVox, SupraTentorialVolNotVentVox", "SupraTentorialVolNotVentVox", _get_float),
+    ("Measure Mask, MaskVol", "MaskVol", _get_float),
+    ("BrainSegVol-to-eTIV, BrainSegVol-to-eTIV", "BrainSegVol-to-eTIV", _get_float),
+    ("MaskVol-to-eTIV", "Mask-to-eTIV", _get_float),
+    ("lhSurfaceHoles", "lhSurfaceHoles", _get_int),
+    ("rhSurfaceHoles", "rhSurfaceHoles", _get_int),
+    ("SurfaceHoles, SurfaceHoles", "SurfaceHoles", _get_int),
+)
+APARC_CHAIN = (
+    ("Measure Cortex, NumVert", "NumVert", _get_int),
+    ("Measure Cortex, WhiteSurfArea", "WhiteSurfArea", _get_float),
+    ("Measure Cortex, MeanThickness", "MeanThickness", _get_float),
+)
+
+
+def _parse_header_reference(f: Path, chain: tuple) -> pd.DataFrame:
+    dfs = []
+    for line in f.read_text().splitlines():
+        for needle, name, get in chain:
+            if needle in line:
+                dfs.append(pd.DataFrame({name: [get(line)]}))
+                break
+    return pd.concat(dfs, axis=1).reset_index(drop=True)
+
+
+def parse_all_headers_reference(root: Path) -> pd.DataFrame:
+    headers = []
+    for subsesdir in root.glob("sub*"):
+        aseg = _parse_header_reference(subsesdir / "stats" / "aseg.stats", ASEG_CHAIN)
+        aparc = _parse_header_reference(subsesdir / "stats" / "lh.aparc.stats", APARC_CHAIN)
+        headers.append(pd.concat([aseg, aparc], axis=1).assign(subject=subsesdir.name))
+    return pd.concat(headers).reset_index(drop=True)
+
+
+def parse_all_aparc_reference(root: Path) -> pd.DataFrame:
+    aparc = []
+    for subsesdir in root.glob("sub*"):
+        for hemi in ["lh", "rh"]:
+            for parc in freesufer.APARC_PARCS:
+                aparc.append(
+                    pd.read_csv(
+                        subsesdir / "stats" / f"{hemi}.{parc}.stats",
+                        sep=r"\s+",
+                        comment="#",
+                        names=list(freesufer.APARC_COLUMNS),
+                    ).assign(hemisphere=hemi, parc=parc)
+                )
+    return pd.concat(aparc, ignore_index=True)
+
+
+def parse_all_aseg_reference(root: Path) -> pd.DataFrame:
+    aseg = []
+    for subsesdir in root.glob("sub*"):
+        for seg in ["aseg", "wmparc"]:
+            aseg.append(
+                pd.read_csv(
+                    subsesdir / "stats" / f"{seg}.stats", sep=r"\s+", comment="#", names=list(freesufer.ASEG_COLUMNS)
+                ).assign(seg=seg)
+            )
+    return pd.concat(aseg, ignore_index=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-subjects", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        make_subjects(root, args.n_subjects)
+        print(f"{'':<16}{'reference (s)':>14}{'freesufer (s)':>14}{'speedup':>9}")
+        for name, reference, parse in (
+            ("headers", parse_all_headers_reference, freesufer.parse_all_headers),
+            ("aparc", parse_all_aparc_reference, freesufer.parse_all_aparc),
+            ("aseg", parse_all_aseg_reference, freesufer.parse_all_aseg),
+        ):
+            start = time.perf_counter()
+            expected = reference(root)
+            middle = time.perf_counter()
+            parsed = parse(root)
+            end = time.perf_counter()
+            print(f"{name:<16}{middle - start:>14.2f}{end - middle:>14.2f}{(middle - start) / (end - middle):>9.1f}")
+
+            common = [column for column in expected.columns if column in parsed.columns]
+            if parsed.select(common).to_dict(as_series=False) != expected[common].to_dict("list"):
+                msg = f"{name}: the parsers disagree"
+                raise AssertionError(msg)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Measure the ingest of every CLI on a synthetic A2CPS tree, and compare it with a stored baseline.
+
+    python benchmarks/ingest.py [--n-subjects N] [--n-runs R] [--repeat R] [--cli NAME ...] [--ingest orm|bulk]
+                                [--save] [--dir DIR]
+
+Writes a tree with tree.make_tree, then runs the main of each CLI on it into a
+fresh SQLite file, in a new process each time so that the peak RSS is that of
+the one ingest. For each CLI this reports files/s (rows in the file table over
+the time taken by main), SQL statements executed per file, and the peak RSS of
+the process that writes (the readers run in worker processes, whose largest
+peak is reported separately). The best of repeat runs is kept.
+
+Each CLI builds its own mapping.Mapper, so --ingest sets the default ingest
+of Mapper in the measuring process. Run once with each to compare the bulk
+mode with the ORM.
+
+The results are compared with those in --baseline when it was recorded for the
+same tree, profile and ingest, and the script fails if any is worse by more than
+--tolerance. Pass --save to record the results as the baseline instead. Files/s
+and RSS depend on the machine, so record the baseline where it will be compared;
+statements per file do not.
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent import futures
+from multiprocessing import get_context
+from pathlib import Path
+
+import pydantic
+import sqlalchemy as sa
+from tree import ROOTS, SESSIONS, make_tree
+
+from bidsql import mapping, profiles
+
+BASELINE = Path(__file__).parent / "baselines" / "ingest.json"
+# (key, heading, whether larger is better)
+METRICS = (
+    ("files_per_s", "files/s", True),
+    ("statements_per_file", "stmts/file", False),
+    ("rss_mib", "RSS MiB", False),
+    ("worker_rss_mib", "workers MiB", False),
+)
+
+
+def measure(name: str, root: Path, db: Path, profile: profiles.Profile, ingest: mapping.Ingest) -> dict[str, float]:
+    """Run the main of bidsql.cli.name on root, into db, in this process"""
+    cli = importlib.import_module(f"bidsql.cli.{name}")
+    cli.mapping.Mapper = pydantic.create_model("Mapper", __base__=mapping.Mapper, ingest=(mapping.Ingest, ingest))
+    logging.disable(logging.WARNING)
+
+    n_statements = 0
+
+    def count(*_: object) -> None:
+        nonlocal n_statements
+        n_statements += 1
+
+    sa.event.listen(sa.Engine, "before_cursor_execute", count)
+    start = time.perf_counter()
+    cli.main(root=root, db=f"sqlite:///{db}", profile=profile)
+    elapsed = time.perf_counter() - start
+    sa.event.remove(sa.Engine, "before_cursor_execute", count)
+
+    engine = sa.create_engine(f"sqlite:///{db}")
+    with engine.connect() as connection:
+        n_files = connection.scalar(sa.text("SELECT count(*) FROM file"))
+    engine.dispose()
+    if not n_files:
+        msg = f"{name} did not ingest any files from {root}"
+        raise RuntimeError(msg)
+    # ru_maxrss is in KiB on Linux
+    return {
+        "files": n_files,
+        "files_per_s": n_files / elapsed,
+        "statements_per_file": n_statements / n_files,
+        "rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "worker_rss_mib": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def best_of(
+    name: str, root: Path, tmp: Path, profile: profiles.Profile, ingest: mapping.Ingest, repeat: int
+) -> dict[str, float]:
+    runs = []
+    for i in range(repeat):
+        db = tmp / f"{name}-{i}.sqlite"
+        with futures.ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            runs.append(executor.submit(measure, name, root, db, profile, ingest).result())
+        db.unlink()
+    best = {key: min(run[key] for run in runs) for key in runs[0]}
+    best["files_per_s"] = max(run["files_per_s"] for run in runs)
+    return best
+
+
+def compare(results: dict[str, dict[str, float]], baseline: dict[str, dict[str, float]], tolerance: float) -> list[str]:
+    """The metrics of results that are worse than baseline by more than tolerance"""
+    worse = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for key, heading, larger_is_better in METRICS:
+            change = result[key] / baseline[name][key] - 1
+            if (-change if larger_is_better else change) > tolerance:
+                worse.append(f"{name} {heading} {change:+.0%}")
+    return worse
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-subjects", type=int, default=20)
+    parser.add_argument("--n-runs", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--cli", nargs="+", choices=list(ROOTS), default=list(ROOTS))
+    parser.add_argument("--profile", choices=profiles.PROFILES, default="default")
+    parser.add_argument("--ingest", choices=("orm", "bulk"), default="orm")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--save", action="store_true")
+    parser.add_argument("--dir", type=Path, default=None)
+    args = parser.parse_args()
+
+    settings = {
+        "n_subjects": args.n_subjects,
+        "n_runs": args.n_runs,
+        "sessions": list(SESSIONS),
+        "profile": args.profile,
+        "ingest": args.ingest,
+    }
+    results = {}
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        root = Path(tmp) / "a2cps"
+        n_files = make_tree(root, args.n_subjects, n_runs=args.n_runs)
+        print(f"{n_files:,} files, {args.n_subjects} subjects, best of {args.repeat}")
+        print(f"{'cli':<12}{'files':>8}" + "".join(f"{heading:>13}" for _, heading, _ in METRICS))
+        for name in args.cli:
+            result = results[name] = best_of(
+                name, root / ROOTS[name], Path(tmp), args.profile, args.ingest, args.repeat
+            )
+            print(f"{name:<12}{result['files']:>8,.0f}" + "".join(f"{result[key]:>13,.1f}" for key, _, _ in METRICS))
+
+    if args.save:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        baseline = {"settings": settings, "machine": f"{platform.platform()} python {platform.python_version()}"}
+        rounded = {name: {key: round(value, 3) for key, value in result.items()} for name, result in results.items()}
+        args.baseline.write_text(json.dumps({**baseline, "results": rounded}, indent=2) + "\n")
+        print(f"saved as the baseline in {args.baseline}")
+        return
+    if not args.baseline.exists():
+        print(f"no baseline at {args.baseline}; pass --save to record one")
+        return
+    baseline = json.loads(args.baseline.read_text())
+    if baseline["settings"] != settings:
+        print(f"the baseline in {args.baseline} is for {baseline['settings']}, so not comparing")
+        return
+    print(f"compared with the baseline from {baseline['machine']}, with a tolerance of {args.tolerance:.0%}")
+    if worse := compare(results, baseline["results"], args.tolerance):
+        sys.exit("worse than the baseline: " + ", ".join(worse))
+    print("no regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Compare loading into PostgreSQL with mapping.CopyLoader and with the executemany INSERTs of mapping.Loader.
+
+    python benchmarks/postgres.py postgresql://user@host/db [--n-files N] [--n-events M] [--repeat R]
+
+Each run drops and creates the bidsql tables in db (so point it at a scratch
+database), then loads n_files func files with n_events events each, the way
+bids.write_func does.
+"""
+
+import argparse
+import time
+import uuid
+from collections import abc
+
+import polars as pl
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+from bidsql import mapping, models
+
+LOADERS: dict[str, abc.Callable[[orm.Session], mapping.Loader]] = {
+    "insert": lambda session: mapping.Loader(session, ingest="bulk"),
+    "copy": mapping.CopyLoader,
+}
+
+
+def load(
+    engine: sa.Engine, make_loader: abc.Callable[[orm.Session], mapping.Loader], n_files: int, n_events: int
+) -> None:
+    events = pl.DataFrame(
+        {
+            "onset": [2.0 * j for j in range(n_events)],
+            "duration": [1.5] * n_events,
+            "extra": [{"trial_type": "cuff" if j % 2 else "rest"} for j in range(n_events)],
+        }
+    ).with_columns(pl.col("extra").struct.json_encode())
+    with orm.Session(engine) as session:
+        dataset = models.Dataset(name="bidsql", bids_version="1.9.0")
+        session.add(dataset)
+        session.flush()
+        loader = make_loader(session)
+        for i in range(n_files):
+            path = f"/bids/sub-{10000 + i}/ses-V1/func/sub-{10000 + i}_ses-V1_task-cuff_run-1_bold.nii.gz"
+            loader.add(
+                models.Func,
+                {
+                    "path": path,
+                    "basename": path.rsplit("/", 1)[-1],
+                    "size": 1024,
+                    "mtime": 0.0,
+                    "dataset_id": dataset.id,
+                    "task": "cuff",
+                    "run": "1",
+                    "suffix": "bold",
+                    "extension": ".nii.gz",
+                    "extra": {"RepetitionTime": 0.8, "id": str(uuid.uuid4())},
+                },
+            )
+            loader.add_frame(models.Event, events.with_row_index(name="idx").with_columns(func_path=pl.lit(path)))
+        loader.flush()
+        session.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("db")
+    parser.add_argument("--n-files", type=int, default=5_000)
+    parser.add_argument("--n-events", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    engine = sa.create_engine(args.db)
+    n_rows = args.n_files * (args.n_events + 2)
+    print(f"{args.n_files:,} files and {args.n_files * args.n_events:,} events")
+    print(f"{'loader':<12}{'s':>8}{'rows/s':>12}")
+    for name, make_loader in LOADERS.items():
+        elapsed = []
+        for _ in range(args.repeat):
+            models.Base.metadata.drop_all(engine)
+            models.Base.metadata.create_all(engine)
+            start = time.perf_counter()
+            load(engine, make_loader, args.n_files, args.n_events)
+            elapsed.append(time.perf_counter() - start)
+            with engine.connect() as connection:
+                if connection.scalar(sa.text("SELECT count(*) FROM event")) != args.n_files * args.n_events:
+                    msg = f"{name} did not load every event"
+                    raise AssertionError(msg)
+        best = min(elapsed)
+        print(f"{name:<12}{best:>8.2f}{n_rows / best:>12,.0f}")
+    models.Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Time bidsql.query lookups on a large file table, with and without the indexes on File.
+
+    python benchmarks/query.py [--n-rows N] [--repeat R] [--db PATH]
+
+Fills a sqlite database with n_rows synthetic files (about a hundred per session,
+two sessions per participant), then times each lookup (most of them against a
+random participant) with the indexes, and again after dropping them. Pass --db to keep
+the database between runs; an existing one is reused as is.
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+from bidsql import models, query
+
+# (modality, suffix, extension, task, space, desc) of the files in each session, repeated over runs
+FILES = (
+    ("anat", "T1w", ".nii.gz", None, None, None),
+    ("anat", "T1w", ".json", None, None, None),
+    ("anat", "T1w", ".nii.gz", None, "MNI152NLin2009cAsym", "preproc"),
+    ("anat", "mask", ".nii.gz", None, "MNI152NLin2009cAsym", "brain"),
+    ("anat", "dseg", ".nii.gz", None, "MNI152NLin2009cAsym", None),
+    ("dwi", "dwi", ".nii.gz", None, None, None),
+    ("dwi", "dwi", ".bval", None, None, None),
+    ("dwi", "dwi", ".bvec", None, None, None),
+    ("dwi", "dwi", ".json", None, None, None),
+    ("fmap", "epi", ".nii.gz", None, None, None),
+    ("fmap", "epi", ".json", None, None, None),
+    ("func", "bold", ".nii.gz", "rest", None, None),
+    ("func", "bold", ".json", "rest", None, None),
+    ("func", "bold", ".nii.gz", "rest", "MNI152NLin2009cAsym", "preproc"),
+    ("func", "bold", ".nii.gz", "cuff", None, None),
+    ("func", "bold", ".json", "cuff", None, None),
+    ("func", "events", ".tsv", "cuff", None, None),
+    ("func", "bold", ".nii.gz", "cuff", "MNI152NLin2009cAsym", "preproc"),
+    ("func", "timeseries", ".tsv", "cuff", None, "confounds"),
+    ("figures", "bold", ".svg", "rest", None, "carpetplot"),
+)
+N_RUNS = 5
+FILES_PER_SESSION = len(FILES) * N_RUNS
+SESSIONS = ("V1", "V3")
+
+
+def fill(engine: sa.Engine, n_rows: int) -> None:
+    table = models.File.__table__
+    table.create(engine)
+    # building the indexes once is faster than keeping them up to date while filling
+    for index in table.indexes:
+        index.drop(engine)
+
+    columns = ("path", "basename", "dataset_id", "participant_id", "session_id", "modality", "suffix", "extension")
+    columns += ("task", "space", "desc", "run")
+    insert = f"INSERT INTO file ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+    def rows():
+        for i in range(n_rows):
+            sub, session = 10000 + i // (2 * FILES_PER_SESSION), SESSIONS[i // FILES_PER_SESSION % 2]
+            modality, suffix, extension, task, space, desc = FILES[i % len(FILES)]
+            run = str(i // len(FILES) % N_RUNS + 1)
+            entities = "".join(
+                f"_{key}-{value}"
+                for key, value in (("task", task), ("run", run), ("space", space), ("desc", desc))
+                if value
+            )
+            basename = f"sub-{sub}_ses-{session}{entities}_{suffix}{extension}"
+            path = f"/bids/sub-{sub}/ses-{session}/{modality}/{basename}"
+            yield (path, basename, "bids", str(sub), session, modality, suffix, extension, task, space, desc, run)
+
+    with engine.begin() as connection:
+        batch = []
+        for row in rows():
+            batch.append(row)
+            if len(batch) == 100_000:
+                connection.exec_driver_sql(insert, batch)
+                batch.clear()
+        if batch:
+            connection.exec_driver_sql(insert, batch)
+
+    for index in table.indexes:
+        index.create(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("ANALYZE")
+
+
+def lookups(n_participants: int, rng: random.Random) -> dict[str, dict[str, query.Value]]:
+    sub, ses = str(10000 + rng.randrange(n_participants)), rng.choice(SESSIONS)
+    subs = [str(10000 + rng.randrange(n_participants)) for _ in range(10)]
+    return {
+        "sub, ses": {"sub": sub, "ses": ses},
+        "sub, ses, suffix, ext": {"sub": sub, "ses": ses, "suffix": "bold", "extension": ".nii.gz"},
+        "sub in 10, suffix": {"sub": subs, "suffix": "T1w", "extension": "nii.gz", "space": None},
+        "sub, task, suffix": {"sub": sub, "task": "cuff", "suffix": "events"},
+        "sub, suffix, space, desc": {
+            "sub": sub,
+            "suffix": "bold",
+            "extension": ".nii.gz",
+            "space": "MNI152NLin2009cAsym",
+            "desc": "preproc",
+        },
+        # across participants, so these return a tenth of the table or so
+        "all: task, suffix": {"task": "cuff", "suffix": "events"},
+        "all: suffix, ext, space": {"suffix": "dseg", "extension": ".nii.gz", "space": "MNI152NLin2009cAsym"},
+    }
+
+
+def time_lookups(
+    engine: sa.Engine, n_participants: int, repeat: int
+) -> dict[str, tuple[list[float], list[list[str]], str]]:
+    rng = random.Random(0)
+    timings: dict[str, tuple[list[float], list[list[str]], str]] = {}
+    with orm.Session(engine) as session:
+        for _ in range(repeat):
+            for name, entities in lookups(n_participants, rng).items():
+                start = time.perf_counter()
+                paths = query.get_paths(session, **entities)
+                elapsed = time.perf_counter() - start
+                if name not in timings:
+                    statement = query.select(**entities).with_only_columns(models.File.path)
+                    compiled = statement.compile(engine, compile_kwargs={"literal_binds": True})
+                    plan = session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}").all()
+                    timings[name] = ([], [], "; ".join(row[-1] for row in plan))
+                timings[name][0].append(elapsed)
+                timings[name][1].append(sorted(paths))
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-rows", type=int, default=10_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--db", type=Path, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = args.db or Path(tmp) / "query.sqlite"
+        engine = sa.create_engine(f"sqlite:///{db}")
+        if not db.exists():
+            start = time.perf_counter()
+            fill(engine, args.n_rows)
+            print(f"filled {args.n_rows:,} rows in {time.perf_counter() - start:.1f} s")
+        with engine.connect() as connection:
+            n_rows = connection.scalar(sa.text("SELECT count(*) FROM file"))
+        n_participants = n_rows // (2 * FILES_PER_SESSION)
+
+        indexed = time_lookups(engine, n_participants, args.repeat)
+        for index in models.File.__table__.indexes:
+            index.drop(engine)
+        try:
+            scanned = time_lookups(engine, n_participants, max(1, args.repeat // 10))
+        finally:
+            for index in models.File.__table__.indexes:
+                index.create(engine)
+        engine.dispose()
+
+    print(f"{n_rows:,} files, median of {args.repeat} lookups")
+    print(f"{'lookup':<26}{'rows':>6}{'indexed (ms)':>14}{'scan (ms)':>12}  plan")
+    for name, (elapsed, paths, plan) in indexed.items():
+        scan_elapsed, scan_paths, _ = scanned[name]
+        if paths[: len(scan_paths)] != scan_paths:
+            msg = f"{name}: the indexes changed the result"
+            raise AssertionError(msg)
+        print(
+            f"{name:<26}{statistics.median(map(len, paths)):>6.0f}{1e3 * statistics.median(elapsed):>14.2f}"
+            f"{1e3 * statistics.median(scan_elapsed):>12.1f}  {plan}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Compare the SQLite profiles of bidsql.profiles, for an ingest with mapping.Mapper and for bidsql.query lookups.
+
+    python benchmarks/sqlite.py [--n-subjects N] [--commit-every C] [--repeat R] [--dir DIR]
+
+Writes a synthetic bids tree (empty files and sidecars, named like those of
+a2cps, about a hundred per subject) and ingests it into a fresh database with
+each profile, committing every commit_every files. The lookups then run against the last of
+those databases. Pass --dir to put the tree and databases on the storage to be
+measured (e.g., a network filesystem), since the cost of each sync depends on it.
+"""
+
+import argparse
+import json
+import logging
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+from bidsql import crawler, mapping, profiles, query
+from bidsql.a2cps import bids
+
+NAMES = (
+    "anat/sub-{sub}_ses-{ses}_T1w.nii.gz",
+    "anat/sub-{sub}_ses-{ses}_T1w.json",
+    "dwi/sub-{sub}_ses-{ses}_dwi.nii.gz",
+    "dwi/sub-{sub}_ses-{ses}_dwi.bval",
+    "dwi/sub-{sub}_ses-{ses}_dwi.bvec",
+    "dwi/sub-{sub}_ses-{ses}_dwi.json",
+    "fmap/sub-{sub}_ses-{ses}_dir-AP_run-{run}_epi.nii.gz",
+    "fmap/sub-{sub}_ses-{ses}_dir-AP_run-{run}_epi.json",
+    "fmap/sub-{sub}_ses-{ses}_dir-PA_run-{run}_epi.nii.gz",
+    "fmap/sub-{sub}_ses-{ses}_dir-PA_run-{run}_epi.json",
+    "func/sub-{sub}_ses-{ses}_task-rest_run-{run}_bold.nii.gz",
+    "func/sub-{sub}_ses-{ses}_task-rest_run-{run}_bold.json",
+    "func/sub-{sub}_ses-{ses}_task-cuff_run-{run}_bold.nii.gz",
+    "func/sub-{sub}_ses-{ses}_task-cuff_run-{run}_bold.json",
+    "func/sub-{sub}_ses-{ses}_task-cuff_run-{run}_events.tsv",
+    "func/sub-{sub}_ses-{ses}_task-cuff_run-{run}_physio.tsv.gz",
+    "func/sub-{sub}_ses-{ses}_task-cuff_run-{run}_physio.json",
+)
+N_RUNS = 3
+SESSIONS = ("V1", "V3")
+
+# every file becomes a plain file row, so the ingest is mostly writes to the database
+maps = (
+    mapping.File.from_str(src_pattern=r"dataset_description\.json\Z", parser=bids.parse_dataset),
+    mapping.File.from_str(src_pattern=r".*", parser=bids.parse_file),
+)
+
+
+def make_tree(root: Path, n_subjects: int) -> int:
+    root.mkdir(parents=True)
+    (root / "dataset_description.json").write_text(json.dumps({"Name": "bidsql", "BIDSVersion": "1.9.0"}))
+    n_files = 1
+    for i in range(n_subjects):
+        sub = str(10000 + i)
+        for ses in SESSIONS:
+            for run in range(1, N_RUNS + 1):
+                for name in NAMES:
+                    dst = root / f"sub-{sub}" / f"ses-{ses}" / name.format(sub=sub, ses=ses, run=run)
+                    if not dst.exists():
+                        dst.parent.mkdir(parents=True, exist_ok=True)
+                        dst.write_text("{}" if dst.suffix == ".json" else "")
+                        n_files += 1
+    return n_files
+
+
+def ingest(root: Path, db: Path, profile: profiles.Profile, commit_every: int) -> float:
+    mapper = mapping.Mapper(
+        maps=maps,
+        db=f"sqlite:///{db}",
+        generators=[crawler.Walk(root)],
+        stages=[mapping.Stage.from_str("dataset", r"dataset_description\.json\Z")],
+        roots=[root],
+        max_workers=0,
+        commit_every_files=commit_every,
+        profile=profile,
+    )
+    start = time.perf_counter()
+    mapper.run()
+    return time.perf_counter() - start
+
+
+def time_lookups(db: Path, profile: profiles.Profile, n_subjects: int, repeat: int) -> list[float]:
+    rng = random.Random(0)
+    engine = profiles.create_engine(f"sqlite:///{db}", profile=profile)
+    elapsed = []
+    with orm.Session(engine) as session:
+        for _ in range(repeat):
+            sub = str(10000 + rng.randrange(n_subjects))
+            start = time.perf_counter()
+            query.get_paths(session, sub=sub, ses=rng.choice(SESSIONS))
+            query.get_paths(session, suffix="bold", extension=".nii.gz", task="cuff")
+            elapsed.append(time.perf_counter() - start)
+    engine.dispose()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-subjects", type=int, default=500)
+    parser.add_argument("--commit-every", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--dir", type=Path, default=None)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        root = Path(tmp) / "bids"
+        n_files = make_tree(root, args.n_subjects)
+        print(f"{n_files:,} files, committing every {args.commit_every}")
+
+        for profile in ("default", "ingest"):
+            db = Path(tmp) / f"{profile}.sqlite"
+            elapsed = ingest(root, db, profile, args.commit_every)
+            print(f"ingest  {profile:<8}{elapsed:>8.2f} s  {n_files / elapsed:>8,.0f} files/s")
+
+        for profile in ("default", "read"):
+            # the first lookup also fills the page cache, so it is dropped
+            elapsed = time_lookups(db, profile, args.n_subjects, args.repeat + 1)[1:]
+            print(f"lookups {profile:<8}{1e3 * statistics.median(elapsed):>8.2f} ms (median of {args.repeat})")
+
+        engine = sa.create_engine(f"sqlite:///{db}")
+        with engine.connect() as connection:
+            journal_mode = connection.exec_driver_sql("PRAGMA journal_mode").scalar()
+        engine.dispose()
+        print(f"journal mode after the ingest profile: {journal_mode}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+"""Write a synthetic A2CPS tree, with the outputs of every pipeline that the bidsql CLIs ingest.
+
+    python benchmarks/tree.py DST [--n-subjects N] [--n-runs R] [--sessions V1 V3] [--seed S]
+
+For each subject and session there is a job directory named like those of
+a2cps (site, participant and session, e.g., NS10000V1) under each pipeline:
+
+    SITE/bids/JOB                                    bids
+    SITE/fmriprep/JOB/fmriprep                       fmriprep
+    SITE/fmriprep/JOB/fmriprep/sourcedata/freesurfer freesurfer
+    SITE/fmriprep/JOB/synthstrip                     synthstrip
+    SITE/qsiprep/JOB/eddyqc                          eddyqc
+
+mriqc and qsiprep each take a single dataset as root, so their outputs are
+written as one dataset each, under derivatives/mriqc and derivatives/qsiprep.
+NIfTIs and the other binary outputs are empty. Sidecars, events.tsv, bval/bvec,
+scans.tsv, ImageQC and .stats files have plausible content, since they are parsed.
+"""
+
+import argparse
+import json
+import random
+from pathlib import Path
+
+from bidsql.a2cps import freesufer
+
+SITES = ("NS", "UI", "UC", "WS", "SH")
+SESSIONS = ("V1", "V3")
+TASKS = ("rest", "cuff")
+# the directories, relative to root, that each CLI is given
+ROOTS = {
+    "bids": ".",
+    "fmriprep": ".",
+    "freesurfer": ".",
+    "synthstrip": ".",
+    "eddyqc": ".",
+    "mriqc": "derivatives/mriqc",
+    "qsiprep": "derivatives/qsiprep",
+}
+
+FMRIPREP_ANAT = (
+    "desc-preproc_T1w.nii.gz",
+    "desc-preproc_T1w.json",
+    "desc-brain_mask.nii.gz",
+    "desc-brain_mask.json",
+    "dseg.nii.gz",
+    "label-GM_probseg.nii.gz",
+    "label-WM_probseg.nii.gz",
+    "label-CSF_probseg.nii.gz",
+    "space-MNI152NLin2009cAsym_desc-preproc_T1w.nii.gz",
+    "space-MNI152NLin2009cAsym_desc-preproc_T1w.json",
+    "space-MNI152NLin2009cAsym_desc-brain_mask.nii.gz",
+    "space-MNI152NLin2009cAsym_dseg.nii.gz",
+    "from-T1w_to-MNI152NLin2009cAsym_mode-image_xfm.h5",
+    "from-MNI152NLin2009cAsym_to-T1w_mode-image_xfm.h5",
+    "from-T1w_to-fsnative_mode-image_xfm.txt",
+    "from-fsnative_to-T1w_mode-image_xfm.txt",
+    "hemi-L_pial.surf.gii",
+    "hemi-R_pial.surf.gii",
+    "hemi-L_white.surf.gii",
+    "hemi-R_white.surf.gii",
+)
+FMRIPREP_FUNC = (
+    "space-MNI152NLin2009cAsym_desc-preproc_bold.nii.gz",
+    "space-MNI152NLin2009cAsym_desc-preproc_bold.json",
+    "space-MNI152NLin2009cAsym_desc-brain_mask.nii.gz",
+    "space-MNI152NLin2009cAsym_boldref.nii.gz",
+    "desc-coreg_boldref.nii.gz",
+    "from-scanner_to-T1w_mode-image_xfm.txt",
+    "from-boldref_to-T1w_mode-image_desc-coreg_xfm.txt",
+)
+FREESURFER_MRI = ("T1.mgz", "brain.mgz", "aseg.mgz", "aparc+aseg.mgz", "wmparc.mgz", "orig.mgz")
+FREESURFER_SURF = ("white", "pial", "inflated", "sphere", "sphere.reg", "thickness", "curv", "area")
+QSIPREP_DWI = (
+    "space-T1w_desc-preproc_dwi.nii.gz",
+    "space-T1w_desc-preproc_dwi.json",
+    "space-T1w_desc-preproc_dwi.bval",
+    "space-T1w_desc-preproc_dwi.bvec",
+    "space-T1w_desc-preproc_dwi.b",
+    "space-T1w_desc-brain_mask.nii.gz",
+    "space-T1w_dwiref.nii.gz",
+    "confounds.tsv",
+)
+CONFOUNDS = ("global_signal", "csf", "white_matter", "trans_x", "trans_y", "trans_z", "rot_x", "rot_y", "rot_z")
+# the header measures of .stats files, as FreeSurfer 7 writes them
+ASEG_HEADER = (
+    ("BrainSeg", "BrainSegVol", "Brain Segmentation Volume", "mm^3"),
+    ("BrainSegNotVent", "BrainSegVolNotVent", "Brain Segmentation Volume Without Ventricles", "mm^3"),
+    ("VentricleChoroidVol", "VentricleChoroidVol", "Volume of ventricles and choroid plexus", "mm^3"),
+    ("lhCortex", "lhCortexVol", "Left hemisphere cortical gray matter volume", "mm^3"),
+    ("rhCortex", "rhCortexVol", "Right hemisphere cortical gray matter volume", "mm^3"),
+    ("Cortex", "CortexVol", "Total cortical gray matter volume", "mm^3"),
+    ("lhCerebralWhiteMatter", "lhCerebralWhiteMatterVol", "Left hemisphere cerebral white matter volume", "mm^3"),
+    ("rhCerebralWhiteMatter", "rhCerebralWhiteMatterVol", "Right hemisphere cerebral white matter volume", "mm^3"),
+    ("CerebralWhiteMatter", "CerebralWhiteMatterVol", "Total cerebral white matter volume", "mm^3"),
+    ("SubCortGray", "SubCortGrayVol", "Subcortical gray matter volume", "mm^3"),
+    ("TotalGray", "TotalGrayVol", "Total gray matter volume", "mm^3"),
+    ("SupraTentorial", "SupraTentorialVol", "Supratentorial volume", "mm^3"),
+    ("SupraTentorialNotVent", "SupraTentorialVolNotVent", "Supratentorial volume", "mm^3"),
+    ("Mask", "MaskVol", "Mask Volume", "mm^3"),
+    ("BrainSegVol-to-eTIV", "BrainSegVol-to-eTIV", "Ratio of BrainSegVol to eTIV", "unitless"),
+    ("MaskVol-to-eTIV", "MaskVol-to-eTIV", "Ratio of MaskVol to eTIV", "unitless"),
+    ("lhSurfaceHoles", "lhSurfaceHoles", "Number of defect holes in lh surfaces prior to fixing", "unitless"),
+    ("rhSurfaceHoles", "rhSurfaceHoles", "Number of defect holes in rh surfaces prior to fixing", "unitless"),
+    ("SurfaceHoles", "SurfaceHoles", "Total number of defect holes in surfaces prior to fixing", "unitless"),
+    ("EstimatedTotalIntraCranialVol", "eTIV", "Estimated Total Intracranial Volume", "mm^3"),
+)
+APARC_HEADER = (
+    ("Cortex", "NumVert", "Number of Vertices", "unitless"),
+    ("Cortex", "WhiteSurfArea", "White Surface Total Area", "mm^2"),
+    ("Cortex", "MeanThickness", "Mean Thickness", "mm"),
+)
+# number of table rows in each .stats file
+N_ROWS = {
+    "aseg": 45,
+    "wmparc": 70,
+    "aparc": 34,
+    "aparc.pial": 34,
+    "BA_exvivo": 14,
+    "BA_exvivo.thresh": 14,
+    "aparc.DKTatlas": 31,
+    "aparc.a2009s": 74,
+}
+
+
+def _header(rng: random.Random, measures: tuple[tuple[str, str, str, str], ...]) -> list[str]:
+    lines = ["# Title Segmentation Statistics", "# generating_program mri_segstats", "# cvs_version 7.4.1"]
+    for structure, measure, description, unit in measures:
+        value = rng.randint(0, 100) if "Holes" in measure or measure == "NumVert" else f"{rng.uniform(0, 1e6):f}"
+        lines.append(f"# Measure {structure}, {measure}, {description}, {value}, {unit}")
+    return lines
+
+
+def write_aseg(rng: random.Random, dst: Path, n_rows: int, header: bool) -> None:
+    lines = _header(rng, ASEG_HEADER) if header else []
+    lines.append(
+        "# ColHeaders  Index SegId NVoxels Volume_mm3 StructName normMean normStdDev normMin normMax normRange"
+    )
+    for i in range(n_rows):
+        n = rng.randint(10, 20000)
+        lines.append(
+            f"{i + 1:3d} {i + 2:4d} {n:8d} {n * 1.0:10.1f}  Structure-{i:<30} "
+            f"{rng.uniform(20, 110):8.4f} {rng.uniform(1, 20):8.4f} {rng.uniform(0, 50):8.4f} "
+            f"{rng.uniform(60, 150):8.4f} {rng.uniform(10, 100):8.4f}"
+        )
+    dst.write_text("\n".join(lines) + "\n")
+
+
+def write_aparc(rng: random.Random, dst: Path, n_rows: int) -> None:
+    lines = _header(rng, APARC_HEADER)
+    lines.append("# ColHeaders StructName NumVert SurfArea GrayVol ThickAvg ThickStd MeanCurv GausCurv FoldInd CurvInd")
+    for i in range(n_rows):
+        lines.append(
+            f"region_{i:<30} {rng.randint(100, 10000):5d} {rng.randint(100, 5000):5d} {rng.randint(100, 15000):5d} "
+            f"{rng.uniform(1, 4):5.3f} {rng.uniform(0, 1):5.3f} {rng.uniform(0, 1):8.3f} {rng.uniform(0, 1):8.3f} "
+            f"{rng.randint(0, 100):4d} {rng.uniform(0, 10):5.1f}"
+        )
+    dst.write_text("\n".join(lines) + "\n")
+
+
+def job_name(i: int, ses: str) -> str:
+    return f"{SITES[i % len(SITES)]}{10000 + i}{ses}"
+
+
+def _write(dst: Path, text: str = "") -> None:
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    dst.write_text(text)
+
+
+def _json(dst: Path, values: dict) -> None:
+    _write(dst, json.dumps(values, indent=2))
+
+
+def _description(dst: Path, name: str) -> None:
+    _json(dst / "dataset_description.json", {"Name": name, "BIDSVersion": "1.9.0", "DatasetType": "derivative"})
+
+
+def _iqms(rng: random.Random, names: tuple[str, ...]) -> dict[str, float]:
+    return {name: rng.uniform(0, 10) for name in names}
+
+
+def _btable(rng: random.Random, n_volumes: int) -> tuple[str, str]:
+    bvals = " ".join(str(rng.choice((0, 1000, 2000))) for _ in range(n_volumes))
+    bvecs = "\n".join(" ".join(f"{rng.uniform(-1, 1):.6f}" for _ in range(n_volumes)) for _ in range(3))
+    return bvals + "\n", bvecs + "\n"
+
+
+def demographics(i: int) -> tuple[int, str]:
+    """The age and sex of subject i, which are the same in the job of each of its sessions"""
+    rng = random.Random(10000 + i)
+    return rng.randint(18, 80), rng.choice("MFO")
+
+
+def write_bids(rng: random.Random, job: Path, i: int, ses: str, n_runs: int) -> None:
+    sub = str(10000 + i)
+    prefix = f"sub-{sub}_ses-{ses}"
+    age, sex = demographics(i)
+    _json(job / "dataset_description.json", {"Name": "A2CPS", "BIDSVersion": "1.9.0"})
+    _write(job / "participants.tsv", f"participant_id\tage\tsex\tsite\nsub-{sub}\t{age}\t{sex}\t{job.name[:2]}\n")
+    _write(
+        job / f"sub-{sub}" / f"sub-{sub}_sessions.tsv",
+        f"sub\tsession_id\tacquisition_week\tnote\n{sub}\tses-{ses}\t2022-01-{1 + i % 28:02d}00:00:00\tok\n",
+    )
+    session = job / f"sub-{sub}" / f"ses-{ses}"
+    scans = []
+
+    _write(session / "anat" / f"{prefix}_T1w.nii.gz")
+    _json(session / "anat" / f"{prefix}_T1w.json", {"RepetitionTime": 2.4, "EchoTime": 0.00224, "FlipAngle": 8})
+    scans.append(f"anat/{prefix}_T1w.nii.gz")
+
+    for task in TASKS:
+        for run in range(1, n_runs + 1):
+            stem = session / "func" / f"{prefix}_task-{task}_run-{run}"
+            _write(stem.with_name(f"{stem.name}_bold.nii.gz"))
+            _json(
+                stem.with_name(f"{stem.name}_bold.json"),
+                {"TaskName": task, "RepetitionTime": 0.8, "SliceTiming": [0.1 * s for s in range(8)]},
+            )
+            _write(stem.with_name(f"{stem.name}_physio.tsv.gz"))
+            _json(stem.with_name(f"{stem.name}_physio.json"), {"SamplingFrequency": 400, "Columns": ["cardiac"]})
+            if task == "cuff":
+                events = "".join(f"{2.0 * j}\t1.5\tcuff{j % 2}\n" for j in range(rng.randrange(20, 60)))
+                _write(stem.with_name(f"{stem.name}_events.tsv"), "onset\tduration\ttrial_type\n" + events)
+            scans.append(f"func/{stem.name}_bold.nii.gz")
+
+    bvals, bvecs = _btable(rng, rng.randrange(60, 120))
+    _write(session / "dwi" / f"{prefix}_dwi.nii.gz")
+    _json(session / "dwi" / f"{prefix}_dwi.json", {"PhaseEncodingDirection": "j-", "TotalReadoutTime": 0.05})
+    _write(session / "dwi" / f"{prefix}_dwi.bval", bvals)
+    _write(session / "dwi" / f"{prefix}_dwi.bvec", bvecs)
+    scans.append(f"dwi/{prefix}_dwi.nii.gz")
+
+    intended_for = [f"ses-{ses}/{scan}" for scan in scans if scan.startswith(("func/", "dwi/"))]
+    for direction in ("AP", "PA"):
+        _write(session / "fmap" / f"{prefix}_dir-{direction}_epi.nii.gz")
+        _json(session / "fmap" / f"{prefix}_dir-{direction}_epi.json", {"IntendedFor": intended_for})
+        scans.append(f"fmap/{prefix}_dir-{direction}_epi.nii.gz")
+
+    # a minute apart
+    rows = "".join(
+        f"{scan}\t2022-01-01T{10 + k // 60:02d}:{k % 60:02d}:00.000000\tn/a\n" for k, scan in enumerate(scans)
+    )
+    _write(session / f"{prefix}_scans.tsv", "filename\tacq_time\toperator\n" + rows)
+
+
+def write_fmriprep(rng: random.Random, job: Path, i: int, ses: str, n_runs: int) -> None:
+    sub = str(10000 + i)
+    prefix = f"sub-{sub}_ses-{ses}"
+    _description(job, "fMRIPrep - fMRI PREProcessing workflow")
+    _write(job / ".bidsignore", "*.html\nlogs/\nfigures/\n")
+    _write(job / f"sub-{sub}.html", "<html></html>\n")
+    _write(job / "logs" / "CITATION.md", "Results included in this manuscript come from preprocessing\n")
+    session = job / f"sub-{sub}" / f"ses-{ses}"
+    for name in FMRIPREP_ANAT:
+        if name.endswith(".json"):
+            _json(session / "anat" / f"{prefix}_{name}", {"SkullStripped": True})
+        else:
+            _write(session / "anat" / f"{prefix}_{name}")
+    for task in TASKS:
+        for run in range(1, n_runs + 1):
+            stem = f"{prefix}_task-{task}_run-{run}"
+            for name in FMRIPREP_FUNC:
+                if name.endswith(".json"):
+                    _json(session / "func" / f"{stem}_{name}", {"RepetitionTime": 0.8, "TaskName": task})
+                else:
+                    _write(session / "func" / f"{stem}_{name}")
+            rows = ["\t".join(f"{rng.gauss(0, 1):.6f}" for _ in CONFOUNDS) for _ in range(rng.randrange(100, 200))]
+            confounds = session / "func" / f"{stem}_desc-confounds_timeseries"
+            _write(confounds.with_suffix(".tsv"), "\n".join(["\t".join(CONFOUNDS), *rows]) + "\n")
+            _json(confounds.with_suffix(".json"), {confound: {"Method": "Mean"} for confound in CONFOUNDS})
+            _write(job / f"sub-{sub}" / "figures" / f"{stem}_desc-carpetplot_bold.svg", "<svg/>\n")
+    for desc in ("reconall", "conform", "summary"):
+        _write(job / f"sub-{sub}" / "figures" / f"{prefix}_desc-{desc}_T1w.svg", "<svg/>\n")
+
+
+def write_freesurfer(rng: random.Random, subject: Path) -> None:
+    (subject / "stats").mkdir(parents=True)
+    write_aseg(rng, subject / "stats" / "aseg.stats", N_ROWS["aseg"], header=True)
+    write_aseg(rng, subject / "stats" / "wmparc.stats", N_ROWS["wmparc"], header=False)
+    for hemi in ("lh", "rh"):
+        for parc in freesufer.APARC_PARCS:
+            write_aparc(rng, subject / "stats" / f"{hemi}.{parc}.stats", N_ROWS[parc])
+        for surf in FREESURFER_SURF:
+            _write(subject / "surf" / f"{hemi}.{surf}")
+        _write(subject / "label" / f"{hemi}.cortex.label", "#!ascii label\n0\n")
+    for name in FREESURFER_MRI:
+        _write(subject / "mri" / name)
+    _write(subject / "scripts" / "recon-all.log", "recon-all -s sub finished without error\n")
+    _write(subject / "scripts" / "recon-all.done", "#CMDARGS -all\n")
+
+
+def write_synthstrip(job: Path, i: int, ses: str) -> None:
+    prefix = f"sub-{10000 + i}_ses-{ses}"
+    for name in ("desc-brain_T1w.nii.gz", "desc-brain_mask.nii.gz"):
+        _write(job / f"{prefix}_{name}")
+
+
+def write_eddyqc(rng: random.Random, job: Path) -> None:
+    qc = {
+        "qc_mot_abs": rng.uniform(0, 2),
+        "qc_mot_rel": rng.uniform(0, 1),
+        "qc_params_avg": [rng.uniform(-1, 1) for _ in range(6)],
+        "qc_outliers_tot": rng.uniform(0, 5),
+        "qc_outliers_b": [rng.uniform(0, 5) for _ in range(2)],
+        "qc_cnr_avg": [rng.uniform(0, 10) for _ in range(3)],
+        "qc_cnr_std": [rng.uniform(0, 1) for _ in range(3)],
+    }
+    _json(job / "qc.json", qc)
+    _write(job / "qc.pdf")
+
+
+def write_mriqc(rng: random.Random, root: Path, i: int, ses: str, n_runs: int) -> None:
+    sub = str(10000 + i)
+    prefix = f"sub-{sub}_ses-{ses}"
+    session = root / f"sub-{sub}" / f"ses-{ses}"
+    _json(session / "anat" / f"{prefix}_T1w.json", _iqms(rng, ("cjv", "cnr", "efc", "fber", "fwhm_avg", "snr_total")))
+    _write(root / f"{prefix}_T1w.html", "<html></html>\n")
+    for task in TASKS:
+        for run in range(1, n_runs + 1):
+            stem = f"{prefix}_task-{task}_run-{run}_bold"
+            iqms = _iqms(rng, ("aor", "aqi", "dvars_std", "fd_mean", "gsr_x", "tsnr"))
+            _json(session / "func" / f"{stem}.json", iqms)
+            _write(root / f"{stem}.html", "<html></html>\n")
+    _json(session / "dwi" / f"{prefix}_dwi.json", _iqms(rng, ("fa_degenerate", "fa_nans", "snr_cc_shell0", "spikes")))
+    _write(root / f"{prefix}_dwi.html", "<html></html>\n")
+
+
+def write_qsiprep(rng: random.Random, root: Path, i: int, ses: str) -> None:
+    sub = str(10000 + i)
+    prefix = f"sub-{sub}_ses-{ses}"
+    anat = root / f"sub-{sub}" / "anat"
+    if not anat.exists():
+        _write(anat / f"sub-{sub}_desc-preproc_T1w.nii.gz")
+        _write(anat / f"sub-{sub}_desc-brain_mask.nii.gz")
+        _write(anat / f"sub-{sub}_from-MNI152NLin2009cAsym_to-T1w_mode-image_xfm.h5")
+        _write(anat / f"sub-{sub}_from-T1w_to-MNI152NLin2009cAsym_mode-image_xfm.h5")
+    dwi = root / f"sub-{sub}" / f"ses-{ses}" / "dwi"
+    bvals, bvecs = _btable(rng, rng.randrange(60, 120))
+    for name in QSIPREP_DWI:
+        dst = dwi / f"{prefix}_{name}"
+        if dst.suffix == ".json":
+            _json(dst, {"RepetitionTime": 3.2})
+        elif dst.suffix == ".bval":
+            _write(dst, bvals)
+        elif dst.suffix == ".bvec":
+            _write(dst, bvecs)
+        else:
+            _write(dst)
+    iqms = _iqms(rng, ("raw_neighbor_corr", "raw_num_bad_slices", "t1_dice_distance", "t1_neighbor_corr"))
+    header = ",".join(["file_name", "subject_id", "session_id", *iqms])
+    values = ",".join([f"{prefix}_dwi", sub, ses, *(f"{value:.6f}" for value in iqms.values())])
+    _write(dwi / f"{prefix}_desc-ImageQC_dwi.csv", f"{header}\n{values}\n")
+
+
+def make_tree(root: Path, n_subjects: int, sessions: tuple[str, ...] = SESSIONS, n_runs: int = 1, seed: int = 0) -> int:
+    """Write the tree to root and return the number of files in it"""
+    rng = random.Random(seed)
+    _description(root / ROOTS["mriqc"], "MRIQC - MRI Quality Control")
+    _description(root / ROOTS["qsiprep"], "qsiprep")
+    for i in range(n_subjects):
+        site = SITES[i % len(SITES)]
+        for ses in sessions:
+            job = job_name(i, ses)
+            write_bids(rng, root / site / "bids" / job, i, ses, n_runs)
+            fmriprep = root / site / "fmriprep" / job
+            write_fmriprep(rng, fmriprep / "fmriprep", i, ses, n_runs)
+            write_freesurfer(rng, fmriprep / "fmriprep" / "sourcedata" / "freesurfer" / f"sub-{10000 + i}")
+            write_synthstrip(fmriprep / "synthstrip", i, ses)
+            write_eddyqc(rng, root / site / "qsiprep" / job / "eddyqc")
+            write_mriqc(rng, root / ROOTS["mriqc"], i, ses, n_runs)
+            write_qsiprep(rng, root / ROOTS["qsiprep"], i, ses)
+    return sum(1 for path in root.rglob("*") if path.is_file())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("dst", type=Path)
+    parser.add_argument("--n-subjects", type=int, default=10)
+    parser.add_argument("--n-runs", type=int, default=1)
+    parser.add_argument("--sessions", nargs="+", choices=SESSIONS, default=list(SESSIONS))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.dst.exists() and any(args.dst.iterdir()):
+        msg = f"{args.dst} is not empty"
+        raise RuntimeError(msg)
+    n_files = make_tree(args.dst, args.n_subjects, tuple(args.sessions), args.n_runs, args.seed)
+    print(f"{n_files:,} files in {args.dst}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,20 @@
-import logging
+import os
+import typing
 from pathlib import Path
 
 import polars as pl
-import sqlalchemy as sa
 from sqlalchemy import exc, orm
 
-from bidsql import mapping, models, utils
+from bidsql import crawler, mapping, models, records, utils
 from bidsql.a2cps import utils as converters_utils
 
 
-def parse_file(src: Path, session: orm.Session) -> None:
-    entities = utils.parse_entities(src)
+def read_file(entry: crawler.Entry) -> records.File:
+    return records.File.from_entry(entry, sidecar=True)
+
+
+def write_file(record: records.File, session: orm.Session) -> None:
+    entities = record.entities
     participant, ses = mapping.get_add_participant_session(
         session=session,
         participant_id=entities.get("sub"),
@@ -20,26 +24,27 @@ def parse_file(src: Path, session: orm.Session) -> None:
     for key in ["ses", "sub", "modality", "fmapid"]:
         entities.pop(key, None)
 
-    session.add(
-        models.File(
-            dataset=models.Dataset.from_session(session),
-            participant=participant,
-            session=ses,
-            modality="file",
-            path=str(src.absolute()),
-            size=src.stat().st_size,
-            mtime=src.stat().st_mtime,
-            extra=utils.get_meta_from_path(src),
-            **entities,  # type: ignore
-        )
+    mapping.Loader.from_session(session).add_file(
+        models.File,
+        record,
+        dataset=mapping.get_dataset(session),
+        participant=participant,
+        ses=ses,
+        modality="file",
+        extra=record.extra,
+        **entities,
     )
 
 
-def parse_func(src: Path, session: orm.Session) -> None:
-    if mapping.is_file_in_session(src, session):
-        return
+parse_file = mapping.Parser(read=read_file, write=write_file)
 
-    entities = utils.parse_entities(src)
+
+def read_func(entry: crawler.Entry) -> records.Func:
+    return records.Func.from_entry(entry, sidecar=True, events=utils.read_events(Path(entry.path)))
+
+
+def write_func(record: records.Func, session: orm.Session) -> None:
+    entities = record.entities
     participant, ses = mapping.get_add_participant_session(
         session=session,
         participant_id=entities.get("sub"),
@@ -48,30 +53,29 @@ def parse_func(src: Path, session: orm.Session) -> None:
     for key in ["ses", "sub"]:
         entities.pop(key, None)
 
-    meta = utils.get_meta_from_path(src)
-    path = str(src.absolute())
-
-    dataset = models.Dataset.from_session(session)
-    func = models.Func(
-        dataset=dataset,
+    loader = mapping.Loader.from_session(session)
+    loader.add_file(
+        models.Func,
+        record,
+        dataset=mapping.get_dataset(session),
         participant=participant,
-        session=ses,
-        extra=meta,
-        path=path,
-        size=src.stat().st_size,
-        mtime=src.stat().st_mtime,
-        **entities,  # type: ignore
+        ses=ses,
+        extra=record.extra,
+        **entities,
     )
+    if record.events is not None:
+        loader.add_frame(models.Event, models.Event.frame_from_events(record.path, record.events))
 
-    events = func.read_events()
-    session.add_all(*[events, func])
 
+parse_func = mapping.Parser(read=read_func, write=write_func)
 
-def parse_diffusion(src: Path, session: orm.Session) -> None:
-    if mapping.is_file_in_session(src, session):
-        return
 
-    entities = utils.parse_entities(src)
+def read_diffusion(entry: crawler.Entry) -> records.Diffusion:
+    return records.Diffusion.from_entry(entry, sidecar=True, btable=utils.read_bvalbvec(Path(entry.path)))
+
+
+def _add_diffusion(record: records.Diffusion, session: orm.Session, **values: typing.Any) -> mapping.Loader:
+    entities = record.entities
     participant, ses = mapping.get_add_participant_session(
         session=session,
         participant_id=entities.get("sub"),
@@ -80,30 +84,41 @@ def parse_diffusion(src: Path, session: orm.Session) -> None:
     for key in ["ses", "sub"]:
         entities.pop(key, None)
 
-    meta = utils.get_meta_from_path(src)
-    path = str(src.absolute())
-
-    dataset = models.Dataset.from_session(session)
-
-    diffusion = models.Diffusion(
-        dataset=dataset,
+    loader = mapping.Loader.from_session(session)
+    loader.add_file(
+        models.Diffusion,
+        record,
+        dataset=mapping.get_dataset(session),
         participant=participant,
-        session=ses,
-        extra=meta,
-        path=path,
-        size=src.stat().st_size,
-        mtime=src.stat().st_mtime,
-        **entities,  # type: ignore
+        ses=ses,
+        extra=record.extra,
+        **entities,
+        **values,
     )
-    btable = models.B.from_dwi(dwi=diffusion)
-    session.add_all(*[btable, diffusion])
+    return loader
+
+
+def write_diffusion(record: records.Diffusion, session: orm.Session) -> None:
+    loader = _add_diffusion(record, session)
+    if record.btable is not None:
+        loader.add_frame(models.B, models.B.frame_from_btable(record.path, record.btable))
+
+
+def write_diffusion_packed(record: records.Diffusion, session: orm.Session) -> None:
+    """As write_diffusion, but with the b-table packed into diffusion.btable instead of bvalbvec rows"""
+    _add_diffusion(record, session, btable=None if record.btable is None else utils.pack_btable(record.btable))
+
 
+parse_diffusion = mapping.Parser(read=read_diffusion, write=write_diffusion)
+parse_diffusion_packed = mapping.Parser(read=read_diffusion, write=write_diffusion_packed)
 
-def parse_anat(src: Path, session: orm.Session) -> None:
-    if mapping.is_file_in_session(src, session):
-        return
 
-    entities = utils.parse_entities(src)
+def read_anat(entry: crawler.Entry) -> records.File:
+    return records.File.from_entry(entry, sidecar=True)
+
+
+def write_anat(record: records.File, session: orm.Session) -> None:
+    entities = record.entities
     participant, ses = mapping.get_add_participant_session(
         session=session,
         participant_id=entities.get("sub"),
@@ -112,30 +127,29 @@ def parse_anat(src: Path, session: orm.Session) -> None:
     for key in ["ses", "sub"]:
         entities.pop(key, None)
 
-    meta = utils.get_meta_from_path(src)
-    path = str(src.absolute())
+    mapping.Loader.from_session(session).add_file(
+        models.Anat,
+        record,
+        dataset=mapping.get_dataset(session),
+        participant=participant,
+        ses=ses,
+        extra=record.extra,
+        **entities,
+    )
 
-    dataset = models.Dataset.from_session(session)
 
-    session.add(
-        models.Anat(
-            dataset=dataset,
-            participant=participant,
-            session=ses,
-            extra=meta,
-            path=path,
-            size=src.stat().st_size,
-            mtime=src.stat().st_mtime,
-            **entities,  # type: ignore
-        )
-    )
+parse_anat = mapping.Parser(read=read_anat, write=write_anat)
 
 
-def parse_fmap(src: Path, session: orm.Session) -> None:
-    if mapping.is_file_in_session(src, session):
-        return
+def read_fmap(entry: crawler.Entry) -> records.FieldMap:
+    record = records.FieldMap.from_entry(entry, sidecar=True)
+    ifors: list[str] = record.extra.get("IntendedFor", []) if isinstance(record.extra, dict) else []
+    record.intended_for = list(dict.fromkeys(Path(ifor).name for ifor in ifors))
+    return record
 
-    entities = utils.parse_entities(src)
+
+def write_fmap(record: records.FieldMap, session: orm.Session) -> None:
+    entities = record.entities
     participant, ses = mapping.get_add_participant_session(
         session=session,
         participant_id=entities.get("sub"),
@@ -144,67 +158,69 @@ def parse_fmap(src: Path, session: orm.Session) -> None:
     for key in ["ses", "sub"]:
         entities.pop(key, None)
 
-    meta = utils.get_meta_from_path(src)
-    path = str(src.absolute())
+    loader = mapping.Loader.from_session(session)
+    loader.add_file(
+        models.FieldMap,
+        record,
+        dataset=mapping.get_dataset(session),
+        participant=participant,
+        ses=ses,
+        extra=record.extra,
+        **entities,
+    )
+    # the targets may not have been added yet, so they are linked after the crawl (mapping.link_fieldmaps)
+    loader.add_all(
+        models.fieldmap_intended_for,
+        ({"fieldmap_path": record.path, "basename": basename} for basename in record.intended_for),
+    )
 
-    dataset = models.Dataset.from_session(session)
 
-    files = []
-    for ifor in utils.get_ifor_from_niigz(src):
-        try:
-            files.append(models.File.from_pathname_session(ifor, session=session))
-        except exc.NoResultFound:
-            logging.warning(f"FieldMap target {ifor} not in database")
+parse_fmap = mapping.Parser(read=read_fmap, write=write_fmap)
 
-    session.add(
-        models.FieldMap(
-            dataset=dataset,
-            participant=participant,
-            session=ses,
-            extra=meta,
-            path=path,
-            files=files,
-            size=src.stat().st_size,
-            mtime=src.stat().st_mtime,
-            **entities,  # type: ignore
-        )
+
+def read_dataset(entry: crawler.Entry) -> records.DatasetDescription:
+    src = Path(entry.path)
+    description: dict[str, str] = utils.read_json(src)
+    return records.DatasetDescription.from_entry(
+        entry,
+        entities=converters_utils.parse_a2cps_entities(src),
+        name=description.get("Name"),
+        bids_version=description.get("BIDSVersion"),
     )
 
 
-def parse_dataset(src: Path, session: orm.Session) -> None:
-    # two scenarios:
-    # 1. we're here because we're trying to add a dataset
-    # 2. we're trying to add the dataset_description.json file
-    #     (and dataset already in session)
+def write_dataset(record: records.DatasetDescription, session: orm.Session) -> None:
+    # the first dataset_description.json creates the dataset,
+    # and every one of them is also added as a file
     try:
-        dataset = models.Dataset.from_session(session=session)
-        entities = converters_utils.parse_a2cps_entities(src)
-        participant, ses = mapping.get_add_participant_session(
-            session=session,
-            participant_id=entities.get("sub"),
-            session_id=entities.get("ses"),
-        )
-
-        session.add(
-            models.File(
-                dataset=dataset,
-                path=str(src.absolute()),
-                size=src.stat().st_size,
-                mtime=src.stat().st_mtime,
-                extension=".json",
-                participant=participant,
-                session=ses,
-            )
-        )
-
+        dataset = mapping.get_dataset(session)
     except exc.NoResultFound:
-        dataset = models.Dataset.from_file(src)
+        dataset = models.Dataset(name=record.name, bids_version=record.bids_version)
         session.add(dataset)
 
+    entities = record.entities
+    participant, ses = mapping.get_add_participant_session(
+        session=session,
+        participant_id=entities.get("sub"),
+        session_id=entities.get("ses"),
+    )
+
+    mapping.Loader.from_session(session).add_file(
+        models.File,
+        record,
+        dataset=dataset,
+        participant=participant,
+        ses=ses,
+        extension=".json",
+    )
+
+
+parse_dataset = mapping.Parser(read=read_dataset, write=write_dataset)
+
 
-def parse_sessions(src: Path, session: orm.Session) -> None:
+def read_sessions(entry: crawler.Entry) -> records.Table:
     sessions_tbl = (
-        utils.read_bids_tsv(src)
+        utils.read_bids_tsv(Path(entry.path))
         .with_columns(
             pl.struct(pl.all().exclude(["session_id", "sub", "acquisition_week"])).alias("extra"),
         )
@@ -214,30 +230,32 @@ def parse_sessions(src: Path, session: orm.Session) -> None:
             pl.col("acquisition_week").str.to_datetime(r"%Y-%m-%d%H:%M:%S"),
         )
     )
+    return records.Table.from_entry(entry, sidecar=True, rows=sessions_tbl)
 
-    dataset = models.Dataset.from_session(session)
-
-    for ses in sessions_tbl.iter_rows(named=True):
-        session.add(
-            models.Session(
-                dataset=dataset,
-                id=utils.get_key_str(ses, "session_id"),
-                participant=session.get(
-                    models.Participant,
-                    {
-                        "id": utils.get_key_str(ses, "sub"),
-                        "dataset_id": dataset.id,
-                    },
-                ),
-                acq_time=ses.get("acquisition_week"),
-                extra=ses.get("extra"),
-            )
+
+def write_sessions(record: records.Table, session: orm.Session) -> None:
+    dataset = mapping.get_dataset(session)
+
+    # upsert, because the participant and session may already have been
+    # added by a file that was written earlier (e.g., dataset_description.json)
+    for row in record.rows.iter_rows(named=True):
+        participant = mapping.upsert_participant(session, id=utils.get_key_str(row, "sub"), dataset=dataset)
+        ses = mapping.upsert_session(
+            session,
+            id=utils.get_key_str(row, "session_id"),
+            participant=participant,
+            dataset=dataset,
         )
-    parse_file(src=src, session=session)
+        ses.acq_time = row.get("acquisition_week")
+        ses.extra = row.get("extra")
+    write_file(record, session=session)
 
 
-def parse_participants(src: Path, session: orm.Session) -> None:
-    tbl = utils.read_bids_tsv(src)
+parse_sessions = mapping.Parser(read=read_sessions, write=write_sessions)
+
+
+def read_participants(entry: crawler.Entry) -> records.Table:
+    tbl = utils.read_bids_tsv(Path(entry.path))
     participant_column = "sub" if "sub" in tbl.columns else "participant_id"
     toplevel = [participant_column]
     for col in ["age", "sex", "handedness"]:
@@ -254,33 +272,36 @@ def parse_participants(src: Path, session: orm.Session) -> None:
             .then(pl.lit("female"))
         )
 
-    tbl = tbl.with_columns(
-        pl.struct(pl.all().exclude(toplevel)).alias("extra"),
-        pl.col(participant_column).str.extract(r"(\d{5})"),
-    ).select(*toplevel, "extra")
-
-    dataset = models.Dataset.from_session(session)
-
-    for participant in tbl.iter_rows(named=True):
-        session.add(
-            models.Participant(
-                dataset=dataset,
-                id=utils.get_key_str(participant, participant_column),
-                age=participant.get("age"),
-                sex=participant.get("sex"),
-                handedness=participant.get("handedness"),
-                extra=participant.get("extra"),
-            )
+    tbl = (
+        tbl.with_columns(
+            pl.struct(pl.all().exclude(toplevel)).alias("extra"),
+            pl.col(participant_column).str.extract(r"(\d{5})"),
         )
-    parse_file(src=src, session=session)
+        .select(*toplevel, "extra")
+        .rename({participant_column: "id"})
+    )
+    return records.Table.from_entry(entry, sidecar=True, rows=tbl)
+
 
+def write_participants(record: records.Table, session: orm.Session) -> None:
+    dataset = mapping.get_dataset(session)
 
-def get_file_from_scans_filename(filename: str, session: orm.Session) -> models.File | None:
-    return session.scalar(sa.select(models.File).where(models.File.path.endswith(filename)))
+    # upsert, because the participant may already have been added
+    # by a file that was written earlier (e.g., dataset_description.json)
+    for row in record.rows.iter_rows(named=True):
+        participant = mapping.upsert_participant(session, id=utils.get_key_str(row, "id"), dataset=dataset)
+        participant.age = row.get("age")
+        participant.sex = row.get("sex")
+        participant.handedness = row.get("handedness")
+        participant.extra = row.get("extra")
+    write_file(record, session=session)
 
 
-def parse_scans(src: Path, session: orm.Session) -> None:
-    scans_tbl = utils.read_bids_tsv(src)
+parse_participants = mapping.Parser(read=read_participants, write=write_participants)
+
+
+def read_scans(entry: crawler.Entry) -> records.Table:
+    scans_tbl = utils.read_bids_tsv(Path(entry.path))
     if "acq_time" in scans_tbl.columns:
         toplevel = ["filename", "acq_time"]
         try:
@@ -297,21 +318,38 @@ def parse_scans(src: Path, session: orm.Session) -> None:
     if not all(col in toplevel for col in scans_tbl.columns):
         scans_tbl = scans_tbl.with_columns(pl.struct(pl.all().exclude(toplevel)).alias("extra"))
 
-    for scan in scans_tbl.iter_rows(named=True):
+    return records.Table.from_entry(entry, sidecar=True, rows=scans_tbl)
+
+
+def write_scans(record: records.Table, session: orm.Session) -> None:
+    # filenames are relative to the directory of the scans.tsv. Those files may not have
+    # been added yet, so the rows are staged and linked after the crawl (mapping.link_scans)
+    directory = os.path.dirname(record.path)
+    rows = []
+    for scan in record.rows.iter_rows(named=True):
         filename = utils.get_key_str(scan, "filename")
-        session.add(
-            models.Scan(
-                filename=filename,
-                acq_time=scan.get("acq_time"),
-                extra=scan.get("extra"),
-                file=get_file_from_scans_filename(filename, session),
-            )
+        rows.append(
+            {
+                "scans_path": record.path,
+                "filename": filename,
+                "path": os.path.normpath(os.path.join(directory, filename)),
+                "acq_time": scan.get("acq_time"),
+                "extra": scan.get("extra"),
+            }
         )
-    parse_file(src=src, session=session)
+    mapping.Loader.from_session(session).add_all(models.scans_row, rows)
+    write_file(record, session=session)
 
 
-def parse_transform(src: Path, session: orm.Session) -> None:
-    entities = utils.parse_entities(src)
+parse_scans = mapping.Parser(read=read_scans, write=write_scans)
+
+
+def read_transform(entry: crawler.Entry) -> records.File:
+    return records.File.from_entry(entry, sidecar=True)
+
+
+def write_transform(record: records.File, session: orm.Session) -> None:
+    entities = record.entities
     participant, ses = mapping.get_add_participant_session(
         session=session,
         participant_id=entities.get("sub"),
@@ -322,17 +360,17 @@ def parse_transform(src: Path, session: orm.Session) -> None:
     for key in ["ses", "sub", "from", "to"]:
         entities.pop(key, None)
 
-    session.add(
-        models.Transform(
-            dataset=models.Dataset.from_session(session),
-            participant=participant,
-            session=ses,
-            path=str(src.absolute()),
-            size=src.stat().st_size,
-            mtime=src.stat().st_mtime,
-            extra=utils.get_meta_from_path(src),
-            from_id=from_id,
-            to_id=to_id,
-            **entities,  # type: ignore
-        )
+    mapping.Loader.from_session(session).add_file(
+        models.Transform,
+        record,
+        dataset=mapping.get_dataset(session),
+        participant=participant,
+        ses=ses,
+        extra=record.extra,
+        from_id=from_id,
+        to_id=to_id,
+        **entities,
     )
+
+
+parse_transform = mapping.Parser(read=read_transform, write=write_transform)
@@ -1,51 +1,40 @@
-import json
 import typing
 from pathlib import Path
 
 from sqlalchemy import orm
 
-from bidsql import mapping, models, utils
+from bidsql import crawler, mapping, models, records, utils
 from bidsql.a2cps import utils as a2cps_utils
 
 
 def get_iqm(src: Path) -> dict[str, typing.Any]:
-    return json.loads(src.read_text())
+    return utils.read_json(src)
 
 
-def parse_eddyqc_qc(src: Path, session: orm.Session) -> None:
-    if mapping.is_file_in_session(src, session):
-        return
+def read_eddyqc_qc(entry: crawler.Entry) -> records.WithCompanion:
+    # read both json and pdf so that pdf is not handled by generic
+    # parse_file (which would pick up this qc.json as metadata)
+    src = Path(entry.path)
+    qcjson = records.File.from_entry(entry, extra=get_iqm(src))
+    qcpdf = records.File.from_path(src.with_suffix(".pdf"))
+    return records.WithCompanion(qcjson, qcpdf)
+
 
-    dataset = a2cps_utils.get_dataset(src)
-    session.add(dataset)
+def write_eddyqc_qc(record: records.WithCompanion, session: orm.Session) -> None:
+    qcjson, qcpdf = record
+    dataset = mapping.upsert_dataset(session, name=a2cps_utils.get_dataset_name(Path(qcjson.path)))
 
-    entities = utils.parse_entities(src)
+    entities = qcjson.entities
     participant, ses = mapping.get_add_participant_session(
         session=session,
         participant_id=entities.get("sub"),
         session_id=entities.get("ses"),
-    )
-    for key in ["ses", "sub", "modality"]:
-        entities.pop(key, None)
-
-    # add both json and pdf so that pdf is not handled by generic
-    # parse_file (which would pick up this qc.json as metadata)
-    qcjson = models.File(
         dataset=dataset,
-        participant=participant,
-        session=ses,
-        extra=get_iqm(src),
-        path=str(src.absolute()),
-        size=src.stat().st_size,
-        mtime=src.stat().st_mtime,
     )
-    pdf = src.absolute().with_suffix(".pdf")
-    qcpdf = models.File(
-        dataset=dataset,
-        participant=participant,
-        session=ses,
-        path=str(pdf),
-        size=pdf.stat().st_size,
-        mtime=pdf.stat().st_mtime,
-    )
-    session.add_all([qcjson, qcpdf])
+
+    loader = mapping.Loader.from_session(session)
+    loader.add_file(models.File, qcjson, dataset=dataset, participant=participant, ses=ses, extra=qcjson.extra)
+    loader.add_file(models.File, qcpdf, dataset=dataset, participant=participant, ses=ses)
+
+
+parse_eddyqc_qc = mapping.Parser(read=read_eddyqc_qc, write=write_eddyqc_qc)
@@ -1,189 +1,263 @@
 import re
+import typing
 from pathlib import Path
 
-import pandas as pd
+import polars as pl
 from sqlalchemy import orm
 
-from bidsql import mapping, models, utils
+from bidsql import crawler, mapping, models, records
 from bidsql.a2cps import utils as a2cps_utils
 
+# header measures to keep, by their name in the file, along with the column each goes in and its type
+type Measures = dict[str, tuple[str, type[int | float]]]
 
-def _get_int(line: str) -> int:
-    return int(re.findall(r"\d+", line)[0])
+# e.g., "# Measure BrainSeg, BrainSegVol, Brain Segmentation Volume, 1243340.000000, mm^3"
+_MEASURE = re.compile(r"# Measure (?P<structure>[^,]*), (?P<measure>[^,]*), .*, (?P<value>[^,]*), [^,]*")
 
+ASEG_MEASURES: Measures = {
+    "BrainSegVol": ("BrainSegVol", float),
+    "BrainSegVolNotVent": ("BrainSegVolNotVent", float),
+    "BrainSegVolNotVentSurf": ("BrainSegVolNotVentSurf", float),
+    "CortexVol": ("CortexVol", float),
+    "SupraTentorialVol": ("SupraTentorialVol", float),
+    "SupraTentorialVolNotVent": ("SupraTentorialVolNotVent", float),
+    "eTIV": ("eTIV", float),
+    "VentricleChoroidVol": ("VentricleChoroidVol", float),
+    "lhCortexVol": ("lhCortexVol", float),
+    "rhCortexVol": ("rhCortexVol", float),
+    "lhCerebralWhiteMatterVol": ("lhCerebralWhiteMatterVol", float),
+    "rhCerebralWhiteMatterVol": ("rhCerebralWhiteMatterVol", float),
+    "CerebralWhiteMatterVol": ("CerebralWhiteMatterVol", float),
+    "SubCortGrayVol": ("SubCortGrayVol", float),
+    "TotalGrayVol": ("TotalGrayVol", float),
+    "SupraTentorialVolNotVentVox": ("SupraTentorialVolNotVentVox", float),
+    "MaskVol": ("MaskVol", float),
+    "BrainSegVol-to-eTIV": ("BrainSegVol-to-eTIV", float),
+    "MaskVol-to-eTIV": ("Mask-to-eTIV", float),
+    "lhSurfaceHoles": ("lhSurfaceHoles", int),
+    "rhSurfaceHoles": ("rhSurfaceHoles", int),
+    "SurfaceHoles": ("SurfaceHoles", int),
+}
+APARC_MEASURES: Measures = {
+    "NumVert": ("NumVert", int),
+    "WhiteSurfArea": ("WhiteSurfArea", float),
+    "MeanThickness": ("MeanThickness", float),
+}
 
-def _get_float(line: str) -> float:
-    return float(re.findall(r"\d+.\d+", line)[0])
+# columns of the table that follows the header
+ASEG_COLUMNS: dict[str, type[pl.DataType]] = {
+    "Index": pl.Int64,
+    "SegId": pl.Int64,
+    "NVoxels": pl.Int64,
+    "Volume_mm3": pl.Float64,
+    "StructName": pl.Utf8,
+    "normMean": pl.Float64,
+    "normStdDev": pl.Float64,
+    "normMin": pl.Float64,
+    "normMax": pl.Float64,
+    "normRange": pl.Float64,
+}
+APARC_COLUMNS: dict[str, type[pl.DataType]] = {
+    "StructName": pl.Utf8,
+    "NumVert": pl.Int64,
+    "SurfArea": pl.Float64,
+    "GrayVol": pl.Float64,
+    "ThickAvg": pl.Float64,
+    "ThickStd": pl.Float64,
+    "MeanCurv": pl.Float64,
+    "GausCurv": pl.Float64,
+    "FoldInd": pl.Float64,
+    "CurvInd": pl.Float64,
+}
 
+APARC_PARCS = ("aparc", "aparc.pial", "BA_exvivo", "BA_exvivo.thresh", "aparc.DKTatlas", "aparc.a2009s")
 
-def parse_aparc(f: Path) -> pd.DataFrame:
-    return pd.read_csv(
-        f,
-        delim_whitespace=True,
-        comment="#",
-        names=[
-            "StructName",
-            "NumVert",
-            "SurfArea",
-            "GrayVol",
-            "ThickAvg",
-            "ThickStd",
-            "MeanCurv",
-            "GausCurv",
-            "FoldInd",
-            "CurvInd",
-        ],
+
+def parse_stats(src: Path, measures: Measures | None = None) -> tuple[dict[str, int | float], list[list[str]]]:
+    """Split a .stats file in one pass into its header measures and the rows of its table.
+
+    Only the header measures listed in measures are kept, or all of them (as
+    floats, under the name in the file) when measures is None.
+    """
+    header: dict[str, int | float] = {}
+    rows: list[list[str]] = []
+    for line in src.read_text().splitlines():
+        if line.startswith("#"):
+            if not (match := _MEASURE.match(line)):
+                continue
+            if measures is None:
+                header[match["measure"]] = float(match["value"])
+            elif measure := measures.get(match["measure"]):
+                name, convert = measure
+                # FreeSurfer may print counts (e.g., SurfaceHoles) with decimals
+                header[name] = convert(float(match["value"]))
+        elif line and not line.isspace():
+            rows.append(line.split())
+    return header, rows
+
+
+def _header_schema(measures: Measures) -> dict[str, type[pl.DataType]]:
+    return {name: pl.Int64 if convert is int else pl.Float64 for name, convert in measures.values()}
+
+
+def _check_rows(src: Path, rows: list[list[str]], columns: dict[str, type[pl.DataType]]) -> None:
+    if any(len(row) != len(columns) for row in rows):
+        msg = f"Expected {len(columns)} columns in every row of {src}"
+        raise RuntimeError(msg)
+
+
+def _extend(table: dict[str, list[str]], rows: list[list[str]]) -> None:
+    for values, column in zip(zip(*rows, strict=True), table.values(), strict=False):
+        column.extend(values)
+
+
+def _table(values: dict[str, list[str]], columns: dict[str, type[pl.DataType]]) -> pl.DataFrame:
+    return pl.DataFrame(values, schema=dict.fromkeys(values, pl.Utf8)).cast(columns)  # type: ignore[arg-type]
+
+
+def read_stats(
+    paths: typing.Iterable[Path], measures: Measures, columns: dict[str, type[pl.DataType]]
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """Read many .stats files into a frame of header measures (a row per file) and one of their tables.
+
+    Both frames have a path column. Table values are collected as strings from
+    every file and then cast by polars in one batch.
+    """
+    headers: list[dict[str, typing.Any]] = []
+    table: dict[str, list[str]] = {column: [] for column in columns}
+    sources: list[str] = []
+    for src in paths:
+        header, rows = parse_stats(src, measures)
+        _check_rows(src, rows, columns)
+        headers.append({"path": str(src), **header})
+        _extend(table, rows)
+        sources.extend([str(src)] * len(rows))
+
+    return (
+        pl.DataFrame(headers, schema={"path": pl.Utf8, **_header_schema(measures)}),
+        _table(table, columns).insert_column(0, pl.Series("path", sources, dtype=pl.Utf8)),
     )
 
 
-def _parse_aseg_header(f: Path) -> pd.DataFrame:
-    dfs = []
-    lines = f.read_text().splitlines()
-    for line in lines:
-        if "Measure BrainSeg, BrainSegVol" in line:
-            dfs.append(pd.DataFrame({"BrainSegVol": [_get_float(line)]}))
-        elif "Measure BrainSegNotVent, BrainSegVolNotVent" in line:
-            dfs.append(pd.DataFrame({"BrainSegVolNotVent": [_get_float(line)]}))
-        elif "Measure BrainSegNotVentSurf, BrainSegVolNotVentSurf" in line:
-            dfs.append(pd.DataFrame({"BrainSegVolNotVentSurf": [_get_float(line)]}))
-        elif "Measure Cortex, CortexVol" in line:
-            dfs.append(pd.DataFrame({"CortexVol": [_get_float(line)]}))
-        elif "Measure SupraTentorial, SupraTentorialVol" in line:
-            dfs.append(pd.DataFrame({"SupraTentorialVol": [_get_float(line)]}))
-        elif "Measure SupraTentorialNotVent, SupraTentorialVolNotVent" in line:
-            dfs.append(pd.DataFrame({"SupraTentorialVolNotVent": [_get_float(line)]}))
-        elif "Measure EstimatedTotalIntraCranialVol, eTIV" in line:
-            dfs.append(pd.DataFrame({"eTIV": [_get_float(line)]}))
-        elif "Measure VentricleChoroidVol, VentricleChoroidVol" in line:
-            dfs.append(pd.DataFrame({"VentricleChoroidVol": [_get_float(line)]}))
-        elif "Measure lhCortex, lhCortexVol" in line:
-            dfs.append(pd.DataFrame({"lhCortexVol": [_get_float(line)]}))
-        elif "Measure rhCortex, rhCortexVol" in line:
-            dfs.append(pd.DataFrame({"rhCortexVol": [_get_float(line)]}))
-        elif "Measure lhCerebralWhiteMatter, lhCerebralWhiteMatterVol" in line:
-            dfs.append(pd.DataFrame({"lhCerebralWhiteMatterVol": [_get_float(line)]}))
-        elif "Measure rhCerebralWhiteMatter, rhCerebralWhiteMatterVol" in line:
-            dfs.append(pd.DataFrame({"rhCerebralWhiteMatterVol": [_get_float(line)]}))
-        elif "Measure CerebralWhiteMatter, CerebralWhiteMatterVol" in line:
-            dfs.append(pd.DataFrame({"CerebralWhiteMatterVol": [_get_float(line)]}))
-        elif "Measure SubCortGray, SubCortGrayVol" in line:
-            dfs.append(pd.DataFrame({"SubCortGrayVol": [_get_float(line)]}))
-        elif "Measure TotalGray, TotalGrayVol" in line:
-            dfs.append(pd.DataFrame({"TotalGrayVol": [_get_float(line)]}))
-        elif "Measure SupraTentorialNotVentVox, SupraTentorialVolNotVentVox" in line:
-            dfs.append(pd.DataFrame({"SupraTentorialVolNotVentVox": [_get_float(line)]}))
-        elif "Measure Mask, MaskVol" in line:
-            dfs.append(pd.DataFrame({"MaskVol": [_get_float(line)]}))
-        elif "BrainSegVol-to-eTIV, BrainSegVol-to-eTIV" in line:
-            dfs.append(pd.DataFrame({"BrainSegVol-to-eTIV": [_get_float(line)]}))
-        elif "MaskVol-to-eTIV" in line:
-            dfs.append(pd.DataFrame({"Mask-to-eTIV": [_get_float(line)]}))
-        elif "lhSurfaceHoles" in line:
-            dfs.append(pd.DataFrame({"lhSurfaceHoles": [_get_int(line)]}))
-        elif "rhSurfaceHoles" in line:
-            dfs.append(pd.DataFrame({"rhSurfaceHoles": [_get_int(line)]}))
-        elif "SurfaceHoles, SurfaceHoles" in line:
-            dfs.append(pd.DataFrame({"SurfaceHoles": [_get_int(line)]}))
-
-    return pd.concat(dfs, axis=1).reset_index(drop=True)
-
-
-def _parse_aparc_header(f: Path) -> pd.DataFrame:
-    dfs = []
-
-    lines = f.read_text().splitlines()
-    for line in lines:
-        if "Measure Cortex, NumVert" in line:
-            dfs.append(pd.DataFrame({"NumVert": [_get_int(line)]}))
-        elif "Measure Cortex, WhiteSurfArea" in line:
-            dfs.append(pd.DataFrame({"WhiteSurfArea": [_get_float(line)]}))
-        elif "Measure Cortex, MeanThickness" in line:
-            dfs.append(pd.DataFrame({"MeanThickness": [_get_float(line)]}))
-    return pd.concat(dfs, axis=1).reset_index(drop=True)
-
-
-def parse_all_headers(root: Path) -> pd.DataFrame:
+def parse_aparc(f: Path) -> pl.DataFrame:
+    return read_stats([f], APARC_MEASURES, APARC_COLUMNS)[1].drop("path")
+
+
+def parse_aseg(f: Path) -> pl.DataFrame:
+    return read_stats([f], ASEG_MEASURES, ASEG_COLUMNS)[1].drop("path")
+
+
+def parse_all_headers(root: Path) -> pl.DataFrame:
+    """The aseg.stats and lh.aparc.stats measures of every subject directory in root, a row for each"""
     headers = []
     for subsesdir in root.glob("sub*"):
-        aseg = _parse_aseg_header(subsesdir / "stats" / "aseg.stats")
-        aparc = _parse_aparc_header(subsesdir / "stats" / "lh.aparc.stats")
-        headers.append(pd.concat([aseg, aparc]))
-
-    return pd.concat(headers).reset_index(drop=True)
-
-
-def parse_aseg(f: Path) -> pd.DataFrame:
-    d = pd.read_csv(
-        f,
-        delim_whitespace=True,
-        comment="#",
-        names=[
-            "Index",
-            "SegId",
-            "NVoxels",
-            "Volume_mm3",
-            "StructName",
-            "normMean",
-            "normStdDev",
-            "normMin",
-            "normMax",
-            "normRange",
-        ],
+        aseg, _ = parse_stats(subsesdir / "stats" / "aseg.stats", ASEG_MEASURES)
+        aparc, _ = parse_stats(subsesdir / "stats" / "lh.aparc.stats", APARC_MEASURES)
+        headers.append({"subject": subsesdir.name, **aseg, **aparc})
+
+    schema: dict[str, type[pl.DataType]] = {
+        "subject": pl.Utf8,
+        **_header_schema(ASEG_MEASURES),
+        **_header_schema(APARC_MEASURES),
+    }
+    return pl.DataFrame(headers, schema=schema)
+
+
+def parse_all_aparc(root: Path) -> pl.DataFrame:
+    paths = [
+        subsesdir / "stats" / f"{hemi}.{parc}.stats"
+        for subsesdir in root.glob("sub*")
+        for hemi in ["lh", "rh"]
+        for parc in APARC_PARCS
+    ]
+    _, table = read_stats(paths, APARC_MEASURES, APARC_COLUMNS)
+    return table.with_columns(
+        hemisphere=pl.col("path").str.extract(r"([lr]h)\.[^/]*\.stats$"),
+        parc=pl.col("path").str.extract(r"[lr]h\.([^/]*)\.stats$"),
     )
-    return d
 
 
-def parse_all_aparc(root: Path) -> pd.DataFrame:
-    aparc = []
-    for subsesdir in root.glob("sub*"):
-        for hemi in ["lh", "rh"]:
-            for parc in [
-                "aparc",
-                "aparc.pial",
-                "BA_exvivo",
-                "BA_exvivo.thresh",
-                "aparc.DKTatlas",
-                "aparc.a2009s",
-            ]:
-                aparc.append(
-                    parse_aparc(subsesdir / "stats" / f"{hemi}.{parc}.stats").assign(hemisphere=hemi, parc=parc)
-                )
-
-    return pd.concat(aparc, ignore_index=True)
-
-
-def parse_all_aseg(root: Path) -> pd.DataFrame:
-    aseg = []
-    for subsesdir in root.glob("sub*"):
-        aseg.append(parse_aseg(subsesdir / "stats" / "aseg.stats").assign(seg="aseg"))
-        aseg.append(parse_aseg(subsesdir / "stats" / "wmparc.stats").assign(seg="wmparc"))
+def parse_all_aseg(root: Path) -> pl.DataFrame:
+    paths = [subsesdir / "stats" / f"{seg}.stats" for subsesdir in root.glob("sub*") for seg in ["aseg", "wmparc"]]
+    _, table = read_stats(paths, ASEG_MEASURES, ASEG_COLUMNS)
+    return table.with_columns(seg=pl.col("path").str.extract(r"([^/]*)\.stats$"))
 
-    return pd.concat(aseg, ignore_index=True)
 
+def read_freesurfer(entry: crawler.Entry) -> records.File:
+    return records.File.from_entry(entry, entities=a2cps_utils.parse_a2cps_entities(Path(entry.path)))
 
-def parse_freesurfer(src: Path, session: orm.Session) -> None:
-    if mapping.is_file_in_session(src, session):
-        return
 
-    dataset = a2cps_utils.get_dataset(src)
-    session.add(dataset)
+def _add_file(record: records.File, session: orm.Session) -> mapping.Loader:
+    dataset = mapping.upsert_dataset(session, name=a2cps_utils.get_dataset_name(Path(record.path)))
 
-    entities = utils.parse_entities(src)
+    entities = record.entities
     participant, ses = mapping.get_add_participant_session(
         session=session,
         participant_id=entities.get("sub"),
         session_id=entities.get("ses"),
+        dataset=dataset,
     )
-    for key in ["ses", "sub", "modality"]:
-        entities.pop(key, None)
-
-    session.add(
-        models.File(
-            dataset=dataset,
-            participant=participant,
-            session=ses,
-            path=str(src.absolute()),
-            size=src.stat().st_size,
-            mtime=src.stat().st_mtime,
-        )
+
+    loader = mapping.Loader.from_session(session)
+    loader.add_file(models.File, record, dataset=dataset, participant=participant, ses=ses)
+    return loader
+
+
+def write_freesurfer(record: records.File, session: orm.Session) -> None:
+    _add_file(record, session)
+
+
+parse_freesurfer = mapping.Parser(read=read_freesurfer, write=write_freesurfer)
+
+
+def _read_table(src: Path, columns: dict[str, type[pl.DataType]]) -> tuple[dict[str, int | float], pl.DataFrame]:
+    measures, rows = parse_stats(src)
+    _check_rows(src, rows, columns)
+    table: dict[str, list[str]] = {column: [] for column in columns}
+    _extend(table, rows)
+    return measures, _table(table, columns)
+
+
+# the frames for the tables are built here, in the readers, so that the writer only has to load them
+
+
+def read_segmentation(entry: crawler.Entry) -> records.Stats:
+    src = Path(entry.path)
+    measures, table = _read_table(src, ASEG_COLUMNS)
+    return records.Stats.from_entry(
+        entry,
+        entities=a2cps_utils.parse_a2cps_entities(src),
+        measures=models.FreeSurferMeasure.frame_from_measures(entry.path, measures),
+        table=models.FreeSurferSegmentation.frame_from_table(entry.path, src.name.removesuffix(".stats"), table),
     )
+
+
+def write_segmentation(record: records.Stats, session: orm.Session) -> None:
+    loader = _add_file(record, session)
+    loader.add_frame(models.FreeSurferMeasure, record.measures)
+    loader.add_frame(models.FreeSurferSegmentation, record.table)
+
+
+parse_segmentation = mapping.Parser(read=read_segmentation, write=write_segmentation)
+
+
+def read_parcellation(entry: crawler.Entry) -> records.Stats:
+    src = Path(entry.path)
+    measures, table = _read_table(src, APARC_COLUMNS)
+    # e.g., lh.aparc.DKTatlas.stats
+    hemi, _, parc = src.name.removesuffix(".stats").partition(".")
+    return records.Stats.from_entry(
+        entry,
+        entities=a2cps_utils.parse_a2cps_entities(src),
+        measures=models.FreeSurferMeasure.frame_from_measures(entry.path, measures),
+        table=models.FreeSurferParcellation.frame_from_table(entry.path, "L" if hemi == "lh" else "R", parc, table),
+    )
+
+
+def write_parcellation(record: records.Stats, session: orm.Session) -> None:
+    loader = _add_file(record, session)
+    loader.add_frame(models.FreeSurferMeasure, record.measures)
+    loader.add_frame(models.FreeSurferParcellation, record.table)
+
+
+parse_parcellation = mapping.Parser(read=read_parcellation, write=write_parcellation)
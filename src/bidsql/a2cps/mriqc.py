@@ -1,23 +1,23 @@
-import json
 import typing
 from pathlib import Path
 
 from sqlalchemy import orm
 
-from bidsql import mapping, models, utils
+from bidsql import crawler, mapping, models, records, utils
 
 
 def get_iqm_from_json(src: Path) -> dict[str, typing.Any]:
-    vals: dict = json.loads(src.read_text())
+    vals: dict = utils.read_json(src)
 
     return vals
 
 
-def parse_mriqc(src: Path, session: orm.Session) -> None:
-    if mapping.is_file_in_session(src, session):
-        return
+def read_mriqc(entry: crawler.Entry) -> records.File:
+    return records.File.from_entry(entry, extra=get_iqm_from_json(Path(entry.path)))
 
-    entities = utils.parse_entities(src)
+
+def write_mriqc(record: records.File, session: orm.Session) -> None:
+    entities = record.entities
     participant, ses = mapping.get_add_participant_session(
         session=session,
         participant_id=entities.get("sub"),
@@ -26,17 +26,15 @@ def parse_mriqc(src: Path, session: orm.Session) -> None:
     for key in ["modality", "ses", "sub"]:
         entities.pop(key, None)
 
-    dataset = models.Dataset.from_session(session)
-
-    session.add(
-        models.File(
-            dataset=dataset,
-            participant=participant,
-            session=ses,
-            extra=get_iqm_from_json(src),
-            path=str(src.absolute()),
-            size=src.stat().st_size,
-            mtime=src.stat().st_mtime,
-            **entities,  # type: ignore
-        )
+    mapping.Loader.from_session(session).add_file(
+        models.File,
+        record,
+        dataset=mapping.get_dataset(session),
+        participant=participant,
+        ses=ses,
+        extra=record.extra,
+        **entities,
     )
+
+
+parse_mriqc = mapping.Parser(read=read_mriqc, write=write_mriqc)
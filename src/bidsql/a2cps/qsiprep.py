@@ -5,7 +5,7 @@ import polars as pl
 import polars.selectors as cs
 from sqlalchemy import orm
 
-from bidsql import mapping, models, utils
+from bidsql import crawler, mapping, models, records
 
 
 def get_iqm(src: Path) -> dict[str, typing.Any]:
@@ -16,11 +16,12 @@ def get_iqm(src: Path) -> dict[str, typing.Any]:
     return iqms[0]
 
 
-def parse_qsiprep_imageqc(src: Path, session: orm.Session) -> None:
-    if mapping.is_file_in_session(src, session):
-        return
+def read_qsiprep_imageqc(entry: crawler.Entry) -> records.File:
+    return records.File.from_entry(entry, extra=get_iqm(Path(entry.path)))
 
-    entities = utils.parse_entities(src)
+
+def write_qsiprep_imageqc(record: records.File, session: orm.Session) -> None:
+    entities = record.entities
     participant, ses = mapping.get_add_participant_session(
         session=session,
         participant_id=entities.get("sub"),
@@ -29,17 +30,15 @@ def parse_qsiprep_imageqc(src: Path, session: orm.Session) -> None:
     for key in ["ses", "sub", "modality"]:
         entities.pop(key, None)
 
-    dataset = models.Dataset.from_session(session)
-
-    session.add(
-        models.File(
-            dataset=dataset,
-            participant=participant,
-            session=ses,
-            extra=get_iqm(src),
-            path=str(src.absolute()),
-            size=src.stat().st_size,
-            mtime=src.stat().st_mtime,
-            **entities,  # type: ignore
-        )
+    mapping.Loader.from_session(session).add_file(
+        models.File,
+        record,
+        dataset=mapping.get_dataset(session),
+        participant=participant,
+        ses=ses,
+        extra=record.extra,
+        **entities,
     )
+
+
+parse_qsiprep_imageqc = mapping.Parser(read=read_qsiprep_imageqc, write=write_qsiprep_imageqc)
@@ -2,33 +2,28 @@ from pathlib import Path
 
 from sqlalchemy import orm
 
-from bidsql import mapping, models, utils
+from bidsql import crawler, mapping, models, records
 from bidsql.a2cps import utils as a2cps_utils
 
 
-def parse_synthstrip_mask(src: Path, session: orm.Session) -> None:
-    if mapping.is_file_in_session(src, session):
-        return
+def read_synthstrip_mask(entry: crawler.Entry) -> records.File:
+    return records.File.from_entry(entry)
 
-    dataset = a2cps_utils.get_dataset(src)
-    session.add(dataset)
 
-    entities = utils.parse_entities(src)
+def write_synthstrip_mask(record: records.File, session: orm.Session) -> None:
+    dataset = mapping.upsert_dataset(session, name=a2cps_utils.get_dataset_name(Path(record.path)))
+
+    entities = record.entities
     participant, ses = mapping.get_add_participant_session(
         session=session,
         participant_id=entities.get("sub"),
         session_id=entities.get("ses"),
+        dataset=dataset,
     )
-    for key in ["ses", "sub", "modality"]:
-        entities.pop(key, None)
-
-    session.add(
-        models.File(
-            dataset=dataset,
-            participant=participant,
-            session=ses,
-            path=str(src.absolute()),
-            size=src.stat().st_size,
-            mtime=src.stat().st_mtime,
-        )
+
+    mapping.Loader.from_session(session).add_file(
+        models.File, record, dataset=dataset, participant=participant, ses=ses
     )
+
+
+parse_synthstrip_mask = mapping.Parser(read=read_synthstrip_mask, write=write_synthstrip_mask)
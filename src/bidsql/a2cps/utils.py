@@ -1,7 +1,7 @@
 import re
 from pathlib import Path
 
-from bidsql import models, utils
+from bidsql import utils
 
 
 def search_for_entity(src: Path, pattern: str) -> str | None:
@@ -36,8 +36,3 @@ def get_dataset_name(src: Path) -> str:
         msg = f"Unable to extract name from {src}"
         raise AssertionError(msg)
     return name[0]
-
-
-def get_dataset(src: Path) -> models.Dataset:
-    dsname = get_dataset_name(src)
-    return models.Dataset(bids_version="", name=dsname)
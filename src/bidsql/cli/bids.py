@@ -2,7 +2,7 @@ import argparse
 import logging
 from pathlib import Path
 
-from bidsql import mapping
+from bidsql import crawler, mapping, profiles, utils, watcher
 from bidsql.a2cps import bids
 
 logging.basicConfig(
@@ -54,34 +54,97 @@ maps = (
     ),
 )
 
+# every file needs the dataset, images need their participant and session, and
+# scans.tsv lists the images. Fieldmaps and scans are linked after the crawl, so
+# their stages only fix the order in which the files are written
+stages = (
+    mapping.Stage.from_str("dataset", r"dataset_description\.json\Z"),
+    mapping.Stage.from_str("participants", r"participants\.tsv\Z", after=("dataset",)),
+    mapping.Stage.from_str("sessions", r"sessions\.tsv\Z", after=("participants",)),
+    mapping.Stage.from_str("images", r"_(bold|dwi|T1w)\.nii\.gz\Z", after=("sessions",)),
+    mapping.Stage.from_str("fieldmaps", r"_epi\.nii\.gz\Z", after=("images",)),
+    mapping.Stage.from_str("scans", r"_scans\.tsv\Z", after=("images", "fieldmaps")),
+)
+
+job_pattern = "*/bids/*V[13]"
+
 
-def main(root: Path, db: str):
-    generators = []
-    for job in root.glob("*/bids/*V[13]"):
-        generators.append(job.glob("*dataset_description.json"))
-        generators.append(job.glob("*participants.tsv"))
-        for subdir in job.glob("sub*"):
-            if subdir.is_dir():
-                generators.append(subdir.glob("*sub*sessions.tsv"))
+def main(
+    root: Path,
+    db: str,
+    packed_btable: bool = False,
+    profile: profiles.Profile = "default",
+    full: bool = False,
+    fingerprint: utils.Fingerprint | None = None,
+    watch: bool = False,
+):
+    packed_maps: tuple[mapping.File, ...] = tuple(
+        (mapping.File(pattern=m.pattern, parser=bids.parse_diffusion_packed) if m.parser is bids.parse_diffusion else m)
+        for m in maps
+    )
+    run_maps: tuple[mapping.File, ...] = packed_maps if packed_btable else maps
 
-        # add bold and dwi so that fieldmaps can be added later
-        for pattern in [
-            "*bold.nii.gz",
-            "*dwi.nii.gz",
-            "*epi.nii.gz",
-            "*T1w.nii.gz",  # need T1w explicitly so that *scans.tsv happens after
-            "*",
-        ]:
-            generators.append(job.rglob(pattern))
+    jobs = list(root.glob(job_pattern))
+    generators = [crawler.Walk(job) for job in jobs]
 
-    mapper = mapping.Mapper(maps=maps, db=db, generators=generators)
-    mapper.run()
+    mapper = mapping.Mapper(
+        maps=run_maps,
+        db=db,
+        generators=generators,
+        stages=stages,
+        roots=jobs,
+        profile=profile,
+        prune=not full,
+        fingerprint=fingerprint,
+    )
+    if watch:
+        watcher.watch(mapper, root, jobs=job_pattern)
+    else:
+        mapper.run()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("root", type=Path)
     parser.add_argument("db")
+    parser.add_argument(
+        "--packed-btable",
+        action="store_true",
+        help="store each b-table as one binary column of diffusion rather than as bvalbvec rows",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=profiles.PROFILES,
+        default="default",
+        help="how to configure SQLite connections; ingest is fastest for large loads (see bidsql.profiles)",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="stat every file, rather than skipping directories that have not changed since the last run",
+    )
+    parser.add_argument(
+        "--fingerprint",
+        choices=utils.FINGERPRINTS,
+        default=None,
+        help=(
+            "fingerprint changed files, so that one whose mtime moved but whose content did not is not parsed again."
+            " Implies --full, since the directory of such a file has mostly not changed"
+        ),
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="after the crawl, keep ingesting what changes under root until interrupted (Linux only)",
+    )
 
     args = parser.parse_args()
-    main(root=args.root, db=args.db)
+    main(
+        root=args.root,
+        db=args.db,
+        packed_btable=args.packed_btable,
+        profile=args.profile,
+        full=args.full,
+        fingerprint=args.fingerprint,
+        watch=args.watch,
+    )
@@ -1,9 +1,10 @@
 import argparse
 import logging
+import re
 from pathlib import Path
 
-from bidsql import mapping
-from bidsql.a2cps import bids
+from bidsql import crawler, mapping, profiles, utils, watcher
+from bidsql.a2cps import bids, freesufer
 
 logging.basicConfig(
     format="%(asctime)s | %(levelname)-8s  | %(message)s",
@@ -12,8 +13,9 @@ logging.basicConfig(
 )
 
 maps = (
+    # every root is under sourcedata/, so unlike the other CLIs, sourcedata is not skipped
     mapping.File.from_str(
-        src_pattern=r".*sourcedata.*|\.heudiconv|err\Z|out\Z|log\Z|bidsignore\Z",
+        src_pattern=r"\.heudiconv|err\Z|out\Z|log\Z|bidsignore\Z",
         parser=mapping.parse_nothing,
     ),
     mapping.File.from_str(
@@ -21,31 +23,88 @@ maps = (
         parser=bids.parse_dataset,
     ),
     mapping.File.from_str(
-        src_pattern=r"sub-\d{5}_ses-V[13]_T1w\.nii\.gz\Z",
-        parser=bids.parse_anat,
+        src_pattern=r"/stats/(aseg|wmparc)\.stats\Z",
+        parser=freesufer.parse_segmentation,
+    ),
+    mapping.File.from_str(
+        src_pattern=rf"/stats/[lr]h\.({'|'.join(map(re.escape, freesufer.APARC_PARCS))})\.stats\Z",
+        parser=freesufer.parse_parcellation,
     ),
     mapping.File.from_str(
         src_pattern=r".*",
-        parser=bids.parse_file,
+        parser=freesufer.parse_freesurfer,
     ),
 )
 
+stages = (mapping.Stage.from_str("dataset", r"dataset_description\.json\Z"),)
+
+job_pattern = "*/fmriprep/*V[13]/fmriprep/sourcedata/freesurfer/sub*"
+
 
-def main(root: Path, db: str):
-    generators = []
-    for job in root.glob("*/fmriprep/*V[13]/fmriprep/sourcedata/freesurfer/sub*"):
-        generators.append(job.glob("*dataset_description.json"))
-        generators.append(job.rglob("*"))
+def main(
+    root: Path,
+    db: str,
+    profile: profiles.Profile = "default",
+    full: bool = False,
+    fingerprint: utils.Fingerprint | None = None,
+    watch: bool = False,
+):
+    jobs = list(root.glob(job_pattern))
+    generators = [crawler.Walk(job) for job in jobs]
 
-    mapper = mapping.Mapper(maps=maps, db=db, generators=generators)
+    mapper = mapping.Mapper(
+        maps=maps,
+        db=db,
+        generators=generators,
+        stages=stages,
+        roots=jobs,
+        profile=profile,
+        prune=not full,
+        fingerprint=fingerprint,
+    )
 
-    mapper.run()
+    if watch:
+        watcher.watch(mapper, root, jobs=job_pattern)
+    else:
+        mapper.run()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("root", type=Path)
     parser.add_argument("db")
+    parser.add_argument(
+        "--profile",
+        choices=profiles.PROFILES,
+        default="default",
+        help="how to configure SQLite connections; ingest is fastest for large loads (see bidsql.profiles)",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="stat every file, rather than skipping directories that have not changed since the last run",
+    )
+    parser.add_argument(
+        "--fingerprint",
+        choices=utils.FINGERPRINTS,
+        default=None,
+        help=(
+            "fingerprint changed files, so that one whose mtime moved but whose content did not is not parsed again."
+            " Implies --full, since the directory of such a file has mostly not changed"
+        ),
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="after the crawl, keep ingesting what changes under root until interrupted (Linux only)",
+    )
 
     args = parser.parse_args()
-    main(root=args.root, db=args.db)
+    main(
+        root=args.root,
+        db=args.db,
+        profile=args.profile,
+        full=args.full,
+        fingerprint=args.fingerprint,
+        watch=args.watch,
+    )
@@ -2,7 +2,7 @@ import argparse
 import logging
 from pathlib import Path
 
-from bidsql import mapping
+from bidsql import crawler, mapping, profiles, utils, watcher
 from bidsql.a2cps import bids, mriqc
 
 logging.basicConfig(
@@ -31,21 +31,70 @@ maps = (
     ),
 )
 
+stages = (mapping.Stage.from_str("dataset", r"dataset_description\.json\Z"),)
 
-def main(root: Path, db: str):
+
+def main(
+    root: Path,
+    db: str,
+    profile: profiles.Profile = "default",
+    full: bool = False,
+    fingerprint: utils.Fingerprint | None = None,
+    watch: bool = False,
+):
     mapper = mapping.Mapper(
         maps=maps,
         db=db,
-        generators=[root.glob("*dataset_description.json"), root.rglob("*")],
+        generators=[crawler.Walk(root)],
+        stages=stages,
+        roots=[root],
+        profile=profile,
+        prune=not full,
+        fingerprint=fingerprint,
     )
 
-    mapper.run()
+    if watch:
+        watcher.watch(mapper, root)
+    else:
+        mapper.run()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("root", type=Path)
     parser.add_argument("db")
+    parser.add_argument(
+        "--profile",
+        choices=profiles.PROFILES,
+        default="default",
+        help="how to configure SQLite connections; ingest is fastest for large loads (see bidsql.profiles)",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="stat every file, rather than skipping directories that have not changed since the last run",
+    )
+    parser.add_argument(
+        "--fingerprint",
+        choices=utils.FINGERPRINTS,
+        default=None,
+        help=(
+            "fingerprint changed files, so that one whose mtime moved but whose content did not is not parsed again."
+            " Implies --full, since the directory of such a file has mostly not changed"
+        ),
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="after the crawl, keep ingesting what changes under root until interrupted (Linux only)",
+    )
 
     args = parser.parse_args()
-    main(root=args.root, db=args.db)
+    main(
+        root=args.root,
+        db=args.db,
+        profile=args.profile,
+        full=args.full,
+        fingerprint=args.fingerprint,
+        watch=args.watch,
+    )
@@ -0,0 +1,134 @@
+import dataclasses
+import fnmatch
+import logging
+import os
+import re
+import typing
+from collections import abc
+from concurrent import futures
+from pathlib import Path
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class Entry:
+    """A file found while crawling, with the stat result taken during the walk.
+
+    Mirrors the parts of os.DirEntry that the Mapper needs, but the stat is
+    done in the worker thread so that nothing downstream has to touch the
+    filesystem again just to learn the size or mtime. The Mapper fills in the
+    fingerprint when it is asked to take one (see utils.fingerprint).
+    """
+
+    path: str
+    name: str
+    size: int
+    mtime: float
+    fingerprint: str | None = None
+
+    @classmethod
+    def from_path(cls, src: Path) -> typing.Self:
+        stat = src.stat()
+        return cls(path=str(src.absolute()), name=src.name, size=stat.st_size, mtime=stat.st_mtime)
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class Directory:
+    """A directory listed while crawling, with its mtime and the number of entries in it."""
+
+    path: str
+    mtime: float
+    n_entries: int
+
+
+type Matcher = typing.Callable[[str], re.Match | None]
+
+# called with each directory before its files are stat'ed; returning True skips them (but not its subdirectories)
+type Pruner = typing.Callable[[Directory], bool]
+
+
+def _scan(directory: str, matcher: Matcher, prune: Pruner | None = None) -> tuple[list[Entry], list[str]]:
+    entries: list[Entry] = []
+    subdirs: list[str] = []
+    try:
+        # stat before listing, so that a file added during the listing leaves the directory looking changed
+        mtime = os.stat(directory).st_mtime
+        with os.scandir(directory) as it:
+            dirents = list(it)
+        pruned = prune is not None and prune(Directory(path=directory, mtime=mtime, n_entries=len(dirents)))
+        for dirent in dirents:
+            # symlinked directories are skipped but not descended into (like Path.rglob)
+            if dirent.is_dir():
+                if not dirent.is_symlink():
+                    subdirs.append(dirent.path)
+                continue
+            if pruned or not matcher(dirent.name):
+                continue
+            try:
+                stat = dirent.stat()
+            except FileNotFoundError:
+                logging.warning(f"Unable to stat {dirent.path}; skipping")
+                continue
+            entries.append(Entry(path=dirent.path, name=dirent.name, size=stat.st_size, mtime=stat.st_mtime))
+    except (FileNotFoundError, PermissionError, NotADirectoryError) as e:
+        logging.warning(f"Unable to scan {directory}: {e}")
+
+    return entries, subdirs
+
+
+def walk(
+    root: Path,
+    pattern: str = "*",
+    recursive: bool = True,
+    max_workers: int | None = None,
+    prune: Pruner | None = None,
+) -> abc.Generator[Entry, None, None]:
+    """Yield the files under root whose names match pattern.
+
+    Directories are listed with os.scandir in a pool of threads, which keeps many
+    metadata requests in flight at once (the main cost on network filesystems).
+    Entries are yielded as soon as their directory has been scanned, so the
+    order is not deterministic.
+
+    Args:
+        root: directory in which to start
+        pattern: fnmatch-style pattern applied to file names (as in Path.glob)
+        recursive: whether to descend into subdirectories (as in Path.rglob)
+        max_workers: size of the thread pool
+        prune: called from the pool with each directory; the files of those for which it returns True are not yielded
+    """
+    matcher = re.compile(fnmatch.translate(pattern)).match
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(_scan, str(root.absolute()), matcher, prune)}
+        while pending:
+            done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                entries, subdirs = future.result()
+                if recursive:
+                    pending.update(executor.submit(_scan, subdir, matcher, prune) for subdir in subdirs)
+                yield from entries
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class Walk:
+    """A description of a walk, which runs when iterated.
+
+    Unlike the generator returned by `walk`, a Walk can be inspected and
+    compared, which lets the Mapper record which walks have completed.
+    """
+
+    root: Path
+    pattern: str = "*"
+    recursive: bool = True
+    max_workers: int | None = None
+
+    @property
+    def key(self) -> tuple[str, str, bool]:
+        return str(self.root.absolute()), self.pattern, self.recursive
+
+    def __iter__(self) -> abc.Iterator[Entry]:
+        return self.entries()
+
+    def entries(self, prune: Pruner | None = None) -> abc.Iterator[Entry]:
+        return walk(
+            self.root, pattern=self.pattern, recursive=self.recursive, max_workers=self.max_workers, prune=prune
+        )
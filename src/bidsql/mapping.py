@@ -1,16 +1,62 @@
+import collections
+import dataclasses
+import datetime
+import functools
+import graphlib
+import io
+import itertools
+import json
 import logging
+import multiprocessing
+import os
 import re
+import time
 import typing
+import uuid
 from collections import abc
+from concurrent import futures
 from pathlib import Path
 
+import polars as pl
 import pydantic
 import sqlalchemy as sa
 from sqlalchemy import exc, orm
+from sqlalchemy.dialects import postgresql, sqlite
 
-from bidsql import models
+from bidsql import crawler, models, profiles, records, utils
 
-type Parser = typing.Callable[[Path, orm.Session], None]
+type Reader = typing.Callable[[crawler.Entry], typing.Any]
+type Writer = typing.Callable[[typing.Any, orm.Session], None]
+type Ingest = typing.Literal["orm", "bulk"]
+type Target = type[models.Base] | sa.Table
+type Task = tuple["Parser", crawler.Entry] | crawler.Walk
+type Result = tuple["Parser", crawler.Entry, typing.Any] | crawler.Walk
+
+
+class Parser(pydantic.BaseModel):
+    """A pair of functions that ingest one kind of file.
+
+    read does all of the filesystem work (stat, sidecars, tsvs) and returns a
+    picklable record, so it can run in a worker process. write turns that record
+    into rows, and only ever runs in the main process, which is the single
+    writer to the database. A Parser without a reader marks files to skip.
+    """
+
+    read: Reader | None = None
+    write: Writer | None = None
+
+    @property
+    def name(self) -> str:
+        return self.read.__name__ if self.read else "parse_nothing"
+
+    def __call__(self, src: Path, session: orm.Session) -> None:
+        if self.read is None or self.write is None:
+            logging.info(f"Skipping {src}")
+            return
+        self.write(self.read(crawler.Entry.from_path(src)), session)
+
+
+parse_nothing = Parser()
 
 
 class File(pydantic.BaseModel):
@@ -25,40 +71,1015 @@ class File(pydantic.BaseModel):
         return self.parser(src, session)
 
 
+class Stage(pydantic.BaseModel):
+    """A group of files that the Mapper writes before the files of later stages.
+
+    Each walk is bucketed by stage (a file goes to the first stage whose pattern
+    matches its path, and otherwise to a final stage for everything else), and
+    the buckets are written in an order where each stage comes after the stages
+    named in its after.
+    """
+
+    name: str
+    pattern: re.Pattern
+    after: tuple[str, ...] = ()
+
+    @classmethod
+    def from_str(cls, name: str, src_pattern: str, after: tuple[str, ...] = ()) -> typing.Self:
+        return cls(name=name, pattern=re.compile(src_pattern), after=after)
+
+
+def order_stages(stages: typing.Sequence[Stage]) -> list[Stage]:
+    """Stages sorted so that each comes after those it depends on, otherwise keeping the order they were given in"""
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        if missing := set(stage.after) - by_name.keys():
+            msg = f"Stage {stage.name} comes after unknown stages: {sorted(missing)}"
+            raise RuntimeError(msg)
+
+    sorter = graphlib.TopologicalSorter({stage.name: stage.after for stage in stages})
+    try:
+        sorter.prepare()
+    except graphlib.CycleError as e:
+        msg = f"Stages depend on each other: {e.args[1]}"
+        raise RuntimeError(msg) from e
+    position = {stage.name: i for i, stage in enumerate(stages)}
+    ordered: list[Stage] = []
+    while sorter.is_active():
+        ready = sorted(sorter.get_ready(), key=position.__getitem__)
+        ordered.extend(by_name[name] for name in ready)
+        sorter.done(*ready)
+    return ordered
+
+
+class Dispatcher:
+    """Finds the parser for a path, as `find_parser` does, but faster.
+
+    The maps are compiled once. Each top-level branch of a pattern has any
+    leading or trailing `.*` removed: `pattern.search` matches with or without
+    them, but with them it backtracks over the whole path from every starting
+    position. A branch that is only `.*` matches every path, so its parser is
+    returned without running a regex, and the maps after it are dropped. The
+    first map whose pattern matches still wins.
+    """
+
+    def __init__(self, maps: typing.Sequence[File]) -> None:
+        self.searches: list[tuple[abc.Callable[[str], re.Match | None], Parser]] = []
+        self.fallback: Parser | None = None
+        for mapping in maps:
+            branches = _split_branches(mapping.pattern.pattern)
+            if branches is None:
+                self.searches.append((mapping.pattern.search, mapping.parser))
+                continue
+            branches = [_strip_wildcards(branch) for branch in branches]
+            if "" in branches:
+                self.fallback = mapping.parser
+                break
+            self.searches.append((re.compile("|".join(branches), mapping.pattern.flags).search, mapping.parser))
+
+    def __call__(self, src: Path | str) -> Parser | None:
+        path = str(src)
+        for search, parser in self.searches:
+            if search(path):
+                return parser
+        return self.fallback
+
+
+def _split_branches(pattern: str) -> list[str] | None:
+    """Split pattern on the | that are not inside a group or character class.
+
+    Returns None for patterns that set flags inline, which apply to the whole
+    pattern and so cannot be moved around.
+    """
+    if pattern.startswith("(?") and pattern[2:3].isalpha():
+        return None
+
+    branches: list[str] = []
+    start = depth = 0
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            i += 1
+        elif in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+            # a ] right after the opening [ (or [^) is a literal
+            i += 2 if pattern[i + 1 : i + 2] == "]" else 3 if pattern[i + 1 : i + 3] == "^]" else 1
+            continue
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            branches.append(pattern[start:i])
+            start = i + 1
+        i += 1
+    branches.append(pattern[start:])
+    return branches
+
+
+def _strip_wildcards(branch: str) -> str:
+    for prefix in (".*?", ".*"):
+        if branch.startswith(prefix) and not branch.startswith(("+", "{"), len(prefix)):
+            branch = branch.removeprefix(prefix)
+            break
+    # a trailing .* is only a wildcard if its . is not escaped
+    n_backslashes = len(branch[:-2]) - len(branch[:-2].rstrip("\\"))
+    if branch.endswith(".*") and n_backslashes % 2 == 0:
+        branch = branch.removesuffix(".*")
+    return branch
+
+
+class FileIndex:
+    """In-memory copy of the (path, mtime) columns of the file table.
+
+    Loaded with a single query when the Mapper starts so that deciding whether
+    a file can be skipped is a dictionary lookup rather than a round trip to the
+    database. Files added to the session afterwards are recorded as they are
+    added (see `attach_file_index`), so later generators also skip them.
+
+    With fingerprints, the size and fingerprint columns are loaded too. A file
+    is then only current if its size also matches, and one whose mtime moved
+    but whose size and fingerprint match keeps its rows (see `has_content`).
+    """
+
+    def __init__(
+        self,
+        mtimes: dict[str, float | None],
+        sizes: dict[str, int | None] | None = None,
+        fingerprints: dict[str, str | None] | None = None,
+    ) -> None:
+        self.mtimes = mtimes
+        self.sizes = sizes
+        self.fingerprints = fingerprints
+        # new mtimes of files whose content had not changed, which the Mapper writes back
+        self.retimed: dict[str, float] = {}
+
+    @classmethod
+    def from_session(
+        cls, session: orm.Session, paths: typing.Sequence[str] | None = None, fingerprints: bool = False
+    ) -> typing.Self:
+        """The index of every file, or of those at paths"""
+        columns = [models.File.path, models.File.mtime]
+        if fingerprints:
+            columns.extend([models.File.size, models.File.fingerprint])
+        query = sa.select(*columns)
+        # (path, mtime), or (path, mtime, size, fingerprint) with fingerprints
+        rows: list[tuple[typing.Any, ...]] = []
+        if paths is None:
+            rows.extend(session.execute(query).tuples())
+        else:
+            for start in range(0, len(paths), 500):
+                chunk = paths[start : start + 500]
+                rows.extend(session.execute(query.where(models.File.path.in_(chunk))).tuples())
+        if not fingerprints:
+            return cls({path: mtime for path, mtime in rows})
+        return cls(
+            {path: mtime for path, mtime, *_ in rows},
+            sizes={path: size for path, _, size, _ in rows},
+            fingerprints={path: fingerprint for path, *_, fingerprint in rows},
+        )
+
+    def __len__(self) -> int:
+        return len(self.mtimes)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.mtimes
+
+    def is_current(self, path: str, mtime: float, size: int | None = None) -> bool:
+        if path not in self.mtimes or self.mtimes[path] != mtime:
+            return False
+        # e.g., a copy that kept the mtime of a file that did change
+        return self.sizes is None or size is None or self.sizes.get(path) == size
+
+    def has_content(self, path: str, size: int, fingerprint: str | None) -> bool:
+        """Whether path is recorded with this size and fingerprint, whatever its mtime"""
+        if self.sizes is None or self.fingerprints is None or fingerprint is None:
+            return False
+        return self.sizes.get(path) == size and self.fingerprints.get(path) == fingerprint
+
+    def add(self, path: str, mtime: float | None, size: int | None = None, fingerprint: str | None = None) -> None:
+        self.mtimes[path] = mtime
+        if self.sizes is not None and self.fingerprints is not None:
+            self.sizes[path] = size
+            self.fingerprints[path] = fingerprint
+
+    def retime(self, path: str, mtime: float) -> None:
+        self.mtimes[path] = self.retimed[path] = mtime
+
+    def discard(self, paths: abc.Iterable[str]) -> None:
+        for path in paths:
+            self.mtimes.pop(path, None)
+            self.retimed.pop(path, None)
+            if self.sizes is not None and self.fingerprints is not None:
+                self.sizes.pop(path, None)
+                self.fingerprints.pop(path, None)
+
+
+def attach_file_index(
+    session: orm.Session, paths: typing.Sequence[str] | None = None, fingerprints: bool = False
+) -> FileIndex:
+    index = FileIndex.from_session(session, paths=paths, fingerprints=fingerprints)
+    session.info["file_index"] = index
+
+    @sa.event.listens_for(session, "transient_to_pending")
+    def _record_file(_: orm.Session, instance: object) -> None:
+        if isinstance(instance, models.File):
+            index.add(instance.path, instance.mtime, size=instance.size, fingerprint=instance.fingerprint)
+
+    logging.info(f"Loaded index of {len(index)} files")
+    return index
+
+
+class DirectoryIndex:
+    """The directories recorded by the last completed run, and those listed by this one.
+
+    Adding, removing or renaming a file changes the mtime of its directory, so
+    when a walk lists a directory that still has the mtime and number of entries
+    recorded for that walk, the files in it are already in the database and are
+    neither stat'ed nor yielded (see `pruner`). Its subdirectories are still
+    listed, because changes further down do not reach its mtime. A file that is
+    rewritten in place leaves its directory alone, so picking that up takes a
+    run with prune=False (which still records the directories for later runs).
+
+    Directories are recorded per walk root, because walks from different roots
+    may use different maps (fmriprep skips the freesurfer tree inside it).
+    """
+
+    def __init__(self, recorded: dict[tuple[str, str], tuple[float, int]], prune: bool = True) -> None:
+        self.recorded = recorded
+        self.prune = prune
+        self.listed: dict[tuple[str, str], crawler.Directory] = {}
+        self.pruned: set[str] = set()
+
+    @classmethod
+    def from_session(cls, session: orm.Session, prune: bool = True) -> typing.Self:
+        table = models.Directory.__table__
+        rows = session.execute(sa.select(table.c.root, table.c.path, table.c.mtime, table.c.n_entries)).tuples()
+        return cls({(root, path): (mtime, n_entries) for root, path, mtime, n_entries in rows}, prune=prune)
+
+    def pruner(self, walk: crawler.Walk) -> crawler.Pruner:
+        root = walk.key[0]
+
+        # called from the crawler's threads, so shared state only sees single dict and set operations
+        def prune(directory: crawler.Directory) -> bool:
+            self.listed[root, directory.path] = directory
+            if self.prune and self.recorded.get((root, directory.path)) == (directory.mtime, directory.n_entries):
+                self.pruned.add(directory.path)
+                return True
+            return False
+
+        return prune
+
+    def covers(self, path: str) -> bool:
+        """Whether path is in a directory that was pruned, so the crawl did not report it"""
+        return os.path.dirname(path) in self.pruned
+
+    def save(self, session: orm.Session, roots: abc.Collection[str], chunk_size: int = 500) -> None:
+        """Replace the directories recorded for walks from roots with those they listed"""
+        table = _table(models.Directory)
+        roots = list(roots)
+        for start in range(0, len(roots), chunk_size):
+            session.execute(sa.delete(table).where(table.c.root.in_(roots[start : start + chunk_size])))
+        rows = [{"root": root, **dataclasses.asdict(directory)} for (root, _), directory in self.listed.items()]
+        for start in range(0, len(rows), chunk_size):
+            session.execute(sa.insert(table), rows[start : start + chunk_size])
+        logging.info(f"Recorded {len(rows)} directories, {len(self.pruned)} of them unchanged")
+
+
+class Loader:
+    """Collects the rows that writers produce and persists them.
+
+    With ingest="orm", each row becomes an ORM object in the session. With
+    ingest="bulk", rows are buffered as dicts per table and sent as executemany
+    INSERTs (through the ORM bulk insert, so joined-inheritance subtables are
+    filled too) once batch_size rows have accumulated, which skips the unit of
+    work. Datasets, participants and sessions are not loaded through here,
+    because writers look them up as they go. Rows for plain tables (e.g.,
+    fieldmap_file_link) and frames (see add_frame) are always buffered.
+    """
+
+    def __init__(self, session: orm.Session, ingest: Ingest = "orm", batch_size: int = 5000) -> None:
+        self.session = session
+        self.ingest = ingest
+        self.batch_size = batch_size
+        self.pending: dict[Target, list[dict[str, typing.Any]]] = {}
+        self.frames: dict[Target, list[pl.DataFrame]] = {}
+        self.n_pending = 0
+
+    @classmethod
+    def from_session(cls, session: orm.Session) -> typing.Self:
+        if not isinstance(loader := session.info.get("loader"), cls):
+            loader = session.info["loader"] = cls(session)
+        return loader
+
+    def add(self, target: Target, values: dict[str, typing.Any]) -> None:
+        if isinstance(target, type) and issubclass(target, models.File):
+            values.setdefault("modality", sa.inspect(target).polymorphic_identity)
+            if self.ingest == "bulk" and isinstance(index := self.session.info.get("file_index"), FileIndex):
+                index.add(values["path"], values.get("mtime"), values.get("size"), values.get("fingerprint"))
+
+        if self.ingest == "orm" and isinstance(target, type):
+            self.session.add(target(**values))
+            return
+
+        self.pending.setdefault(target, []).append(values)
+        self.n_pending += 1
+        if self.n_pending >= self.batch_size:
+            self.flush()
+
+    def add_all(self, target: Target, rows: abc.Iterable[dict[str, typing.Any]]) -> None:
+        for values in rows:
+            self.add(target, values)
+
+    def add_frame(self, target: Target, frame: pl.DataFrame) -> None:
+        """Buffer the rows of frame, which has one column per column of target.
+
+        Frames skip the ORM (in either ingest mode) and are concatenated per
+        table at flush, then handed to the driver as tuples, without any of
+        SQLAlchemy's type processing, so values must already be in the form
+        the database takes (e.g., JSON columns as encoded strings).
+        """
+        self.frames.setdefault(target, []).append(frame)
+        self.n_pending += frame.height
+        if self.n_pending >= self.batch_size:
+            self.flush()
+
+    def add_file(
+        self,
+        target: type[models.File],
+        record: records.File,
+        dataset: models.Dataset,
+        participant: models.Participant | None = None,
+        ses: models.Session | None = None,
+        **values: typing.Any,
+    ) -> None:
+        self.add(
+            target,
+            {
+                "path": record.path,
+                "basename": os.path.basename(record.path),
+                "size": record.size,
+                "mtime": record.mtime,
+                "fingerprint": record.fingerprint,
+                "dataset_id": dataset.id,
+                "participant_id": participant.id if participant else None,
+                "session_id": ses.id if ses else None,
+                **values,
+            },
+        )
+
+    def flush(self) -> None:
+        self.session.flush()
+        for target in sorted(self.pending.keys() | self.frames.keys(), key=_table_order):
+            if rows := self.pending.get(target):
+                # executemany needs every row to have the same keys
+                keys = set().union(*rows)
+                self.session.execute(sa.insert(target), [{key: row.get(key) for key in keys} for row in rows])
+            if frames := self.frames.get(target):
+                _insert_frame(self.session.connection(), target, pl.concat(frames, how="vertical_relaxed"))
+        self.pending.clear()
+        self.frames.clear()
+        self.n_pending = 0
+
+
+def _table(target: Target) -> sa.Table:
+    """The table of target. Every model here is mapped to a Table, though SQLAlchemy types local_table as any FROM"""
+    return target if isinstance(target, sa.Table) else typing.cast(sa.Table, sa.inspect(target).local_table)
+
+
+def _table_order(target: Target) -> int:
+    return models.Base.metadata.sorted_tables.index(_table(target))
+
+
+def _insert_frame(connection: sa.Connection, target: Target, frame: pl.DataFrame) -> None:
+    """INSERT the rows of frame with one executemany, straight to the driver (so without type processing)"""
+    compiled = sa.insert(_table(target)).compile(dialect=connection.dialect, column_keys=frame.columns)
+    if compiled.positional and compiled.positiontup is not None:
+        connection.exec_driver_sql(compiled.string, frame.select(compiled.positiontup).rows())
+    else:
+        connection.exec_driver_sql(compiled.string, frame.to_dicts())
+
+
+class CopyLoader(Loader):
+    """A Loader for PostgreSQL, which sends rows with COPY rather than INSERTs.
+
+    Every row is buffered, whatever the ingest mode. At flush, the rows of each
+    table are streamed with COPY FROM STDIN into a temporary staging table, and
+    merged from there with INSERT ... ON CONFLICT, so rows that are already
+    there are replaced rather than failing the load. This bypasses the ORM, so
+    rows of joined-inheritance classes are split between file and the subtype
+    table here. Frames are copied as they are, as with add_frame.
+    """
+
+    def __init__(self, session: orm.Session, batch_size: int = 5000) -> None:
+        super().__init__(session, ingest="bulk", batch_size=batch_size)
+
+    def flush(self) -> None:
+        self.session.flush()
+        data: dict[sa.Table, list[str]] = {}
+        for target, rows in self.pending.items():
+            for table, columns in _copy_columns(target):
+                data.setdefault(table, []).extend(
+                    "\t".join(
+                        _copy_text(_copy_value(column, row.get(key, row.get(fallback, default))))
+                        for column, key, fallback, default in columns
+                    )
+                    + "\n"
+                    for row in rows
+                )
+        for target, frames in self.frames.items():
+            table = _table(target)
+            data.setdefault(table, []).append(_copy_frame(table, pl.concat(frames, how="vertical_relaxed")))
+
+        connection = self.session.connection()
+        for table in models.Base.metadata.sorted_tables:
+            if table in data:
+                _copy_merge(connection, table, "".join(data[table]))
+        self.pending.clear()
+        self.frames.clear()
+        self.n_pending = 0
+
+
+@functools.cache
+def _copy_columns(target: Target) -> list[tuple[sa.Table, list[tuple[sa.Column, str, str, typing.Any]]]]:
+    """For each table that target fills, its columns, with the key of the value for each in a row dict.
+
+    Columns that refer to a parent table of target (e.g., anat.file_path) fall
+    back to the value of that parent column, which is what the ORM would copy
+    (the fallback of any other column is its own key). Missing values fall back
+    to the scalar default of the column, if any.
+    """
+    if isinstance(target, sa.Table):
+        return [(target, [(column, column.key, column.key, _scalar_default(column)) for column in target.columns])]
+
+    mapper = sa.inspect(target)
+    tables = []
+    # every model here is mapped to Tables, though SQLAlchemy types them as any table clause
+    for table in typing.cast(abc.Sequence[sa.Table], mapper.tables):
+        columns = []
+        for column in table.columns:
+            key = mapper.get_property_by_column(column).key
+            parents = [fk.column for fk in column.foreign_keys if fk.column.table in mapper.tables]
+            fallback = mapper.get_property_by_column(parents[0]).key if parents else key
+            columns.append((column, key, fallback, _scalar_default(column)))
+        tables.append((table, columns))
+    return tables
+
+
+def _scalar_default(column: sa.Column) -> typing.Any:
+    return column.default.arg if isinstance(column.default, sa.ColumnDefault) and column.default.is_scalar else None
+
+
+def _copy_value(column: sa.Column, value: typing.Any) -> typing.Any:
+    if value is None or isinstance(value, sa.Null):
+        return None
+    if isinstance(column.type, sa.JSON):
+        return json.dumps(value)
+    return value
+
+
+# in the text format of COPY, these are the characters that need a backslash
+_COPY_ESCAPES = {"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"}
+_COPY_TRANSLATION = str.maketrans(_COPY_ESCAPES)
+
+
+def _copy_text(value: typing.Any) -> str:
+    """A field in the text format of COPY"""
+    match value:
+        case None:
+            return "\\N"
+        case str():
+            return value.translate(_COPY_TRANSLATION)
+        case bool():
+            return "t" if value else "f"
+        case int() | float():
+            return str(value)
+        case bytes():
+            return f"\\\\x{value.hex()}"
+        case datetime.datetime() | datetime.date():
+            return value.isoformat()
+        case _:
+            return str(value).translate(_COPY_TRANSLATION)
+
+
+def _copy_frame(table: sa.Table, frame: pl.DataFrame) -> str:
+    """The rows of frame, in the text format of COPY, with one field per column of table"""
+    escaped = {
+        column: pl.col(column).cast(pl.Utf8).str.replace_many(list(_COPY_ESCAPES), list(_COPY_ESCAPES.values()))
+        for column in frame.columns
+    }
+    fields = [
+        escaped[column.name].fill_null("\\N") if column.name in escaped else pl.lit("\\N") for column in table.columns
+    ]
+    lines = frame.select(pl.concat_str(fields, separator="\t").alias("line"))
+    return "".join(f"{line}\n" for line in lines.get_column("line"))
+
+
+def _copy_merge(connection: sa.Connection, table: sa.Table, data: str) -> None:
+    """COPY data (one line per row, one field per column of table) into a staging table, then merge it into table"""
+    quote = connection.dialect.identifier_preparer.quote
+    name, stage = quote(table.name), quote(f"stage_{table.name}")
+    columns = ", ".join(quote(column.name) for column in table.columns)
+    keys = ", ".join(quote(column.name) for column in table.primary_key)
+    updates = ", ".join(
+        f"{quote(column.name)} = EXCLUDED.{quote(column.name)}" for column in table.columns if not column.primary_key
+    )
+
+    connection.exec_driver_sql(
+        f"CREATE TEMPORARY TABLE IF NOT EXISTS {stage} (LIKE {name} INCLUDING DEFAULTS) ON COMMIT DROP"
+    )
+    copy = f"COPY {stage} ({columns}) FROM STDIN"
+    cursor = connection.connection.cursor()
+    if hasattr(cursor, "copy"):
+        # psycopg 3
+        with cursor.copy(copy) as stream:
+            stream.write(data)
+    else:
+        # psycopg2
+        cursor.copy_expert(copy, io.StringIO(data))
+    cursor.close()
+
+    # DISTINCT ON, because ON CONFLICT DO UPDATE cannot update a row twice in one statement
+    connection.exec_driver_sql(
+        f"INSERT INTO {name} ({columns}) SELECT DISTINCT ON ({keys}) {columns} FROM {stage} "
+        f"ON CONFLICT ({keys}) " + (f"DO UPDATE SET {updates}" if updates else "DO NOTHING")
+    )
+    connection.exec_driver_sql(f"TRUNCATE {stage}")
+
+
+class Identities:
+    """Datasets, participants and sessions that have already been looked up.
+
+    Nearly every file needs its dataset, participant and session, but a job
+    directory holds only one of each, so they are kept here (keyed on dataset,
+    participant and session ids) rather than selected again for every file.
+    The objects belong to the session, so this is cleared whenever the session
+    is (see `commit`). On a miss, the upsert_* functions look them up with the
+    same keys, so a participant of one dataset is never reused for another.
+    """
+
+    def __init__(self) -> None:
+        self.datasets: dict[str | None, models.Dataset] = {}
+        self.participants: dict[tuple[uuid.UUID, str], models.Participant] = {}
+        self.sessions: dict[tuple[uuid.UUID, str, str], models.Session] = {}
+
+    @classmethod
+    def from_session(cls, session: orm.Session) -> typing.Self:
+        if not isinstance(identities := session.info.get("identities"), cls):
+            identities = session.info["identities"] = cls()
+        return identities
+
+    def clear(self) -> None:
+        self.datasets.clear()
+        self.participants.clear()
+        self.sessions.clear()
+
+
 class Mapper(pydantic.BaseModel):
+    """Walk the file trees, parse what is found, and load it into db.
+
+    The session is committed every commit_every_files files or every
+    commit_every_seconds seconds (whichever comes first; None disables either),
+    after which the identity map is cleared so that memory use stays flat.
+    Walks that finish are recorded as models.Checkpoint rows in the same
+    commits. If a run is interrupted, the next run over the same database skips
+    the walks it recorded, and does not look for deleted files under their roots.
+    Checkpoints are cleared once a run completes.
+
+    profile configures SQLite connections (see profiles.PRAGMAS). With
+    "ingest", the secondary indexes of a SQLite database are also dropped for
+    the run and built again once every file is in, which pays off on large
+    loads but means a full rebuild even when only a few files changed. Other
+    databases keep their indexes, since the profile does not apply to them.
+
+    With stages, the files of each walk are written stage by stage (see Stage),
+    so one walk over a tree replaces a walk per kind of file that has to come
+    first. Those files are then only written once the whole walk has finished.
+
+    Every completed run records the directories it listed. With prune, the
+    files of directories that have not changed since are skipped without a
+    stat (see DirectoryIndex); set prune=False to check every file again.
+
+    With fingerprint, files that are about to be parsed are fingerprinted first
+    (see utils.fingerprint) in a pool of threads, and the fingerprints stored.
+    A file whose size has not changed but whose mtime has (e.g., after a copy
+    that did not keep mtimes, or from a node with a skewed clock) is then only
+    parsed again if its fingerprint differs, and otherwise just gets its new
+    mtime. A file whose size changed is parsed again whatever its mtime.
+    Fingerprints turn prune off, because a file whose mtime moved is mostly in
+    a directory whose own mtime did not (e.g., after a touch, or an rsync that
+    keeps the mtimes of directories), which would be skipped without a look.
+    """
+
     maps: typing.Sequence[File]
-    generators: typing.Sequence[abc.Generator[Path, None, None]]
+    generators: typing.Sequence[crawler.Walk]
+    stages: typing.Sequence[Stage] = ()
     db: str
+    roots: typing.Sequence[Path] = ()
+    delete_chunk_size: int = 500
+    max_workers: int | None = None
+    batch_size: int = 32
+    ingest: Ingest = "orm"
+    insert_batch_size: int = 5000
+    commit_every_files: int | None = 10_000
+    commit_every_seconds: float | None = 600
+    profile: profiles.Profile = "default"
+    prune: bool = True
+    fingerprint: utils.Fingerprint | None = None
+
+    @functools.cached_property
+    def dispatcher(self) -> Dispatcher:
+        return Dispatcher(self.maps)
+
+    @functools.cached_property
+    def ordered_stages(self) -> list[Stage]:
+        return order_stages(self.stages)
 
     def run(self) -> None:
-        engine = sa.create_engine(self.db)
+        engine = profiles.create_engine(self.db, profile=self.profile)
         models.Base.metadata.create_all(engine)
-        with orm.Session(engine) as session:
-            for generator in self.generators:
-                for file in generator:
-                    if file.is_dir():
-                        continue
+        deferred = profiles.secondary_indexes() if self.profile == "ingest" and engine.dialect.name == "sqlite" else ()
+        with profiles.deferred_indexes(engine, deferred) as build_indexes, orm.Session(engine) as session:
+            index = attach_file_index(session, fingerprints=self.fingerprint is not None)
+            directories = DirectoryIndex.from_session(session, prune=self.prune and self.fingerprint is None)
+            loader = self.attach_loader(session)
+            completed = {
+                (checkpoint.root, checkpoint.pattern, checkpoint.recursive)
+                for checkpoint in session.scalars(sa.select(models.Checkpoint))
+            }
+            skipped = [walk for walk in self.generators if walk.key in completed]
+            if skipped:
+                logging.info(f"Resuming an interrupted run; skipping {len(skipped)} completed walks")
+
+            seen: set[str] = set()
+            n_written = 0
+            last_commit = time.monotonic()
+            for result in self.read(self.dispatch(index, seen, completed=completed, directories=directories)):
+                if isinstance(result, crawler.Walk):
+                    root, pattern, recursive = result.key
+                    session.merge(models.Checkpoint(root=root, pattern=pattern, recursive=recursive))
+                    continue
+
+                parser, entry, record = result
+                # an earlier writer may have added this file alongside its own (e.g., eddyqc's pdf)
+                if parser.write is None or index.is_current(entry.path, entry.mtime, entry.size):
+                    continue
+                # a file that changed is written again from scratch, so rows from the old version do not linger,
+                # along with any that its writer adds alongside it
+                if written := [path for path in record.paths if path in index]:
+                    delete_files(session, written)
+                parser.write(record, session)
+
+                n_written += 1
+                if (self.commit_every_files and n_written >= self.commit_every_files) or (
+                    self.commit_every_seconds and time.monotonic() - last_commit >= self.commit_every_seconds
+                ):
+                    commit(session)
+                    n_written = 0
+                    last_commit = time.monotonic()
+            loader.flush()
+            if index.retimed:
+                logging.info(f"Updating the mtimes of {len(index.retimed)} files with unchanged fingerprints")
+                retime_files(session, index.retimed, chunk_size=self.delete_chunk_size)
+
+            # now remove from the database anything under the crawled roots that the crawl did not find
+            if self.roots:
+                prefixes = tuple(f"{root.absolute()}{os.sep}" for root in self.roots)
+                resumed = tuple(f"{walk.root.absolute()}{os.sep}" for walk in skipped)
+                stale = [
+                    path
+                    for path in index.mtimes
+                    if path.startswith(prefixes)
+                    and not path.startswith(resumed)
+                    and path not in seen
+                    and not directories.covers(path)
+                ]
+                logging.info(f"Deleting {len(stale)} files from database")
+                delete_files(session, stale, chunk_size=self.delete_chunk_size)
+            else:
+                logging.warning("No roots given, so not checking for deleted files")
+            walked = {walk.key[0] for walk in self.generators if walk.key not in completed}
+            directories.save(session, walked, chunk_size=self.delete_chunk_size)
+
+            build_indexes(session.connection())
+            link_fieldmaps(session)
+            link_scans(session)
+
+            walk_roots = list({walk.key[0] for walk in self.generators})
+            for start in range(0, len(walk_roots), self.delete_chunk_size):
+                chunk = walk_roots[start : start + self.delete_chunk_size]
+                session.execute(sa.delete(models.Checkpoint).where(models.Checkpoint.root.in_(chunk)))
+
+            session.commit()
+            profiles.release(session.connection(), self.profile)
+        # closes the pooled connections, which releases the exclusive lock of the ingest profile
+        engine.dispose()
+
+    def attach_loader(self, session: orm.Session) -> Loader:
+        loader: Loader
+        if session.get_bind().dialect.name == "postgresql":
+            loader = CopyLoader(session, batch_size=self.insert_batch_size)
+        else:
+            loader = Loader(session, ingest=self.ingest, batch_size=self.insert_batch_size)
+        session.info["loader"] = loader
+        return loader
 
-                    attempt_map(file, self.maps, session=session)
+    def update(self, engine: sa.Engine, paths: abc.Collection[str]) -> None:
+        """Ingest the files at paths, and delete what was at the paths that are gone, in one transaction.
 
-            # now remove from the database anything referring to a file that no longer exists
-            for file in session.scalars(sa.select(models.File.path)).all():
-                if not Path(file).exists():
-                    logging.info(f"Deleting {file} from database")
-                    session.delete(file)
+        For the few paths that a watch reports (see watcher.watch), rather than a
+        crawl of the roots. Paths that are directories are left to the files in
+        them, but a directory that is gone takes every file under it along.
+        """
+        with orm.Session(engine) as session:
+            self.attach_loader(session)
+            # only the files at paths can be written, so only they need to be in the index
+            attach_file_index(session, paths=list(paths))
+            gone = [path for path in paths if not os.path.lexists(path)]
+            file_path = models.File.__table__.c.path
+            for path in gone:
+                under = sa.or_(file_path == path, file_path.startswith(f"{path}{os.sep}", autoescape=True))
+                stale = session.scalars(sa.select(file_path).where(under)).all()
+                logging.info(f"Deleting {len(stale)} files at {path} from database")
+                delete_files(session, stale, chunk_size=self.delete_chunk_size)
+
+            entries: list[crawler.Entry] = []
+            for path in paths:
+                try:
+                    if os.path.isfile(path):
+                        entries.append(crawler.Entry.from_path(Path(path)))
+                except FileNotFoundError:
+                    # removed since, which its own event will report
+                    continue
+            for entry in self.staged(Path(os.path.commonpath(paths)), entries) if self.stages else entries:
+                attempt_map(Path(entry.path), self.maps, session, mtime=entry.mtime)
 
+            commit(session)
+            link_fieldmaps(session)
+            link_scans(session)
             session.commit()
 
+    def dispatch(
+        self,
+        index: FileIndex,
+        seen: set[str],
+        completed: abc.Container[tuple[str, str, bool]] = (),
+        directories: DirectoryIndex | None = None,
+    ) -> abc.Generator[Task, None, None]:
+        """Yield a task for each file that needs to be parsed.
+
+        After the last task from a walk, the walk itself is yielded, so that
+        consumers can tell when everything that it found has been handled.
+        """
+        for walk in self.generators:
+            if walk.key in completed:
+                continue
+
+            entries = walk.entries(prune=directories.pruner(walk) if directories is not None else None)
+            if self.stages:
+                entries = self.staged(walk.root, entries)
+            if self.fingerprint is not None:
+                entries = self.fingerprinted(entries, index)
+            for entry in entries:
+                if entry.path in seen:
+                    continue
+                seen.add(entry.path)
+
+                # entries come from the crawl with absolute paths and their mtimes, so no stat is needed here
+                if index.is_current(entry.path, entry.mtime, entry.size):
+                    logging.info(f"{entry.path} already in database")
+                elif index.has_content(entry.path, entry.size, entry.fingerprint):
+                    logging.info(f"{entry.path} already in database, with another mtime")
+                    index.retime(entry.path, entry.mtime)
+                elif (parser := self.dispatcher(entry.path)) is None:
+                    logging.warning(f"Did not find parser for {entry.path}")
+                elif parser.read is None:
+                    logging.info(f"Skipping {entry.path}")
+                else:
+                    logging.info(f"Adding {entry.path} with {parser.name}")
+                    yield parser, entry
+
+            yield walk
+
+    def staged(self, root: Path, entries: abc.Iterable[crawler.Entry]) -> abc.Iterator[crawler.Entry]:
+        """The entries of a walk from root, stage by stage"""
+        stages = self.ordered_stages
+        buckets: list[list[crawler.Entry]] = [[] for _ in range(len(stages) + 1)]
+        for entry in entries:
+            i = next((i for i, stage in enumerate(stages) if stage.pattern.search(entry.path)), len(stages))
+            buckets[i].append(entry)
+        for stage, bucket in zip(stages, buckets, strict=False):
+            logging.info(f"{len(bucket)} files in stage {stage.name} of {root}")
+        return itertools.chain.from_iterable(buckets)
+
+    def fingerprinted(self, entries: abc.Iterable[crawler.Entry], index: FileIndex) -> abc.Iterator[crawler.Entry]:
+        """entries, in order, with fingerprints for those that would be parsed because they are not current"""
+        how = typing.cast(utils.Fingerprint, self.fingerprint)
+        with futures.ThreadPoolExecutor() as executor:
+            # in chunks, so that the pool has many files to read at once without holding the whole walk
+            for chunk in itertools.batched(entries, 256):
+                paths = [
+                    entry.path
+                    for entry in chunk
+                    if not index.is_current(entry.path, entry.mtime, entry.size)
+                    and (parser := self.dispatcher(entry.path)) is not None
+                    and parser.read is not None
+                ]
+                fingerprints = dict(zip(paths, executor.map(_fingerprint, paths, itertools.repeat(how)), strict=True))
+                for entry in chunk:
+                    if (fingerprint := fingerprints.get(entry.path)) is not None:
+                        entry = dataclasses.replace(entry, fingerprint=fingerprint)
+                    yield entry
+
+    def read(self, tasks: abc.Iterable[Task]) -> abc.Generator[Result, None, None]:
+        """Run the readers, yielding records in the order that the tasks arrived.
 
-def parse_nothing(src: Path, _: orm.Session) -> None:
-    logging.info(f"Skipping {src}")
+        Tasks are sent to a pool of processes in batches, with a bounded number
+        of batches in flight so that a fast crawl does not queue up the whole
+        tree in memory. With max_workers=0 everything is read in this process.
+        Walks are passed through in order.
+        """
+        if self.max_workers == 0:
+            for task in tasks:
+                if isinstance(task, crawler.Walk):
+                    yield task
+                else:
+                    parser, entry = task
+                    yield parser, entry, typing.cast(Reader, parser.read)(entry)
+            return
 
+        max_in_flight = 2 * (self.max_workers or os.cpu_count() or 1)
+        in_flight: collections.deque[tuple[tuple[Task, ...], futures.Future]] = collections.deque()
+        with futures.ProcessPoolExecutor(
+            max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            for batch in itertools.batched(tasks, self.batch_size):
+                readers = [
+                    (typing.cast(Reader, task[0].read), task[1]) for task in batch if not isinstance(task, crawler.Walk)
+                ]
+                in_flight.append((batch, executor.submit(_read_batch, readers)))
+                if len(in_flight) >= max_in_flight:
+                    yield from _collect_batch(*in_flight.popleft())
+
+            while in_flight:
+                yield from _collect_batch(*in_flight.popleft())
+
+
+def commit(session: orm.Session) -> None:
+    Loader.from_session(session).flush()
+    session.commit()
+    # nothing from before the commit is needed, so drop it rather than let the identity map grow
+    session.expunge_all()
+    Identities.from_session(session).clear()
+
+
+def _collect_batch(tasks: tuple[Task, ...], future: futures.Future) -> abc.Generator[Result, None, None]:
+    records = iter(future.result())
+    for task in tasks:
+        if isinstance(task, crawler.Walk):
+            yield task
+        else:
+            parser, entry = task
+            yield parser, entry, next(records)
+
+
+def _fingerprint(path: str, how: utils.Fingerprint) -> str | None:
+    try:
+        return utils.fingerprint(path, how)
+    except OSError as e:
+        logging.warning(f"Unable to fingerprint {path}: {e}")
+        return None
+
+
+def _read_batch(readers: list[tuple[Reader, crawler.Entry]]) -> list[typing.Any]:
+    return [read(entry) for read, entry in readers]
+
+
+def _refers_to_file_path(column: sa.Column) -> bool:
+    file_path = models.File.__table__.c.path
+    return any(fk.column is file_path or _refers_to_file_path(fk.column) for fk in column.foreign_keys)
+
+
+def retime_files(session: orm.Session, mtimes: dict[str, float], chunk_size: int = 500) -> None:
+    """Set the mtimes of files by path, leaving every other column as it is"""
+    table = _table(models.File)
+    statement = sa.update(table).where(table.c.path == sa.bindparam("file_path")).values(mtime=sa.bindparam("mtime"))
+    rows = [{"file_path": path, "mtime": mtime} for path, mtime in mtimes.items()]
+    for start in range(0, len(rows), chunk_size):
+        session.execute(statement, rows[start : start + chunk_size])
+
+
+def delete_files(session: orm.Session, paths: typing.Sequence[str], chunk_size: int = 500) -> None:
+    """Delete files by path, along with every row keyed on those paths.
+
+    The subtype tables (anat, func, ...) and the tables that hang off of them
+    (event, bvalbvec, scan, fieldmap_file_link) are cleared explicitly, children
+    first, because SQLite does not enforce the foreign key cascades by default.
+    """
+    dependents = [
+        column
+        for table in reversed(models.Base.metadata.sorted_tables)
+        for column in table.columns
+        if _refers_to_file_path(column)
+    ]
+    file_path = models.File.__table__.c.path
+    for start in range(0, len(paths), chunk_size):
+        chunk = paths[start : start + chunk_size]
+        for column in dependents:
+            session.execute(sa.delete(column.table).where(column.in_(chunk)))
+        session.execute(sa.delete(_table(models.File)).where(file_path.in_(chunk)))
+        if isinstance(index := session.info.get("file_index"), FileIndex):
+            index.discard(chunk)
+
+
+def link_fieldmaps(session: orm.Session) -> None:
+    """Link fieldmaps to the files they are intended for, in one INSERT ... SELECT.
+
+    Writers only record the names in IntendedFor (models.fieldmap_intended_for),
+    because the targets may be added later in the crawl. Here they are joined on
+    the indexed file.basename, within the dataset of the fieldmap. Links that
+    already exist are skipped, so this can run after every ingest, and it picks
+    up targets that were missing the last time.
+    """
+    intended_for = models.fieldmap_intended_for
+    link = models.fieldmap_file_link
+    fieldmap = orm.aliased(models.File)
+    target = orm.aliased(models.File)
+    targets = (
+        sa.select(intended_for.c.fieldmap_path, target.path)
+        .join(fieldmap, fieldmap.path == intended_for.c.fieldmap_path)
+        .join(target, (target.basename == intended_for.c.basename) & (target.dataset_id == fieldmap.dataset_id))
+    )
+    new = targets.where(
+        ~sa.exists().where(link.c.fieldmap_path == intended_for.c.fieldmap_path, link.c.file_path == target.path)
+    )
+    inserted = session.execute(sa.insert(link).from_select(["fieldmap_path", "file_path"], new))
+    n_linked = typing.cast(sa.CursorResult, inserted).rowcount
+    # as for the links, a target only counts when it is in the dataset of the fieldmap
+    n_missing = session.scalar(
+        sa.select(sa.func.count())
+        .select_from(intended_for)
+        .join(fieldmap, fieldmap.path == intended_for.c.fieldmap_path)
+        .where(~sa.exists().where(target.basename == intended_for.c.basename, target.dataset_id == fieldmap.dataset_id))
+    )
+    logging.info(f"Linked {n_linked} fieldmap targets")
+    if n_missing:
+        logging.warning(f"{n_missing} fieldmap targets are not in the database")
+
+
+def link_scans(session: orm.Session) -> None:
+    """Upsert the staged rows of scans.tsv files (models.scans_row) into scan, in one INSERT ... SELECT.
+
+    Rows are joined to file on the full path that each filename refers to, so
+    this is a primary key lookup. Rows whose file is not in the database yet
+    stay staged, and are linked by a later run once it is. Each scan records
+    its scans.tsv and goes with it, so a scans.tsv that changed is linked again
+    from scratch. A scan is updated when a different scans.tsv now lists its
+    file, and a file that several list takes its scan from the first by path.
+    """
+    rows = models.scans_row
+    scan = _table(models.Scan)
+    file = _table(models.File)
+    others = rows.alias()
+    first = sa.select(sa.func.min(others.c.scans_path)).where(others.c.path == rows.c.path).scalar_subquery()
+    linkable = (
+        sa.select(rows.c.path, rows.c.scans_path, rows.c.filename, rows.c.acq_time, rows.c.extra)
+        .join(file, file.c.path == rows.c.path)
+        .where(rows.c.scans_path == first)
+        .where(~sa.exists().where(scan.c.file_path == rows.c.path, scan.c.scans_path == rows.c.scans_path))
+    )
+    columns = ["file_path", "scans_path", "filename", "acq_time", "extra"]
+    dialect = session.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert = (postgresql if dialect == "postgresql" else sqlite).insert(scan)
+        statement = insert.from_select(columns, linkable).on_conflict_do_update(
+            index_elements=[scan.c.file_path], set_={column: insert.excluded[column] for column in columns[1:]}
+        )
+    else:
+        session.execute(sa.delete(scan).where(scan.c.file_path.in_(sa.select(linkable.subquery().c.path))))
+        statement = sa.insert(scan).from_select(columns, linkable)
+    n_linked = typing.cast(sa.CursorResult, session.execute(statement)).rowcount
+    n_missing = session.scalar(
+        sa.select(sa.func.count()).select_from(rows).where(~sa.exists().where(file.c.path == rows.c.path))
+    )
+    logging.info(f"Linked {n_linked} scans")
+    if n_missing:
+        logging.warning(f"{n_missing} files listed in scans.tsv are not in the database")
+
+
+def is_file_in_session(src: Path, session: orm.Session, mtime: float | None = None) -> bool:
+    if mtime is None:
+        mtime = src.stat().st_mtime
+
+    if isinstance(index := session.info.get("file_index"), FileIndex):
+        return index.is_current(str(src.absolute()), mtime)
 
-def is_file_in_session(src: Path, session: orm.Session) -> bool:
     try:
-        if (
-            existing_file := models.File.from_path_session(src, session)
-        ) and existing_file.mtime == src.stat().st_mtime:
+        if (existing_file := models.File.from_path_session(src, session)) and existing_file.mtime == mtime:
             is_in = True
         else:
             is_in = False
@@ -67,25 +1088,70 @@ def is_file_in_session(src: Path, session: orm.Session) -> bool:
     return is_in
 
 
-def attempt_map(src: Path, incoming_to_natives: typing.Sequence[File], session: orm.Session) -> None:
-    if is_file_in_session(src=src, session=session):
+def find_parser(src: Path, incoming_to_natives: typing.Sequence[File]) -> Parser | None:
+    for mapping in incoming_to_natives:
+        if mapping.pattern.search(str(src)):
+            return mapping.parser
+    return None
+
+
+def attempt_map(
+    src: Path, incoming_to_natives: typing.Sequence[File], session: orm.Session, mtime: float | None = None
+) -> None:
+    if is_file_in_session(src=src, session=session, mtime=mtime):
         logging.info(f"{src} already in database")
         return
 
-    for mapping in incoming_to_natives:
-        if mapping.pattern.search(str(src)):
-            logging.info(f"Adding {src} with {mapping.parser.__name__}")
-            return mapping.to_model(src, session=session)
+    if (parser := find_parser(src, incoming_to_natives)) is None:
+        logging.warning(f"Did not find parser for {src}")
+        return
 
-    logging.warning(f"Did not find parser for {src}")
+    logging.info(f"Adding {src} with {parser.name}")
+    if parser.read is None or parser.write is None:
+        parser(src, session)
+        return
+    record = parser.read(crawler.Entry.from_path(src))
+    # as in Mapper.run, a file that changed is written again from scratch, along with those written alongside it
+    if written := [path for path in record.paths if _file_exists(session, path)]:
+        delete_files(session, written)
+    parser.write(record, session)
+
+
+def _file_exists(session: orm.Session, path: str) -> bool:
+    if isinstance(index := session.info.get("file_index"), FileIndex):
+        return path in index
+    return bool(session.scalar(sa.select(sa.exists().where(models.File.__table__.c.path == path))))
+
+
+def get_dataset(session: orm.Session, name: str | None = None) -> models.Dataset:
+    """The dataset called name, or the only dataset when name is None.
+
+    Raises exc.NoResultFound when there is no such dataset.
+    """
+    identities = Identities.from_session(session)
+    if (dataset := identities.datasets.get(name)) is None:
+        dataset = identities.datasets[name] = models.Dataset.from_session(session, name=name)
+    return dataset
+
+
+def upsert_dataset(session: orm.Session, name: str, bids_version: str = "") -> models.Dataset:
+    try:
+        dataset = get_dataset(session, name=name)
+    except exc.NoResultFound:
+        logging.info(f"Unable to find dataset {name} in session; attempting to add")
+        dataset = Identities.from_session(session).datasets[name] = models.Dataset(name=name, bids_version=bids_version)
+        session.add(dataset)
+    return dataset
 
 
 def get_add_participant_session(
     session: orm.Session,
     participant_id: str | None = None,
     session_id: str | None = None,
+    dataset: models.Dataset | None = None,
 ) -> tuple[models.Participant | None, models.Session | None]:
-    dataset = models.Dataset.from_session(session)
+    if dataset is None:
+        dataset = get_dataset(session)
     participant = upsert_participant(session, id=participant_id, dataset=dataset) if participant_id else None
     if participant and session_id:
         ses = upsert_session(
@@ -101,12 +1167,17 @@ def get_add_participant_session(
 
 
 def upsert_participant(session: orm.Session, id: str, dataset: models.Dataset) -> models.Participant:
+    participants = Identities.from_session(session).participants
+    if (participant := participants.get((dataset.id, id))) is not None:
+        return participant
+
     try:
-        participant = models.Participant.from_session(session, id=id)
+        participant = models.Participant.from_session(session, id=id, dataset_id=dataset.id)
     except exc.NoResultFound:
         logging.info(f"Unable to find participant {id} in session; attempting to add")
         participant = models.Participant(id=id, dataset=dataset)
         session.add(participant)
+    participants[(dataset.id, id)] = participant
     return participant
 
 
@@ -116,10 +1187,15 @@ def upsert_session(
     participant: models.Participant,
     dataset: models.Dataset,
 ) -> models.Session:
+    sessions = Identities.from_session(session).sessions
+    if (ses := sessions.get((dataset.id, participant.id, id))) is not None:
+        return ses
+
     try:
-        ses = models.Session.from_session(session, id=id, participant_id=participant.id)
+        ses = models.Session.from_session(session, id=id, participant_id=participant.id, dataset_id=dataset.id)
     except Exception:
         logging.info(f"Unable to find session {id} in session; attempting to add")
         ses = models.Session(id=id, dataset=dataset, participant=participant)
         session.add(ses)
+    sessions[(dataset.id, participant.id, id)] = ses
     return ses
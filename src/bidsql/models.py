@@ -42,8 +42,9 @@ class Dataset(Base):
     id: orm.Mapped[uuid.UUID] = orm.mapped_column(primary_key=True, default_factory=uuid.uuid4, init=False)
 
     @classmethod
-    def from_session(cls, session: orm.Session) -> typing.Self:
-        dataset = session.scalars(sa.select(cls)).one()
+    def from_session(cls, session: orm.Session, name: str | None = None) -> typing.Self:
+        query = sa.select(cls) if name is None else sa.select(cls).where(cls.name == name)
+        dataset = session.scalars(query).one()
         return dataset
 
     @classmethod
@@ -64,28 +65,36 @@ class Participant(Base):
         primary_key=True,
         default=None,
     )
-    sex: orm.Mapped[fields.Sex | None] = orm.mapped_column(sa.Enum(*typing.get_args(fields.Sex)), default=None)
+    sex: orm.Mapped[fields.Sex | None] = orm.mapped_column(
+        sa.Enum(*typing.get_args(fields.Sex), name="sex"), default=None
+    )
     age: orm.Mapped[int | None] = orm.mapped_column(sa.SmallInteger, default=None)
-    handedness: orm.Mapped[int | None] = orm.mapped_column(sa.Enum(*typing.get_args(fields.Handedness)), default=None)
+    handedness: orm.Mapped[int | None] = orm.mapped_column(
+        sa.Enum(*typing.get_args(fields.Handedness), name="handedness"), default=None
+    )
     extra: orm.Mapped[dict | None] = orm.mapped_column(sa.JSON, default_factory=sa.null)
 
     dataset: orm.Mapped[Dataset | None] = orm.relationship(back_populates="participants", default=None)
+    # dataset_id is set through the dataset relationships, so only the participant id is foreign here (see File.session)
     sessions: orm.Mapped[list["Session"] | None] = orm.relationship(
         back_populates="participant",
         cascade="all, delete-orphan",
         default_factory=list,
         passive_deletes=True,
+        primaryjoin="and_(Participant.id == foreign(Session.participant_id), "
+        "Participant.dataset_id == Session.dataset_id)",
     )
     files: orm.Mapped[list["File"] | None] = orm.relationship(
         back_populates="participant",
         cascade="all, delete-orphan",
         passive_deletes=True,
         default_factory=list,
+        primaryjoin="and_(Participant.id == foreign(File.participant_id), Participant.dataset_id == File.dataset_id)",
     )
 
     @classmethod
-    def from_session(cls, session: orm.Session, id: str) -> typing.Self:
-        return session.scalars(sa.select(cls).where(cls.id == id)).one()
+    def from_session(cls, session: orm.Session, id: str, dataset_id: uuid.UUID) -> typing.Self:
+        return session.scalars(sa.select(cls).where(cls.id == id, cls.dataset_id == dataset_id)).one()
 
 
 class Session(Base):
@@ -106,33 +115,45 @@ class Session(Base):
     """
 
     __tablename__ = "session"
+    # participants are keyed on (id, dataset_id), so a reference to one needs both
+    __table_args__ = (
+        sa.ForeignKeyConstraint(
+            ["participant_id", "dataset_id"], ["participant.id", "participant.dataset_id"], ondelete="CASCADE"
+        ),
+    )
 
     id: orm.Mapped[str] = orm.mapped_column(primary_key=True)
-    participant_id: orm.Mapped[str] = orm.mapped_column(
-        sa.ForeignKey("participant.id", ondelete="CASCADE"),
-        primary_key=True,
-        default=None,
-    )
+    participant_id: orm.Mapped[str] = orm.mapped_column(primary_key=True, default=None)
     dataset_id: orm.Mapped[str] = orm.mapped_column(
         sa.ForeignKey("dataset.id", ondelete="CASCADE"),
         primary_key=True,
         default=None,
     )
-    acq_time: orm.Mapped[datetime | None] = orm.mapped_column(sa.DATETIME, default=None)
+    acq_time: orm.Mapped[datetime | None] = orm.mapped_column(sa.DateTime, default=None)
     extra: orm.Mapped[dict | None] = orm.mapped_column(sa.JSON, default_factory=sa.null)
 
     dataset: orm.Mapped[Dataset | None] = orm.relationship(back_populates="sessions", default=None)
-    participant: orm.Mapped[Participant | None] = orm.relationship(back_populates="sessions", default=None)
+    participant: orm.Mapped[Participant | None] = orm.relationship(
+        back_populates="sessions",
+        default=None,
+        primaryjoin="and_(Participant.id == foreign(Session.participant_id), "
+        "Participant.dataset_id == Session.dataset_id)",
+    )
     files: orm.Mapped[list["File"]] = orm.relationship(
         back_populates="session",
         cascade="all, delete-orphan",
         passive_deletes=True,
         default_factory=list,
+        primaryjoin="and_(Session.id == foreign(File.session_id), "
+        "Session.participant_id == File.participant_id, "
+        "Session.dataset_id == File.dataset_id)",
     )
 
     @classmethod
-    def from_session(cls, session: orm.Session, id: str, participant_id: str) -> typing.Self:
-        ses = session.scalar(sa.select(cls).where(cls.id == id).where(cls.participant_id == participant_id))
+    def from_session(cls, session: orm.Session, id: str, participant_id: str, dataset_id: uuid.UUID) -> typing.Self:
+        ses = session.scalar(
+            sa.select(cls).where(cls.id == id, cls.participant_id == participant_id, cls.dataset_id == dataset_id)
+        )
         if not isinstance(ses, cls):
             msg = f"Retrieved unexpected object: {ses=}"
             raise RuntimeError(msg)
@@ -154,6 +175,19 @@ fieldmap_file_link = sa.Table(
     ),
 )
 
+# the IntendedFor of each fieldmap, by file name, which is resolved into fieldmap_file_link once
+# the files have been added (see mapping.link_fieldmaps)
+fieldmap_intended_for = sa.Table(
+    "fieldmap_intended_for",
+    Base.metadata,
+    sa.Column(
+        "fieldmap_path",
+        sa.ForeignKey("fieldmap.file_path", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    sa.Column("basename", sa.String, primary_key=True),
+)
+
 
 class File(Base):
     __tablename__ = "file"
@@ -161,25 +195,42 @@ class File(Base):
         "polymorphic_on": "modality",
         "polymorphic_identity": "file",
     }
+    # for the usual lookups (see bidsql.query): within a participant and session, across participants by
+    # suffix, and by task. Each lookup filters with equality on a prefix of one of these
+    __table_args__ = (
+        sa.Index("ix_file_participant_session", "participant_id", "session_id", "suffix", "extension"),
+        sa.Index("ix_file_suffix", "suffix", "extension", "space", "desc"),
+        sa.Index("ix_file_task", "task", "suffix"),
+        sa.ForeignKeyConstraint(
+            ["participant_id", "dataset_id"], ["participant.id", "participant.dataset_id"], ondelete="CASCADE"
+        ),
+        sa.ForeignKeyConstraint(
+            ["session_id", "participant_id", "dataset_id"],
+            ["session.id", "session.participant_id", "session.dataset_id"],
+            ondelete="CASCADE",
+        ),
+    )
 
     path: orm.Mapped[str] = orm.mapped_column(primary_key=True)
+    # indexed, because IntendedFor and scans.tsv refer to files by name rather than by full path
+    basename: orm.Mapped[str | None] = orm.mapped_column(default=None, index=True)
 
     dataset_id: orm.Mapped[str] = orm.mapped_column(sa.ForeignKey("dataset.id", ondelete="CASCADE"), default=None)
-    participant_id: orm.Mapped[str | None] = orm.mapped_column(
-        sa.ForeignKey("participant.id", ondelete="CASCADE"), default=None
-    )
-    session_id: orm.Mapped[str | None] = orm.mapped_column(
-        sa.ForeignKey("session.id", ondelete="CASCADE"), default=None
-    )
+    participant_id: orm.Mapped[str | None] = orm.mapped_column(default=None)
+    session_id: orm.Mapped[str | None] = orm.mapped_column(default=None)
     size: orm.Mapped[int | None] = orm.mapped_column(default=None)
     mtime: orm.Mapped[float | None] = orm.mapped_column(default=None)
+    # only taken when the Mapper is asked to (see utils.fingerprint)
+    fingerprint: orm.Mapped[str | None] = orm.mapped_column(default=None)
     acq: orm.Mapped[str | None] = orm.mapped_column(default=None)
     dir: orm.Mapped[str | None] = orm.mapped_column(default=None)
     run: orm.Mapped[str | None] = orm.mapped_column(default=None)
     space: orm.Mapped[str | None] = orm.mapped_column(default=None)
     den: orm.Mapped[str | None] = orm.mapped_column(default=None)
     res: orm.Mapped[str | None] = orm.mapped_column(default=None)
-    hemi: orm.Mapped[fields.Hemi | None] = orm.mapped_column(sa.Enum(*typing.get_args(fields.Hemi)), default=None)
+    hemi: orm.Mapped[fields.Hemi | None] = orm.mapped_column(
+        sa.Enum(*typing.get_args(fields.Hemi), name="hemi"), default=None
+    )
     bval: orm.Mapped[str | None] = orm.mapped_column(default=None)
     task: orm.Mapped[str | None] = orm.mapped_column(default=None)
     desc: orm.Mapped[str | None] = orm.mapped_column(default=None)
@@ -188,9 +239,13 @@ class File(Base):
     suffix: orm.Mapped[str | None] = orm.mapped_column(default=None)
     extension: orm.Mapped[str | None] = orm.mapped_column(default=None)
 
-    extra: orm.Mapped[dict | None] = orm.mapped_column(sa.JSON, default_factory=sa.null)
+    extra: orm.Mapped[dict | None] = orm.mapped_column(sa.JSON(none_as_null=True), default_factory=sa.null)
     dataset: orm.Mapped[Dataset | None] = orm.relationship(back_populates="files", default=None)
-    participant: orm.Mapped[Participant | None] = orm.relationship(back_populates="files", default=None)
+    participant: orm.Mapped[Participant | None] = orm.relationship(
+        back_populates="files",
+        default=None,
+        primaryjoin="and_(Participant.id == foreign(File.participant_id), Participant.dataset_id == File.dataset_id)",
+    )
 
     # for details on primaryjoin, see
     # https://docs.sqlalchemy.org/en/20/orm/join_conditions.html#overlapping-foreign-keys
@@ -209,6 +264,7 @@ class File(Base):
     scan: orm.Mapped[typing.Optional["Scan"]] = orm.relationship(
         back_populates="file",
         default=None,
+        foreign_keys="Scan.file_path",
     )
 
     @classmethod
@@ -217,7 +273,7 @@ class File(Base):
 
     @classmethod
     def from_pathname_session(cls, src: Path, session: orm.Session) -> typing.Self:
-        return session.scalars(sa.select(cls).where(cls.path.contains(src.name))).one()
+        return session.scalars(sa.select(cls).where(cls.basename == src.name)).one()
 
 
 class FilePathMixin(orm.MappedAsDataclass):
@@ -231,10 +287,31 @@ class FilePathMixin(orm.MappedAsDataclass):
 class Scan(FilePathMixin, Base):
     __tablename__ = "scan"
 
+    # the scans.tsv that lists the file, so that its scans go when it changes or is deleted
+    scans_path: orm.Mapped[str | None] = orm.mapped_column(
+        sa.ForeignKey("file.path", ondelete="CASCADE"), default=None, index=True
+    )
     filename: orm.Mapped[str | None] = orm.mapped_column(default=None)
-    acq_time: orm.Mapped[datetime | None] = orm.mapped_column(sa.DATETIME, default=None)
+    acq_time: orm.Mapped[datetime | None] = orm.mapped_column(sa.DateTime, default=None)
     extra: orm.Mapped[dict | None] = orm.mapped_column(sa.JSON, default_factory=sa.null)
-    file: orm.Mapped[File | None] = orm.relationship(back_populates="scan", default=None)
+    file: orm.Mapped[File | None] = orm.relationship(back_populates="scan", default=None, foreign_keys="Scan.file_path")
+
+
+# the rows of each scans.tsv, along with the path that the filename refers to. Rows become scans
+# once that file has been added (see mapping.link_scans)
+scans_row = sa.Table(
+    "scans_row",
+    Base.metadata,
+    sa.Column(
+        "scans_path",
+        sa.ForeignKey("file.path", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    sa.Column("filename", sa.String, primary_key=True),
+    sa.Column("path", sa.String, nullable=False, index=True),
+    sa.Column("acq_time", sa.DateTime),
+    sa.Column("extra", sa.JSON),
+)
 
 
 class Anat(FilePathMixin, File):
@@ -247,12 +324,25 @@ class Anat(FilePathMixin, File):
 class Event(Base):
     __tablename__ = "event"
 
+    # row of the event within its events.tsv
+    idx: orm.Mapped[int] = orm.mapped_column(primary_key=True)
     onset: orm.Mapped[float]
     duration: orm.Mapped[float]
     extra: orm.Mapped[dict | None] = orm.mapped_column(sa.JSON, default_factory=sa.null)
     func_path: orm.Mapped[str] = orm.mapped_column(sa.ForeignKey("func.file_path"), primary_key=True, default=None)
     func: orm.Mapped[typing.Optional["Func"]] = orm.relationship(back_populates="events", default=None)
-    id: orm.Mapped[uuid.UUID] = orm.mapped_column(primary_key=True, default_factory=uuid.uuid4)
+
+    @staticmethod
+    def frame_from_events(func_path: str, events: pl.DataFrame) -> pl.DataFrame:
+        """The rows of the event table, with extra already encoded as json (see mapping.Loader.add_frame)"""
+        extra = pl.col("extra").struct.json_encode() if "extra" in events.columns else pl.lit(None, pl.Utf8)
+        return events.with_row_index(name="idx").select(
+            pl.col("idx").cast(pl.Int64),
+            pl.col("onset").cast(pl.Float64),
+            pl.col("duration").cast(pl.Float64),
+            extra.alias("extra"),
+            pl.lit(func_path).alias("func_path"),
+        )
 
 
 class FieldMap(FilePathMixin, File):
@@ -276,53 +366,29 @@ class Func(FilePathMixin, File):
 
     events: orm.Mapped[list[Event] | None] = orm.relationship(back_populates="func", default_factory=list)
 
-    def read_events(self) -> list[Event]:
-        path = Path(self.path)
-        event_path = path.parent / path.name.replace("bold.nii.gz", "events.tsv")
-        events_to_add: list[Event] = []
-        if event_path.exists():
-            events = (
-                pl.read_csv(event_path, separator="\t")
-                .with_columns(pl.struct(pl.all().exclude(["onset", "duration"])).alias("extra"))
-                .select("onset", "duration", "extra")
-            )
-            for event in events.iter_rows(named=True):
-                events_to_add.append(Event(func=self, **event))
-
-        return events_to_add
-
 
 class B(Base):
     __tablename__ = "bvalbvec"
 
     tr: orm.Mapped[int] = orm.mapped_column(primary_key=True)
-    b: orm.Mapped[int]
-    x: orm.Mapped[int]
-    y: orm.Mapped[int]
-    z: orm.Mapped[int]
+    b: orm.Mapped[float]
+    x: orm.Mapped[float]
+    y: orm.Mapped[float]
+    z: orm.Mapped[float]
 
     diffusion_path: orm.Mapped[str] = orm.mapped_column(
         sa.ForeignKey("diffusion.file_path"), primary_key=True, default=None
     )
     dwi: orm.Mapped[typing.Optional["Diffusion"]] = orm.relationship(back_populates="bvalbvecs", default=None)
 
-    @classmethod
-    def from_json(cls, dwi: "Diffusion", dwi_meta: Path) -> list[typing.Self]:
-        if (bval_path := dwi_meta.with_suffix(".bval")).exists():
-            bvals = [float(bval) for bval in bval_path.read_text().split()]
-        if (bvec_path := dwi_meta.with_suffix(".bvec")).exists():
-            bvecs = [[float(v) for v in line.split()] for line in bvec_path.read_text().splitlines()]
-        df = pl.DataFrame({"b": bvals, "x": bvecs[0], "y": bvecs[1], "z": bvecs[2]}).with_row_index(name="tr")
-
-        out: list[typing.Self] = []
-        for row in df.iter_rows(named=True):
-            out.append(cls(**row, dwi=dwi, diffusion_path=dwi.path))
-        return out
-
-    @classmethod
-    def from_dwi(cls, dwi: "Diffusion") -> list[typing.Self]:
-        meta = Path(dwi.path.removesuffix(".gz")).with_suffix(".json")
-        return cls.from_json(dwi=dwi, dwi_meta=meta)
+    @staticmethod
+    def frame_from_btable(diffusion_path: str, btable: pl.DataFrame) -> pl.DataFrame:
+        """The rows of the bvalbvec table (see mapping.Loader.add_frame)"""
+        return btable.select(
+            pl.col("tr").cast(pl.Int64),
+            pl.col("b", "x", "y", "z").cast(pl.Float64),
+            pl.lit(diffusion_path).alias("diffusion_path"),
+        )
 
 
 class Diffusion(FilePathMixin, File):
@@ -331,6 +397,8 @@ class Diffusion(FilePathMixin, File):
         "polymorphic_identity": "dwi",
     }
 
+    # the whole b-table, when it is stored here instead of as bvalbvec rows (see utils.pack_btable)
+    btable: orm.Mapped[bytes | None] = orm.mapped_column(sa.LargeBinary, default=None)
     bvalbvecs: orm.Mapped[list[B] | None] = orm.relationship(back_populates="dwi", default_factory=list)
 
 
@@ -343,3 +411,123 @@ class Transform(FilePathMixin, File):
     from_id: orm.Mapped[str | None] = orm.mapped_column(default=None)
     to_id: orm.Mapped[str | None] = orm.mapped_column(default=None)
     mode: orm.Mapped[str | None] = orm.mapped_column(default=None)
+
+
+class FreeSurferMeasure(Base):
+    """A "# Measure" line from the header of a FreeSurfer .stats file"""
+
+    __tablename__ = "freesurfer_measure"
+
+    file_path: orm.Mapped[str] = orm.mapped_column(sa.ForeignKey("file.path", ondelete="CASCADE"), primary_key=True)
+    name: orm.Mapped[str] = orm.mapped_column(primary_key=True)
+    value: orm.Mapped[float]
+
+    @staticmethod
+    def frame_from_measures(file_path: str, measures: dict[str, float]) -> pl.DataFrame:
+        return pl.DataFrame(
+            {"file_path": [file_path] * len(measures), "name": list(measures), "value": list(measures.values())},
+            schema={"file_path": pl.Utf8, "name": pl.Utf8, "value": pl.Float64},
+        )
+
+
+class FreeSurferSegmentation(Base):
+    """A row of a FreeSurfer segmentation .stats file (aseg.stats or wmparc.stats)"""
+
+    __tablename__ = "freesurfer_segmentation"
+
+    file_path: orm.Mapped[str] = orm.mapped_column(sa.ForeignKey("file.path", ondelete="CASCADE"), primary_key=True)
+    seg_id: orm.Mapped[int] = orm.mapped_column(primary_key=True)
+    seg: orm.Mapped[str]
+    struct_name: orm.Mapped[str]
+    n_voxels: orm.Mapped[int]
+    volume_mm3: orm.Mapped[float]
+    norm_mean: orm.Mapped[float | None]
+    norm_std_dev: orm.Mapped[float | None]
+    norm_min: orm.Mapped[float | None]
+    norm_max: orm.Mapped[float | None]
+    norm_range: orm.Mapped[float | None]
+
+    @staticmethod
+    def frame_from_table(file_path: str, seg: str, table: pl.DataFrame) -> pl.DataFrame:
+        """The rows of this table, from a frame with the columns of freesufer.ASEG_COLUMNS"""
+        return table.select(
+            pl.lit(file_path).alias("file_path"),
+            pl.col("SegId").alias("seg_id"),
+            pl.lit(seg).alias("seg"),
+            pl.col("StructName").alias("struct_name"),
+            pl.col("NVoxels").alias("n_voxels"),
+            pl.col("Volume_mm3").alias("volume_mm3"),
+            pl.col("normMean").alias("norm_mean"),
+            pl.col("normStdDev").alias("norm_std_dev"),
+            pl.col("normMin").alias("norm_min"),
+            pl.col("normMax").alias("norm_max"),
+            pl.col("normRange").alias("norm_range"),
+        )
+
+
+class FreeSurferParcellation(Base):
+    """A row of a FreeSurfer cortical parcellation .stats file (e.g., lh.aparc.stats)"""
+
+    __tablename__ = "freesurfer_parcellation"
+
+    file_path: orm.Mapped[str] = orm.mapped_column(sa.ForeignKey("file.path", ondelete="CASCADE"), primary_key=True)
+    struct_name: orm.Mapped[str] = orm.mapped_column(primary_key=True)
+    hemi: orm.Mapped[fields.Hemi] = orm.mapped_column(sa.Enum(*typing.get_args(fields.Hemi), name="hemi"))
+    parc: orm.Mapped[str]
+    num_vert: orm.Mapped[int]
+    surf_area: orm.Mapped[float]
+    gray_vol: orm.Mapped[float]
+    thick_avg: orm.Mapped[float]
+    thick_std: orm.Mapped[float]
+    mean_curv: orm.Mapped[float]
+    gaus_curv: orm.Mapped[float]
+    fold_ind: orm.Mapped[float]
+    curv_ind: orm.Mapped[float]
+
+    @staticmethod
+    def frame_from_table(file_path: str, hemi: fields.Hemi, parc: str, table: pl.DataFrame) -> pl.DataFrame:
+        """The rows of this table, from a frame with the columns of freesufer.APARC_COLUMNS"""
+        return table.select(
+            pl.lit(file_path).alias("file_path"),
+            pl.col("StructName").alias("struct_name"),
+            pl.lit(hemi).alias("hemi"),
+            pl.lit(parc).alias("parc"),
+            pl.col("NumVert").alias("num_vert"),
+            pl.col("SurfArea").alias("surf_area"),
+            pl.col("GrayVol").alias("gray_vol"),
+            pl.col("ThickAvg").alias("thick_avg"),
+            pl.col("ThickStd").alias("thick_std"),
+            pl.col("MeanCurv").alias("mean_curv"),
+            pl.col("GausCurv").alias("gaus_curv"),
+            pl.col("FoldInd").alias("fold_ind"),
+            pl.col("CurvInd").alias("curv_ind"),
+        )
+
+
+class Checkpoint(Base):
+    """A walk that finished during an ingest that has not (yet) completed.
+
+    Rows are committed together with the files from the walk and are cleared
+    once the Mapper finishes, so they only outlive an interrupted run.
+    """
+
+    __tablename__ = "checkpoint"
+
+    root: orm.Mapped[str] = orm.mapped_column(primary_key=True)
+    pattern: orm.Mapped[str] = orm.mapped_column(primary_key=True)
+    recursive: orm.Mapped[bool] = orm.mapped_column(primary_key=True)
+
+
+class Directory(Base):
+    """A directory listed by a walk from root in the last ingest that completed, as it was when listed.
+
+    A later walk from root that finds the directory with the same mtime and
+    number of entries skips stat'ing its files (see mapping.DirectoryIndex).
+    """
+
+    __tablename__ = "directory"
+
+    root: orm.Mapped[str] = orm.mapped_column(primary_key=True)
+    path: orm.Mapped[str] = orm.mapped_column(primary_key=True)
+    mtime: orm.Mapped[float]
+    n_entries: orm.Mapped[int]
@@ -0,0 +1,107 @@
+import contextlib
+import logging
+import typing
+from collections import abc
+
+import sqlalchemy as sa
+
+from bidsql import models
+
+Profile = typing.Literal["default", "ingest", "read"]
+
+PROFILES: tuple[Profile, ...] = typing.get_args(Profile)
+
+# PRAGMAs run on every new SQLite connection. cache_size is negative, so in KiB
+PRAGMAS: dict[Profile, dict[str, str | int]] = {
+    "default": {},
+    # WAL makes each commit an append to one file rather than a rollback journal that is written, synced
+    # and deleted, and with synchronous=NORMAL only checkpoints are synced. A crash can lose the last
+    # commits, but not corrupt the database, and checkpoints let an interrupted ingest resume. EXCLUSIVE
+    # locking keeps the WAL index in memory rather than in a -shm file, which network filesystems do not
+    # support, so nothing else can open the database until the ingest ends. The journal mode is put back
+    # once the ingest commits (see release)
+    "ingest": {
+        "locking_mode": "EXCLUSIVE",
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -256 * 1024,
+        "temp_store": "MEMORY",
+    },
+    # leaves the journal mode as it is, since changing it needs a write lock
+    "read": {
+        "synchronous": "NORMAL",
+        "cache_size": -256 * 1024,
+        "mmap_size": 1024**3,
+        "temp_store": "MEMORY",
+    },
+}
+
+
+def create_engine(db: str, profile: Profile = "default", **kwargs: typing.Any) -> sa.Engine:
+    """sa.create_engine, with the PRAGMAs of profile set on each connection to a SQLite database.
+
+    Other databases are configured on the server, so the profile only applies to SQLite.
+    """
+    engine = sa.create_engine(db, **kwargs)
+    if engine.dialect.name != "sqlite" or not (pragmas := PRAGMAS[profile]):
+        return engine
+
+    @sa.event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection: typing.Any, _: typing.Any) -> None:
+        cursor = dbapi_connection.cursor()
+        for key, value in pragmas.items():
+            cursor.execute(f"PRAGMA {key}={value}")
+        cursor.close()
+
+    logging.info(f"Connecting to {engine.url} with the {profile} profile")
+    return engine
+
+
+def release(connection: sa.Connection, profile: Profile) -> None:
+    """Put a SQLite database back in its rollback journal mode, once an ingest with profile has committed.
+
+    journal_mode=WAL is recorded in the database file, so it would outlast the
+    ingest, and every later connection would need the -wal and -shm files. The
+    WAL is checkpointed into the database first. This runs on the connection
+    that wrote, since EXCLUSIVE locking keeps any other out.
+    """
+    if connection.dialect.name != "sqlite" or PRAGMAS[profile].get("journal_mode") != "WAL":
+        return
+    connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    connection.exec_driver_sql("PRAGMA journal_mode=DELETE")
+
+
+def secondary_indexes() -> list[sa.Index]:
+    return [index for table in models.Base.metadata.sorted_tables for index in table.indexes]
+
+
+@contextlib.contextmanager
+def deferred_indexes(
+    engine: sa.Engine, indexes: abc.Sequence[sa.Index]
+) -> abc.Generator[abc.Callable[[sa.Connection], None], None, None]:
+    """Drop indexes, and yield a function that builds them again.
+
+    Building an index once, after the rows are in, is faster than keeping it
+    up to date with every INSERT. Call the function before anything that needs
+    the indexes (e.g., link_fieldmaps joins on file.basename). Any that are
+    missing on exit (because it was not called, or its transaction was rolled
+    back) are built then, so they exist again afterwards even when the ingest
+    fails.
+    """
+
+    def build(connection: sa.Connection) -> None:
+        for index in indexes:
+            index.create(connection, checkfirst=True)
+        if indexes and connection.dialect.name == "sqlite":
+            connection.exec_driver_sql("PRAGMA optimize")
+
+    if indexes:
+        logging.info(f"Deferring {len(indexes)} indexes until the end of the ingest")
+        with engine.begin() as connection:
+            for index in indexes:
+                index.drop(connection, checkfirst=True)
+    try:
+        yield build
+    finally:
+        with engine.begin() as connection:
+            build(connection)
@@ -0,0 +1,59 @@
+import typing
+from collections import abc
+
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+from bidsql import models
+
+# a value to match: None matches a missing entity, and a collection matches any of its values
+type Value = str | None | abc.Collection[str | None]
+
+# keywords named as in BIDS file names, rather than as the columns of File
+ALIASES = {"sub": "participant_id", "ses": "session_id", "dataset": "dataset_id"}
+
+
+def _column(entity: str) -> sa.ColumnElement[typing.Any]:
+    column = models.File.__table__.c.get(ALIASES.get(entity, entity))
+    if column is None or column.name == "extra":
+        msg = f"Cannot filter files by {entity}"
+        raise RuntimeError(msg)
+    return column
+
+
+def _normalize(entity: str, value: str | None) -> str | None:
+    # extensions are stored with their leading dot, but are often written without one
+    if entity == "extension" and value is not None and not value.startswith("."):
+        return f".{value}"
+    return value
+
+
+def _where(entity: str, value: Value) -> sa.ColumnElement[bool]:
+    column = _column(entity)
+    if value is None or isinstance(value, str):
+        value = _normalize(entity, value)
+        return column.is_(None) if value is None else column == value
+
+    values = {_normalize(entity, v) for v in value}
+    # IN never matches NULL, so a missing entity needs its own test
+    present = column.in_(sorted(v for v in values if v is not None))
+    return sa.or_(present, column.is_(None)) if None in values else present
+
+
+def select(**entities: Value) -> sa.Select[typing.Any]:
+    """SELECT the files whose entities match.
+
+    Each entity becomes an equality (or IN) test on a column of file, so lookups by participant and session, by
+    suffix, and by task are answered by the indexes on File.
+    """
+    return sa.select(models.File).where(*(_where(entity, value) for entity, value in entities.items()))
+
+
+def get(session: orm.Session, **entities: Value) -> abc.Sequence[models.File]:
+    """Files whose entities match, e.g., get(session, sub="10001", ses="V1", suffix="bold", extension=".nii.gz")"""
+    return session.scalars(select(**entities)).all()
+
+
+def get_paths(session: orm.Session, **entities: Value) -> abc.Sequence[str]:
+    """Paths of the files whose entities match, without loading the files themselves"""
+    return session.scalars(select(**entities).with_only_columns(models.File.path)).all()
@@ -0,0 +1,104 @@
+import dataclasses
+import typing
+from pathlib import Path
+
+import polars as pl
+
+from bidsql import crawler, utils
+
+# Records are what readers hand to writers. Readers run in worker processes,
+# so these must stay picklable: builtins and polars frames, never ORM objects.
+
+
+@dataclasses.dataclass(slots=True)
+class File:
+    path: str
+    size: int
+    mtime: float
+    entities: dict[str, str] = dataclasses.field(default_factory=dict)
+    extra: dict[str, typing.Any] | None = None
+    fingerprint: str | None = None
+
+    @classmethod
+    def from_entry(
+        cls,
+        entry: crawler.Entry,
+        entities: dict[str, str] | None = None,
+        sidecar: bool = False,
+        **kwargs: typing.Any,
+    ) -> typing.Self:
+        """Build a record from what the crawl already knows about the file.
+
+        The path, size, mtime and fingerprint come from the entry, so the file
+        is not stat'ed again. Entities are parsed from the name (once) unless
+        they are given, and with sidecar=True extra is read from the json sidecar.
+        """
+        src = Path(entry.path)
+        if entities is None:
+            entities = utils.parse_entities(src)
+        if sidecar:
+            kwargs["extra"] = utils.get_meta_from_path(src, extension=entities.get("extension"))
+        return cls(
+            path=entry.path,
+            size=entry.size,
+            mtime=entry.mtime,
+            entities=entities,
+            fingerprint=entry.fingerprint,
+            **kwargs,
+        )
+
+    @classmethod
+    def from_path(cls, src: Path, **kwargs: typing.Any) -> typing.Self:
+        return cls.from_entry(crawler.Entry.from_path(src), **kwargs)
+
+    @property
+    def paths(self) -> tuple[str, ...]:
+        """The paths of the files that writing this record adds"""
+        return (self.path,)
+
+
+class WithCompanion(typing.NamedTuple):
+    """A file along with one that is written alongside it (e.g., eddyqc's qc.pdf for its qc.json)"""
+
+    file: File
+    companion: File
+
+    @property
+    def paths(self) -> tuple[str, ...]:
+        return (self.file.path, self.companion.path)
+
+
+@dataclasses.dataclass(slots=True)
+class DatasetDescription(File):
+    name: str | None = None
+    bids_version: str | None = None
+
+
+@dataclasses.dataclass(slots=True)
+class Table(File):
+    """A tsv (participants, sessions, scans) along with the rows to load from it"""
+
+    rows: pl.DataFrame = dataclasses.field(default_factory=pl.DataFrame)
+
+
+@dataclasses.dataclass(slots=True)
+class Func(File):
+    events: pl.DataFrame | None = None
+
+
+@dataclasses.dataclass(slots=True)
+class Diffusion(File):
+    btable: pl.DataFrame | None = None
+
+
+@dataclasses.dataclass(slots=True)
+class FieldMap(File):
+    intended_for: list[str] = dataclasses.field(default_factory=list)
+
+
+@dataclasses.dataclass(slots=True)
+class Stats(File):
+    """A FreeSurfer .stats file, with its header measures and its table as rows of the tables they go in"""
+
+    measures: pl.DataFrame = dataclasses.field(default_factory=pl.DataFrame)
+    table: pl.DataFrame = dataclasses.field(default_factory=pl.DataFrame)
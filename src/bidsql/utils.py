@@ -1,10 +1,34 @@
+import functools
 import json
+import os
 import re
 import typing
+import zlib
+from collections import abc
 from pathlib import Path
 
+import numpy as np
 import polars as pl
-import sqlalchemy as sa
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
+
+try:
+    import xxhash  # type: ignore[import-not-found]
+except ImportError:
+    xxhash = None
+
+# sidecars are shared by several files (e.g., dwi.json by dwi.nii.gz, .bval and .bvec), so keep some decoded
+SIDECAR_CACHE_SIZE = 4096
+
+# how much of each end of a file a sampled fingerprint reads
+FINGERPRINT_SAMPLE_SIZE = 64 * 1024
+
+Fingerprint = typing.Literal["sample", "full"]
+
+FINGERPRINTS: tuple[Fingerprint, ...] = typing.get_args(Fingerprint)
 
 
 def parse_entity(src: str, entity: str) -> str | None:
@@ -16,50 +40,64 @@ def remove_niigz(src: Path) -> Path:
     return Path(str(src).removesuffix(".gz").removesuffix(".nii"))
 
 
+# extensions with more than one dot, which Path.suffix would cut short
+LONG_EXTENSIONS = (".nii.gz", ".surf.gii", ".dtseries.nii")
+MODALITY_DIRECTORIES = ("anat", "dwi", "fmap", "func", "figures")
+ENTITY_CACHE_SIZE = 65536
+
+# a key-value entity (e.g., sub-10001) is a part of the name between underscores with exactly one dash
+_ENTITY = re.compile(r"(?<![^_])([^_-]*)-([^_-]*)(?![^_])")
+
+
+def _name_extension(name: str) -> str:
+    for extension in LONG_EXTENSIONS:
+        if name.endswith(extension):
+            return extension
+    # otherwise, as Path.suffix
+    i = name.rfind(".")
+    return name[i:] if 0 < i < len(name) - 1 else ""
+
+
 def parse_extension(src: Path) -> str:
-    if src.name.endswith(".nii.gz"):
-        extension = ".nii.gz"
-    elif src.name.endswith(".surf.gii"):
-        extension = ".surf.gii"
-    elif src.name.endswith(".dtseries.nii"):
-        extension = ".dtseries.nii"
-    else:
-        extension = src.suffix
+    return _name_extension(src.name)
+
 
-    return extension
+@functools.lru_cache(maxsize=ENTITY_CACHE_SIZE)
+def _directory_modality(directory: str) -> str:
+    directory = f"{directory}/"
+    if "xfm" in directory:
+        return "xfm"
+    for modality in MODALITY_DIRECTORIES:
+        if f"/{modality}/" in directory:
+            return modality
+    return "file"
 
 
 def parse_modality(src: Path) -> str:
-    if "xfm" in str(src):
-        modality = "xfm"
-    elif "/anat/" in str(src):
-        modality = "anat"
-    elif "/dwi/" in str(src):
-        modality = "dwi"
-    elif "/fmap/" in str(src):
-        modality = "fmap"
-    elif "/func/" in str(src):
-        modality = "func"
-    elif "/figures/" in str(src):
-        modality = "figures"
-    else:
-        modality = "file"
-
-    return modality
+    directory, _, name = str(src).rpartition("/")
+    return "xfm" if "xfm" in name else _directory_modality(directory)
+
+
+@functools.lru_cache(maxsize=ENTITY_CACHE_SIZE)
+def _parse_name(name: str) -> tuple[str, str, tuple[tuple[str, str], ...]]:
+    extension = _name_extension(name)
+    _, _, last = name.rpartition("_")
+    return last.removesuffix(extension), extension, tuple(_ENTITY.findall(name, 0, len(name) - len(last)))
 
 
 # NOTE: this relies on a2cps-specific formatting
 def parse_entities(src: Path) -> dict[str, str]:
-    extension = parse_extension(src)
-    parts = src.name.split("_")
-    suffix = parts[-1].removesuffix(extension)
-    modality = parse_modality(src)
+    """Parse the suffix, extension, modality and key-value entities of src.
+
+    The entities come from one regex pass over the name. Results are memoized
+    by name and the modality by directory, but each call returns a new dict,
+    which callers are free to change.
+    """
+    directory, _, name = str(src).rpartition("/")
+    suffix, extension, pairs = _parse_name(name)
+    modality = "xfm" if "xfm" in name else _directory_modality(directory)
     entities = {"suffix": suffix, "extension": extension, "modality": modality}
-    for part in parts[:-1]:
-        split = part.split("-")
-        if len(split) == 2:
-            entities.update({split[0]: split[1]})
-
+    entities.update(pairs)
     return entities
 
 
@@ -71,22 +109,50 @@ def get_key_str(entities: dict[str, typing.Any], key: str) -> str:
     return value
 
 
-def get_meta_from_path(src: Path) -> dict[str, typing.Any] | sa.Null:
-    entities = parse_entities(src)
-    extension = entities.get("extension")
-    if not entities.get("extension") or not isinstance(extension, str):
+def read_json(src: Path) -> typing.Any:
+    """Decode src with orjson when it is installed, and the json module otherwise."""
+    if orjson is not None:
+        content = src.read_bytes()
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            # orjson is strict where json is not (e.g., NaN), so give json a chance
+            return json.loads(content)
+    return json.loads(src.read_text())
+
+
+# mtime is only there to be part of the cache key, so that a sidecar is read again after it changes
+@functools.lru_cache(maxsize=SIDECAR_CACHE_SIZE)
+def _read_sidecar(sidecar: Path, mtime: float) -> dict[str, typing.Any]:
+    meta: dict[str, typing.Any] = read_json(sidecar)
+    meta.pop("global", None)
+    return meta
+
+
+def get_meta_from_path(src: Path, extension: str | None = None) -> dict[str, typing.Any] | None:
+    """Read the json sidecar of src, if there is one.
+
+    Sidecars are cached on (path, mtime), so each is decoded once per process
+    even when several files share it. The dict returned is a (shallow) copy.
+    Pass the extension if it is already known, to skip parsing it again.
+    """
+    if extension is None:
+        extension = parse_entities(src).get("extension")
+    if not extension or not isinstance(extension, str):
         msg = f"Unable to parse extension in {src}, so unable to look for sidecar"
         raise RuntimeError(msg)
 
     sidecar = Path(str(src).replace(extension, ".json"))
 
     # need to consider case where this function was called on a sidecar
-    if (sidecar == src) or not sidecar.exists():
-        return sa.null()
+    if sidecar == src:
+        return None
+    try:
+        mtime = sidecar.stat().st_mtime
+    except FileNotFoundError:
+        return None
 
-    meta: dict[str, typing.Any] = json.loads(sidecar.read_text())
-    meta.pop("global", None)
-    return meta
+    return dict(_read_sidecar(sidecar, mtime))
 
 
 def get_ifor_from_niigz(niigz: Path) -> list[Path]:
@@ -101,3 +167,76 @@ def read_bids_tsv(src: Path) -> pl.DataFrame:
         df = df.with_columns(pl.col("sub").cast(pl.Utf8))
 
     return df
+
+
+def read_events(bold: Path) -> pl.DataFrame | None:
+    event_path = bold.parent / bold.name.replace("bold.nii.gz", "events.tsv")
+    if not event_path.exists():
+        return None
+
+    events = pl.read_csv(event_path, separator="\t")
+    # columns other than onset and duration go in extra, if there are any
+    if set(events.columns) - {"onset", "duration"}:
+        events = events.with_columns(pl.struct(pl.all().exclude(["onset", "duration"])).alias("extra"))
+        return events.select("onset", "duration", "extra")
+    return events.select("onset", "duration")
+
+
+def read_bvalbvec(dwi: Path) -> pl.DataFrame | None:
+    stem = remove_niigz(dwi)
+    bval_path = stem.with_suffix(".bval")
+    bvec_path = stem.with_suffix(".bvec")
+    if not (bval_path.exists() and bvec_path.exists()):
+        return None
+
+    # numpy converts all of the values at once (np.loadtxt is slower on files this small)
+    bvals = np.array(bval_path.read_text().split(), dtype=np.float64)
+    bvecs = np.array(bvec_path.read_text().split(), dtype=np.float64)
+    if bvecs.size != 3 * bvals.size:
+        msg = f"Expected 3 rows of {bvals.size} values in {bvec_path}, found {bvecs.size} values"
+        raise RuntimeError(msg)
+    bvecs = bvecs.reshape(3, bvals.size)
+    return pl.DataFrame({"b": bvals, "x": bvecs[0], "y": bvecs[1], "z": bvecs[2]}).with_row_index(name="tr")
+
+
+def pack_btable(btable: pl.DataFrame) -> bytes:
+    """The b, x, y and z columns of btable as little-endian float64, one volume after another"""
+    return btable.select("b", "x", "y", "z").to_numpy().astype("<f8", copy=False).tobytes()
+
+
+def unpack_btable(packed: bytes) -> pl.DataFrame:
+    """The inverse of pack_btable, with the same columns as read_bvalbvec"""
+    btable = np.frombuffer(packed, dtype="<f8").reshape(-1, 4)
+    return pl.DataFrame(btable, schema=["b", "x", "y", "z"]).with_row_index(name="tr")
+
+
+def fingerprint(src: str, how: Fingerprint = "sample") -> str:
+    """A hash of the size and content of src, prefixed with the name of the hash.
+
+    With how="sample", only the first and last FINGERPRINT_SAMPLE_SIZE bytes
+    are read (for a .nii.gz, the end holds the CRC and length of the data).
+    The hash is xxh3 when xxhash is installed, and crc32 otherwise. Fingerprints
+    from different hashes never compare equal.
+    """
+    with open(src, "rb") as f:
+        blocks = _fingerprint_blocks(f, os.fstat(f.fileno()).st_size, how)
+        if xxhash is not None:
+            hasher = xxhash.xxh3_64()
+            for block in blocks:
+                hasher.update(block)
+            return f"xxh3:{hasher.hexdigest()}"
+        crc = 0
+        for block in blocks:
+            crc = zlib.crc32(block, crc)
+        return f"crc32:{crc:08x}"
+
+
+def _fingerprint_blocks(f: typing.BinaryIO, size: int, how: Fingerprint) -> abc.Generator[bytes, None, None]:
+    yield size.to_bytes(8, "little")
+    if how == "full" or size <= 2 * FINGERPRINT_SAMPLE_SIZE:
+        while block := f.read(1024 * 1024):
+            yield block
+        return
+    yield f.read(FINGERPRINT_SAMPLE_SIZE)
+    f.seek(-FINGERPRINT_SAMPLE_SIZE, os.SEEK_END)
+    yield f.read(FINGERPRINT_SAMPLE_SIZE)
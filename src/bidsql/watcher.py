@@ -0,0 +1,214 @@
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import time
+import typing
+from collections import abc
+from pathlib import Path, PurePath
+
+from bidsql import crawler, mapping, profiles
+
+# from linux/inotify.h
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+# files are reported once written (or moved into place, or touched), not when created, so that a
+# large copy is not read halfway through. Creating a directory is reported, so it can be watched
+MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT = struct.Struct("iIII")
+
+
+class Overflow(Exception):
+    """The kernel dropped events, so what changed is no longer known."""
+
+
+class Inotify:
+    """A minimal binding of Linux inotify, through the C library.
+
+    Directories are watched one by one (inotify is not recursive), and each
+    event is reported as the path it is about and its mask.
+    """
+
+    def __init__(self) -> None:
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            msg = "inotify is only available on Linux"
+            raise RuntimeError(msg)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths: dict[int, str] = {}
+
+    def __enter__(self) -> typing.Self:
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+    def add(self, directory: str) -> None:
+        wd = self.libc.inotify_add_watch(
+            self.fd, os.fsencode(directory), MASK | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK
+        )
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                msg = f"Unable to watch {directory}; raise fs.inotify.max_user_watches (now {len(self.paths)} watches)"
+                raise RuntimeError(msg)
+            # the directory went away before it could be watched, which its parent's watch reports
+            logging.warning(f"Unable to watch {directory}: {os.strerror(error)}")
+            return
+        self.paths[wd] = directory
+
+    def add_tree(
+        self, root: str, include: abc.Callable[[str], bool] = lambda _: True
+    ) -> abc.Generator[str, None, None]:
+        """Watch root and the directories below it that are included, yielding the files in them.
+
+        Each directory is watched before it is listed, so a file added meanwhile
+        is either listed or reported.
+        """
+        pending = [root]
+        while pending:
+            directory = pending.pop()
+            self.add(directory)
+            try:
+                with os.scandir(directory) as it:
+                    for dirent in it:
+                        if dirent.is_dir(follow_symlinks=False):
+                            if include(dirent.path):
+                                pending.append(dirent.path)
+                        elif include(dirent.path):
+                            yield dirent.path
+            except (FileNotFoundError, NotADirectoryError, PermissionError) as e:
+                logging.warning(f"Unable to scan {directory}: {e}")
+
+    def read(self, timeout: float | None = None) -> list[tuple[str, int]]:
+        """The events that arrive within timeout seconds (None waits for the first), as paths and masks"""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        events: list[tuple[str, int]] = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, offset)
+                name = data[offset + EVENT.size : offset + EVENT.size + length].rstrip(b"\0")
+                offset += EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    raise Overflow
+                if mask & IN_IGNORED:
+                    # the directory was removed (or unmounted), and its watch with it
+                    self.paths.pop(wd, None)
+                elif (directory := self.paths.get(wd)) is not None:
+                    events.append((os.path.join(directory, os.fsdecode(name)), mask))
+
+
+def collect(inotify: Inotify, debounce: float, max_delay: float, include: abc.Callable[[str], bool]) -> set[str]:
+    """The included paths that change in the next batch of events.
+
+    Waits for an event, and then gathers events until none has arrived for
+    debounce seconds, or max_delay seconds have passed since the first, so that
+    a job that is being copied in is usually ingested in one go. New directories
+    are watched as they are reported, and the files already in them are
+    included as changed.
+    """
+    changed: set[str] = set()
+    start = None
+    while start is None or time.monotonic() - start < max_delay:
+        timeout = None if start is None else min(debounce, max_delay - (time.monotonic() - start))
+        events = inotify.read(timeout)
+        if not events and start is not None:
+            break
+        start = start or time.monotonic()
+        for path, mask in events:
+            if not include(path):
+                continue
+            changed.add(path)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                changed.update(inotify.add_tree(path, include=include))
+    return changed
+
+
+def in_jobs(root: Path, jobs: str | None = None) -> abc.Callable[[str], bool]:
+    """Whether a path under root is in (or on the way to) a directory that matches the glob jobs"""
+    if jobs is None:
+        return lambda _: True
+    patterns = PurePath(jobs).parts
+
+    def include(path: str) -> bool:
+        parts = PurePath(path).relative_to(root).parts
+        if not (n := min(len(parts), len(patterns))):
+            return True
+        return PurePath(*parts[:n]).match(str(PurePath(*patterns[:n])))
+
+    return include
+
+
+def watch(
+    mapper: mapping.Mapper, root: Path, jobs: str | None = None, debounce: float = 2.0, max_delay: float = 60.0
+) -> None:
+    """Run mapper, then ingest what changes under root as inotify reports it, until interrupted.
+
+    jobs is the glob (relative to root) that the mapper's roots came from, so
+    that new jobs are picked up and changes outside of jobs are ignored. When
+    it is None, root is the only job. Each batch of changes (see `collect`) goes
+    through Mapper.update, which also deletes what was removed. If events are
+    lost, the jobs are crawled again, as by `run`. Updates between crawls use
+    the "default" profile when mapper's is "ingest", whose EXCLUSIVE locking
+    would keep the database locked for the whole watch.
+
+    inotify only sees changes made through the kernel that it runs on, so on a
+    network filesystem, files written from other hosts are not reported.
+    """
+    root = root.absolute()
+    include = in_jobs(root, jobs)
+    with Inotify() as inotify:
+        # watches go in before the crawl, so anything that changes during it is reported afterwards
+        for _ in inotify.add_tree(str(root), include=include):
+            pass
+        logging.info(f"Watching {len(inotify.paths)} directories under {root}")
+        mapper.run()
+
+        # the engine is held for as long as the watch, so it must not lock the database the way "ingest" does
+        profile = "default" if mapper.profile == "ingest" else mapper.profile
+        engine = profiles.create_engine(mapper.db, profile=profile)
+        try:
+            while True:
+                try:
+                    changed = collect(inotify, debounce=debounce, max_delay=max_delay, include=include)
+                except Overflow:
+                    logging.warning("inotify dropped events; crawling again")
+                    # the crawl opens its own engine, which cannot get a lock while this one holds connections
+                    engine.dispose()
+                    # directories created meanwhile may have been missed too
+                    for _ in inotify.add_tree(str(root), include=include):
+                        pass
+                    job_roots = list(root.glob(jobs)) if jobs else [root]
+                    generators = [crawler.Walk(job) for job in job_roots]
+                    mapper.model_copy(update={"generators": generators, "roots": job_roots}).run()
+                    continue
+                if changed:
+                    logging.info(f"{len(changed)} paths changed")
+                    mapper.update(engine, changed)
+        finally:
+            engine.dispose()
@@ -0,0 +1,58 @@
+import logging
+import sys
+import typing
+import uuid
+from collections import abc
+from pathlib import Path
+
+import pydantic
+import pytest
+
+from bidsql import mapping
+
+# the synthetic tree of the benchmarks (see benchmarks/tree.py)
+sys.path.insert(0, str(Path(__file__).parents[1] / "benchmarks"))
+
+
+class SerialMapper(mapping.Mapper):
+    """Mapper that reads in this process, since a pool of workers is slower than the tiny trees of the tests"""
+
+    max_workers: int | None = 0
+
+
+@pytest.fixture(autouse=True)
+def serial_mapper(monkeypatch: pytest.MonkeyPatch) -> None:
+    # each CLI builds its own mapping.Mapper
+    monkeypatch.setattr(mapping, "Mapper", SerialMapper)
+
+
+@pytest.fixture
+def mapper_defaults(monkeypatch: pytest.MonkeyPatch, serial_mapper: None) -> abc.Callable[..., None]:
+    """Set the defaults of the Mapper that the CLIs build, e.g., mapper_defaults(ingest="bulk")"""
+
+    def set_defaults(**defaults: typing.Any) -> None:
+        fields: dict[str, typing.Any] = {
+            name: (mapping.Mapper.model_fields[name].annotation, value) for name, value in defaults.items()
+        }
+        monkeypatch.setattr(mapping, "Mapper", pydantic.create_model("Mapper", __base__=mapping.Mapper, **fields))
+
+    return set_defaults
+
+
+@pytest.fixture(scope="session")
+def postgres_server(tmp_path_factory: pytest.TempPathFactory):
+    """A throwaway PostgreSQL server, stopped at the end of the session. Skips when pgserver is not installed"""
+    pgserver = pytest.importorskip("pgserver")
+    pytest.importorskip("psycopg")
+    # pgserver logs again at exit, after pytest has closed the stream that the CLIs' basicConfig writes to
+    logging.getLogger("pgserver").propagate = False
+    with pgserver.get_server(tmp_path_factory.mktemp("postgres"), cleanup_mode="stop") as server:
+        yield server
+
+
+@pytest.fixture
+def postgres(postgres_server) -> str:
+    """The URL of a new, empty database on postgres_server"""
+    name = f"test_{uuid.uuid4().hex}"
+    postgres_server.psql(f"CREATE DATABASE {name};")
+    return postgres_server.get_uri(name).replace("postgresql://", "postgresql+psycopg://", 1)
@@ -0,0 +1,103 @@
+"""Runs of the Mapper over a tree that changes between them, and the links it makes after a crawl"""
+
+import os
+from pathlib import Path
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy import orm
+from tree import ROOTS, make_tree
+
+from bidsql import mapping, models, records
+from bidsql.cli import eddyqc
+
+
+def touch(path: Path, seconds: float = 10) -> None:
+    """Move the mtime of path and its directory forward, as a rewrite of the file does"""
+    for each in (path, path.parent):
+        mtime = each.stat().st_mtime + seconds
+        os.utime(each, (mtime, mtime))
+
+
+@pytest.mark.parametrize("ingest", ["orm", "bulk"])
+def test_rewrite_adds_companion_again(ingest: mapping.Ingest, tmp_path: Path, mapper_defaults) -> None:
+    # the qc.json of eddyqc is written along with its qc.pdf, which must go too before the json is written again
+    mapper_defaults(ingest=ingest)
+    root = tmp_path / "a2cps"
+    make_tree(root, 1)
+    db = f"sqlite:///{tmp_path / 'bidsql.sqlite'}"
+    eddyqc.main(root=root / ROOTS["eddyqc"], db=db)
+
+    qc = next(root.rglob("qc.json"))
+    qc.write_text('{"qc_mot_abs": 3.0}')
+    touch(qc)
+    eddyqc.main(root=root / ROOTS["eddyqc"], db=db)
+
+    engine = sa.create_engine(db)
+    with engine.connect() as connection:
+        extra = connection.scalar(sa.select(models.File.extra).where(models.File.path == str(qc)))
+        n_pdfs = connection.scalar(
+            sa.select(sa.func.count()).select_from(models.File).where(models.File.path == str(qc.with_suffix(".pdf")))
+        )
+    engine.dispose()
+    assert extra == {"qc_mot_abs": 3.0}
+    assert n_pdfs == 1
+
+
+def test_update_adds_companion_again(tmp_path: Path) -> None:
+    # as test_rewrite_adds_companion_again, for the paths that a watch reports
+    root = tmp_path / "a2cps"
+    make_tree(root, 1)
+    db = f"sqlite:///{tmp_path / 'bidsql.sqlite'}"
+    eddyqc.main(root=root / ROOTS["eddyqc"], db=db)
+
+    qc = next(root.rglob("qc.json"))
+    qc.write_text('{"qc_mot_abs": 3.0}')
+    touch(qc)
+    engine = sa.create_engine(db)
+    mapping.Mapper(maps=eddyqc.maps, generators=[], db=db).update(engine, [str(qc), str(qc.with_suffix(".pdf"))])
+
+    with engine.connect() as connection:
+        extra = connection.scalar(sa.select(models.File.extra).where(models.File.path == str(qc)))
+    engine.dispose()
+    assert extra == {"qc_mot_abs": 3.0}
+
+
+def test_fingerprint_looks_in_unchanged_directories(tmp_path: Path) -> None:
+    # a touch moves the mtime of the file but not of its directory, which pruning would skip
+    root = tmp_path / "a2cps"
+    make_tree(root, 1)
+    db = f"sqlite:///{tmp_path / 'bidsql.sqlite'}"
+    eddyqc.main(root=root / ROOTS["eddyqc"], db=db, fingerprint="sample")
+
+    qc = next(root.rglob("qc.json"))
+    mtime = qc.stat().st_mtime + 10
+    os.utime(qc, (mtime, mtime))
+    eddyqc.main(root=root / ROOTS["eddyqc"], db=db, fingerprint="sample")
+
+    engine = sa.create_engine(db)
+    with engine.connect() as connection:
+        recorded = connection.scalar(sa.select(models.File.mtime).where(models.File.path == str(qc)))
+    engine.dispose()
+    assert recorded == mtime
+
+
+def test_missing_fieldmap_targets_are_counted_per_dataset(caplog: pytest.LogCaptureFixture) -> None:
+    # the target of the fieldmap of a is only in b, so it is not linked, and so is missing
+    engine = sa.create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    with orm.Session(engine) as session:
+        a, b = models.Dataset(name="a", bids_version=None), models.Dataset(name="b", bids_version=None)
+        session.add_all([a, b])
+        session.flush()
+        loader = mapping.Loader(session, ingest="bulk")
+        loader.add_file(models.FieldMap, records.File(path="/a/fmap/epi.nii.gz", size=0, mtime=0), dataset=a)
+        loader.add_file(models.File, records.File(path="/b/func/bold.nii.gz", size=0, mtime=0), dataset=b)
+        loader.add(models.fieldmap_intended_for, {"fieldmap_path": "/a/fmap/epi.nii.gz", "basename": "bold.nii.gz"})
+        loader.flush()
+
+        mapping.link_fieldmaps(session)
+        n_links = session.scalar(sa.select(sa.func.count()).select_from(models.fieldmap_file_link))
+    engine.dispose()
+    assert n_links == 0
+    assert "1 fieldmap targets are not in the database" in caplog.text
@@ -0,0 +1,91 @@
+"""Ingest into PostgreSQL, where the writes go through mapping.CopyLoader, and compare with SQLite"""
+
+import importlib
+import json
+import uuid
+from pathlib import Path
+
+import pytest
+import sqlalchemy as sa
+from tree import ROOTS, make_tree
+
+from bidsql import models
+
+
+@pytest.fixture(scope="module")
+def tree(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    root = tmp_path_factory.mktemp("a2cps")
+    make_tree(root, 2)
+    return root
+
+
+def _normalize(value: object, datasets: dict[uuid.UUID, str]) -> object:
+    if isinstance(value, uuid.UUID):
+        return datasets[value]
+    if isinstance(value, float):
+        return round(value, 6)
+    if isinstance(value, dict | list):
+        return json.dumps(value, sort_keys=True)
+    return value
+
+
+def dump(db: str) -> dict[str, list[tuple]]:
+    """The rows of every table, sorted, with each dataset id replaced by the first path in the dataset"""
+    engine = sa.create_engine(db)
+    file = models.File.__table__
+    with engine.connect() as connection:
+        datasets = dict(
+            connection.execute(sa.select(file.c.dataset_id, sa.func.min(file.c.path)).group_by(file.c.dataset_id)).all()
+        )
+        tables = {
+            table.name: sorted(
+                (tuple(_normalize(value, datasets) for value in row) for row in connection.execute(sa.select(table))),
+                key=repr,
+            )
+            for table in models.Base.metadata.sorted_tables
+            # cleared once a run completes
+            if table is not models.Checkpoint.__table__
+        }
+    engine.dispose()
+    return tables
+
+
+def count_orphans(db: str) -> int:
+    """The files whose participant is not in their dataset"""
+    engine = sa.create_engine(db)
+    file = models.File.__table__
+    participant = models.Participant.__table__
+    orphaned = sa.select(sa.func.count()).where(
+        file.c.participant_id.is_not(None),
+        ~sa.exists().where(participant.c.id == file.c.participant_id, participant.c.dataset_id == file.c.dataset_id),
+    )
+    with engine.connect() as connection:
+        n_orphans = connection.execute(orphaned).scalar_one()
+    engine.dispose()
+    return n_orphans
+
+
+@pytest.mark.parametrize("name", list(ROOTS))
+def test_copy_matches_sqlite(name: str, tree: Path, postgres: str, tmp_path: Path) -> None:
+    cli = importlib.import_module(f"bidsql.cli.{name}")
+    sqlite = f"sqlite:///{tmp_path / 'bidsql.sqlite'}"
+    cli.main(root=tree / ROOTS[name], db=sqlite)
+    cli.main(root=tree / ROOTS[name], db=postgres)
+
+    expected = dump(sqlite)
+    assert expected["file"]
+    assert dump(postgres) == expected
+
+
+@pytest.mark.parametrize("name", ["freesurfer", "synthstrip"])
+def test_participant_per_dataset(name: str, postgres: str, tmp_path: Path) -> None:
+    # each session of the subject is a job, and so a dataset with its own participant
+    make_tree(tmp_path, 1)
+    importlib.import_module(f"bidsql.cli.{name}").main(root=tmp_path / ROOTS[name], db=postgres)
+
+    engine = sa.create_engine(postgres)
+    with engine.connect() as connection:
+        n_participants = connection.scalar(sa.select(sa.func.count()).select_from(models.Participant))
+    engine.dispose()
+    assert n_participants == 2
+    assert count_orphans(postgres) == 0
@@ -0,0 +1,25 @@
+"""The SQLite profiles of bidsql.profiles, through the CLIs that take them"""
+
+from pathlib import Path
+
+import sqlalchemy as sa
+from tree import ROOTS, make_tree
+
+from bidsql.cli import eddyqc
+
+
+def test_ingest_leaves_rollback_journal(tmp_path: Path) -> None:
+    # WAL is recorded in the database file, so the ingest profile has to undo it for every later connection
+    root = tmp_path / "a2cps"
+    make_tree(root, 1)
+    db = tmp_path / "bidsql.sqlite"
+    eddyqc.main(root=root / ROOTS["eddyqc"], db=f"sqlite:///{db}", profile="ingest")
+
+    engine = sa.create_engine(f"sqlite:///{db}")
+    with engine.connect() as connection:
+        journal_mode = connection.exec_driver_sql("PRAGMA journal_mode").scalar()
+        n_files = connection.exec_driver_sql("SELECT count(*) FROM file").scalar()
+    engine.dispose()
+    assert journal_mode == "delete"
+    assert n_files
+    assert not db.with_name(f"{db.name}-wal").exists()